@@ -0,0 +1,105 @@
+# Copyright (c) 2024, Frutter Software Labs Private Limited and contributors
+# For license information, please see license.txt
+
+"""Routing of eShipz calls over the accounts of eShipz Settings.
+
+Each account may be limited to a Company, a pickup Address and a list of
+carriers. A call goes through the accounts whose rules it matches with the
+most rules set, so a warehouse with an account of its own never spills onto
+the shared ones; among equally specific accounts the one with the fewest
+calls in flight relative to its budget is picked. Calls that no account
+matches use the API Token of eShipz Settings (account None).
+"""
+
+import random
+
+import frappe
+from frappe.utils import cint
+
+ACCOUNTS_CACHE_KEY = "eshipz_accounts"
+
+ROUTING_FIELDS = ("company", "pickup_address")
+
+
+def get_accounts():
+    """Enabled accounts and their routing rules, shared by all workers."""
+    return frappe.cache().get_value(ACCOUNTS_CACHE_KEY, generator=load_accounts)
+
+
+def load_accounts():
+    settings = frappe.get_single("eShipz Settings")
+    return [
+        {
+            "account_name": row.account_name,
+            "company": row.company,
+            "pickup_address": row.pickup_address,
+            "carriers": get_carriers(row.carriers),
+            "max_concurrency": cint(row.max_concurrency),
+        }
+        for row in settings.get("accounts")
+        if row.enabled
+    ]
+
+
+def get_carriers(carriers):
+    return [slug.strip() for slug in (carriers or "").replace(",", "\n").splitlines() if slug.strip()]
+
+
+def clear_accounts_cache():
+    frappe.cache().delete_value(ACCOUNTS_CACHE_KEY)
+
+
+def get_account(account_name):
+    for account in get_accounts():
+        if account["account_name"] == account_name:
+            return account
+
+
+def route(company=None, pickup_address=None, slug=None):
+    """Name of the account a call for these Shipment details goes through,
+    or None for the default API Token.
+
+    The carrier rule only applies when the carrier is known (bookings with
+    a selected service); rates and rule-based bookings match on the rest.
+    """
+    accounts = get_accounts()
+    if not accounts:
+        return None
+
+    values = {"company": company, "pickup_address": pickup_address}
+    candidates = []
+    for account in accounts:
+        if any(account[field] and account[field] != values[field] for field in ROUTING_FIELDS):
+            continue
+        if slug and account["carriers"] and slug not in account["carriers"]:
+            continue
+
+        specificity = sum(1 for field in ROUTING_FIELDS if account[field]) + bool(slug and account["carriers"])
+        candidates.append((specificity, account))
+
+    if not candidates:
+        return None
+
+    best = max(specificity for specificity, _account in candidates)
+    candidates = [account for specificity, account in candidates if specificity == best]
+    if len(candidates) == 1:
+        return candidates[0]["account_name"]
+
+    return get_least_loaded(candidates)
+
+
+def route_shipment(doc, slug=None):
+    return route(doc.pickup_company, doc.pickup_address_name, slug)
+
+
+def get_least_loaded(accounts):
+    # throttle reads the budgets of accounts from here
+    from eshipz import throttle
+
+    in_flight = throttle.get_account_load([account["account_name"] for account in accounts])
+    load = [
+        in_flight.get(account["account_name"], 0) / (account["max_concurrency"] or throttle.DEFAULT_MAX_CONCURRENCY)
+        for account in accounts
+    ]
+    lowest = min(load)
+    return random.choice([account for account, value in zip(accounts, load) if value == lowest])["account_name"]
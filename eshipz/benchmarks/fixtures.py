@@ -0,0 +1,190 @@
+# Copyright (c) 2024, Frutter Software Labs Private Limited and contributors
+# For license information, please see license.txt
+
+import random
+
+import frappe
+from frappe.utils import add_days, nowdate
+
+from eshipz.custom.shipment.master_data import ADDRESS_CACHE_KEY
+
+# Every record created here is named with this prefix so a run can be
+# removed again without touching real data.
+PREFIX = "ESHIPZ-BENCH"
+
+PICKUP_ADDRESSES = 3
+STATES = ("Karnataka", "Maharashtra", "Tamil Nadu", "Delhi", "Gujarat")
+UOMS = ("Nos", "Kg", "Box")
+
+FIXTURE_DOCTYPES = (
+    ("eShipz Tracking Checkpoint", "shipment"),
+    ("Shipment Parcel", "parent"),
+    ("Shipment Delivery Note", "parent"),
+    ("Shipment", "name"),
+    ("Delivery Note Item", "parent"),
+    ("Delivery Note", "name"),
+    ("Sales Invoice", "name"),
+    ("Dynamic Link", "parent"),
+    ("Address", "name"),
+)
+
+
+def make_fixtures(shipments, lines, delivery_notes_per_shipment=2, parcels=2):
+    """Create `shipments` submitted Shipments, each against
+    `delivery_notes_per_shipment` Delivery Notes of `lines` items, each billed
+    on its own Sales Invoice, with addresses spread over a few warehouses.
+
+    Records are written with `db_insert`: the benchmarks measure the eShipz
+    hot paths, not ERPNext's own validations, and large scales would take
+    far longer to build through `insert`.
+    """
+    company = frappe.defaults.get_global_default("company") or frappe.db.get_value("Company", {}, "name")
+    if not company:
+        frappe.throw("A Company is required to build the benchmark fixtures")
+
+    pickup_addresses = [make_address(f"{PREFIX}-PICKUP-{i:02d}", company, i) for i in range(PICKUP_ADDRESSES)]
+
+    names = []
+    for i in range(shipments):
+        delivery_address = make_address(f"{PREFIX}-ADDR-{i:06d}", company, PICKUP_ADDRESSES + i)
+
+        delivery_notes = []
+        for j in range(delivery_notes_per_shipment):
+            suffix = f"{i:06d}-{j:02d}"
+            invoice = make_sales_invoice(f"{PREFIX}-SINV-{suffix}", company)
+            delivery_notes.append(make_delivery_note(f"{PREFIX}-DN-{suffix}", company, invoice, lines))
+
+        names.append(
+            make_shipment(
+                f"{PREFIX}-SHIP-{i:06d}",
+                company,
+                pickup_addresses[i % PICKUP_ADDRESSES],
+                delivery_address,
+                delivery_notes,
+                parcels,
+            )
+        )
+
+    frappe.db.commit()
+    return names
+
+
+def make_address(name, company, index):
+    return insert(
+        {
+            "doctype": "Address",
+            "name": name,
+            "address_title": f"Benchmark Customer {index}",
+            "address_type": "Shipping",
+            "address_line1": f"{index} Benchmark Road",
+            "address_line2": "Industrial Area",
+            "city": "Bengaluru",
+            "state": STATES[index % len(STATES)],
+            # Distinct pincodes give every Shipment its own rate quote
+            "pincode": str(560000 + index),
+            "country": "India",
+            "phone": f"98{index:08d}",
+            "email_id": f"bench{index}@example.com",
+            "links": [{"link_doctype": "Company", "link_name": company}],
+        }
+    )
+
+
+def make_sales_invoice(name, company):
+    return insert(
+        {
+            "doctype": "Sales Invoice",
+            "name": name,
+            "company": company,
+            "customer": f"{PREFIX}-CUSTOMER",
+            "posting_date": nowdate(),
+            "due_date": add_days(nowdate(), 30),
+            "currency": "INR",
+            "grand_total": round(random.uniform(1000, 100000), 2),
+            "docstatus": 1,
+        }
+    )
+
+
+def make_delivery_note(name, company, invoice, lines):
+    return insert(
+        {
+            "doctype": "Delivery Note",
+            "name": name,
+            "company": company,
+            "customer": f"{PREFIX}-CUSTOMER",
+            "posting_date": nowdate(),
+            "currency": "INR",
+            "docstatus": 1,
+            "items": [
+                {
+                    "item_code": f"{PREFIX}-ITEM-{k % 50:03d}",
+                    "item_name": f"Benchmark Item {k % 50}",
+                    "uom": UOMS[k % len(UOMS)],
+                    "gst_hsn_code": f"8471{k % 10:02d}",
+                    "qty": random.randint(1, 20),
+                    "amount": round(random.uniform(100, 5000), 2),
+                    "against_sales_invoice": invoice,
+                }
+                for k in range(lines)
+            ],
+        }
+    )
+
+
+def make_shipment(name, company, pickup_address, delivery_address, delivery_notes, parcels):
+    return insert(
+        {
+            "doctype": "Shipment",
+            "name": name,
+            "pickup_from_type": "Company",
+            "pickup_company": company,
+            "pickup_address_name": pickup_address,
+            "pickup_contact_person": "Administrator",
+            "delivery_to_type": "Company",
+            "delivery_company": company,
+            "delivery_address_name": delivery_address,
+            "delivery_contact_name": "Benchmark Receiver",
+            "pickup_date": add_days(nowdate(), 1),
+            "value_of_goods": round(random.uniform(1000, 100000), 2),
+            "description_of_content": "Benchmark goods",
+            "shipment_type": "Goods",
+            "pallets": "No",
+            "fsl_purpose": "commercial",
+            "fsl_pickup_type": "business",
+            "fsl_delivery_type": "business",
+            "status": "Submitted",
+            "docstatus": 1,
+            "shipment_parcel": [
+                {
+                    "length": 30,
+                    "width": 20,
+                    "height": 10 + k,
+                    "weight": round(random.uniform(0.5, 25), 1),
+                    "count": 1,
+                }
+                for k in range(parcels)
+            ],
+            "shipment_delivery_note": [{"delivery_note": delivery_note} for delivery_note in delivery_notes],
+        }
+    )
+
+
+def insert(values):
+    doc = frappe.get_doc(values)
+    doc.set_parent_in_children()
+    doc.db_insert()
+    for child in doc.get_all_children():
+        child.db_insert()
+    return doc.name
+
+
+def delete_fixtures():
+    # Labels stored by the benchmarks are removed with their files on disk
+    for file_name in frappe.get_all("File", filters={"attached_to_name": ("like", f"{PREFIX}-%")}, pluck="name"):
+        frappe.delete_doc("File", file_name, ignore_permissions=True, force=True)
+
+    for doctype, field in FIXTURE_DOCTYPES:
+        frappe.db.delete(doctype, {field: ("like", f"{PREFIX}-%")})
+    frappe.db.commit()
+    frappe.cache().delete_value(ADDRESS_CACHE_KEY)
@@ -0,0 +1,242 @@
+# Copyright (c) 2024, Frutter Software Labs Private Limited and contributors
+# For license information, please see license.txt
+
+"""Benchmarks of the eShipz hot paths against a local stub of the API.
+
+    bench --site test_site execute eshipz.benchmarks.run.run \\
+        --kwargs "{'scales': [10, 100], 'lines': [10, 200], 'profile': 'typical'}"
+
+Each scale builds synthetic fixtures, calls the whitelisted methods the
+Shipment form uses and records latency percentiles, throughput and
+database queries per call. Results are written as JSON; pass the file of an
+earlier run as `baseline` to list the benchmarks that regressed.
+
+The fixtures are committed, so the site must allow tests (`allow_tests`).
+"""
+
+import json
+import statistics
+import time
+from contextlib import contextmanager
+
+import frappe
+from frappe.utils import now_datetime
+
+from eshipz import client
+from eshipz.benchmarks.fixtures import delete_fixtures, make_fixtures
+from eshipz.benchmarks.stub_server import StubServer
+from eshipz.custom.shipment import shipment, tracking
+from eshipz.custom.shipment.labels import store_label
+
+TRACKING_BATCH_SIZE = 50
+
+SELECTED_SERVICE = {
+    "slug": "bluedart",
+    "vendor_id": "vendor-0",
+    "description": "Bluedart Service 0",
+    "selected_service_type": "surface",
+}
+
+
+def run(scales=(10, 100), lines=(10, 200), profile="typical", output=None, baseline=None, tolerance=0.2, keep_fixtures=False):
+    if not frappe.conf.allow_tests:
+        frappe.throw("Benchmarks write fixtures to the database; set allow_tests in the site config to run them")
+
+    results = []
+    with StubServer(profile) as server, use_stub(server):
+        for shipments in scales:
+            for line_count in lines:
+                scale = {"shipments": shipments, "lines": line_count}
+                delete_fixtures()
+                docnames = make_fixtures(shipments, line_count)
+                try:
+                    results.extend(dict(scale, **result) for result in run_scale(docnames))
+                finally:
+                    if not keep_fixtures:
+                        delete_fixtures()
+
+        requests = server.requests
+
+    report = {
+        "site": frappe.local.site,
+        "started": str(now_datetime()),
+        "profile": dict(server.profile, name=profile),
+        "stub_requests": requests,
+        "results": results,
+        "regressions": compare(results, baseline, tolerance) if baseline else [],
+    }
+
+    output = output or frappe.get_site_path(f"eshipz-benchmark-{now_datetime():%Y%m%d-%H%M%S}.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=1, default=str)
+
+    return {"output": output, "regressions": report["regressions"]}
+
+
+def run_scale(docnames):
+    half = len(docnames) // 2
+    rows = frappe.get_all(
+        "Shipment Delivery Note", filters={"parent": ("in", docnames)}, fields=["parent", "delivery_note"]
+    )
+    delivery_notes = [row.delivery_note for row in rows]
+    delivery_notes_by_shipment = {}
+    for row in rows:
+        delivery_notes_by_shipment.setdefault(row.parent, []).append(row.delivery_note)
+    delivery_notes_by_shipment = [json.dumps(names) for names in delivery_notes_by_shipment.values()]
+
+    results = [
+        measure("fetch_available_services", shipment.fetch_available_services, docnames),
+        # Same Shipments again: served from the rate quote cache when enabled
+        measure("fetch_available_services (repeat)", shipment.fetch_available_services, docnames),
+        measure("get_delivery_note_items", shipment.get_delivery_note_items, delivery_notes),
+        measure("get_delivery_notes_items", shipment.get_delivery_notes_items, delivery_notes_by_shipment),
+    ]
+
+    with collect_labels() as labels:
+        service = json.dumps(SELECTED_SERVICE)
+        results.append(
+            measure("create_shipment", lambda docname: shipment.create_shipment(docname, service), docnames[:half])
+        )
+        results.append(measure("create_rule_based_shipment", shipment.create_rule_based_shipment, docnames[half:]))
+
+    results.append(measure("store_label", lambda args: store_label(*args), labels))
+
+    booked = frappe.get_all("Shipment", filters={"name": ("in", docnames), "awb_number": ("is", "set")}, pluck="name")
+    results.append(measure("update_status", shipment.update_status, booked))
+    # Second poll of the same AWBs only carries checkpoints already stored
+    results.append(measure("update_status (repeat)", shipment.update_status, booked))
+
+    tracked = frappe.get_all(
+        "Shipment", filters={"name": ("in", booked)}, fields=["name", "awb_number", "fsl_last_checkpoint_date", "fsl_eshipz_account"]
+    )
+    batches = [tracked[i : i + TRACKING_BATCH_SIZE] for i in range(0, len(tracked), TRACKING_BATCH_SIZE)]
+    results.append(measure(f"track_batch ({TRACKING_BATCH_SIZE} AWBs)", tracking.track_batch, batches))
+
+    return results
+
+
+def measure(name, method, calls):
+    timings = []
+    queries = []
+    errors = 0
+
+    started = time.perf_counter()
+    for args in calls:
+        with count_queries() as counter:
+            start = time.perf_counter()
+            try:
+                method(args)
+            except Exception:
+                errors += 1
+                frappe.db.rollback()
+            timings.append((time.perf_counter() - start) * 1000)
+        queries.append(counter["queries"])
+        frappe.clear_messages()
+    elapsed = time.perf_counter() - started
+
+    return {
+        "benchmark": name,
+        "calls": len(timings),
+        "errors": errors,
+        "throughput": len(timings) / elapsed if elapsed else 0,
+        **summarize(timings),
+        "queries_avg": statistics.fmean(queries) if queries else 0,
+        "queries_max": max(queries, default=0),
+    }
+
+
+def summarize(timings):
+    if not timings:
+        return {"mean_ms": None, "p50_ms": None, "p95_ms": None, "p99_ms": None, "max_ms": None}
+
+    ordered = sorted(timings)
+
+    def percentile(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    return {
+        "mean_ms": statistics.fmean(ordered),
+        "p50_ms": percentile(0.5),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "max_ms": ordered[-1],
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Benchmarks whose p95 latency or average query count grew by more than
+    `tolerance` over the same benchmark and scale in `baseline`."""
+    with open(baseline) as f:
+        previous = {
+            (row["benchmark"], row["shipments"], row["lines"]): row for row in json.load(f)["results"]
+        }
+
+    regressions = []
+    for row in results:
+        before = previous.get((row["benchmark"], row["shipments"], row["lines"]))
+        if not before:
+            continue
+        for metric in ("p95_ms", "queries_avg"):
+            if before[metric] and row[metric] and row[metric] > before[metric] * (1 + tolerance):
+                regressions.append(
+                    {
+                        "benchmark": row["benchmark"],
+                        "shipments": row["shipments"],
+                        "lines": row["lines"],
+                        "metric": metric,
+                        "baseline": before[metric],
+                        "current": row[metric],
+                    }
+                )
+
+    return regressions
+
+
+@contextmanager
+def count_queries():
+    """Count the SQL statements issued through `frappe.db.sql` in the block."""
+    db = frappe.local.db
+    sql = db.sql
+    counter = {"queries": 0}
+
+    def counted_sql(*args, **kwargs):
+        counter["queries"] += 1
+        return sql(*args, **kwargs)
+
+    db.sql = counted_sql
+    try:
+        yield counter
+    finally:
+        del db.sql
+
+
+@contextmanager
+def use_stub(server):
+    """Point the eShipz client at `server` for the duration of the block."""
+    conf = frappe.local.conf
+    base_url = conf.get("eshipz_base_url")
+    token_configured = bool(frappe.db.get_single_value("eShipz Settings", "api_token"))
+
+    conf.eshipz_base_url = server.url
+    if not token_configured:
+        frappe.cache().set_value(client.TOKEN_CACHE_KEY, "benchmark")
+    try:
+        yield
+    finally:
+        conf.eshipz_base_url = base_url
+        if not token_configured:
+            client.clear_api_token_cache()
+
+
+@contextmanager
+def collect_labels():
+    """Collect the labels the bookings would hand to background workers, so
+    downloading them is measured here while the stub is still up."""
+    labels = []
+    enqueue_label_download = shipment.enqueue_label_download
+
+    shipment.enqueue_label_download = lambda docname, label_url: labels.append((docname, label_url))
+    try:
+        yield labels
+    finally:
+        shipment.enqueue_label_download = enqueue_label_download
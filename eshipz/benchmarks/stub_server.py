@@ -0,0 +1,168 @@
+# Copyright (c) 2024, Frutter Software Labs Private Limited and contributors
+# For license information, please see license.txt
+
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Latency (ms), jitter (ms), share of 5xx answers and response sizes of the
+# stand-in for app.eshipz.com.
+PROFILES = {
+    "fast": {"latency": 20, "jitter": 5, "error_rate": 0, "services": 5, "checkpoints": 10},
+    "typical": {"latency": 250, "jitter": 100, "error_rate": 0.01, "services": 15, "checkpoints": 30},
+    "slow": {"latency": 1500, "jitter": 500, "error_rate": 0.05, "services": 30, "checkpoints": 80},
+    "large": {"latency": 250, "jitter": 100, "error_rate": 0, "services": 200, "checkpoints": 500},
+}
+
+CARRIERS = ("bluedart", "delhivery", "dtdc", "ecom-express", "xpressbees")
+TRACKING_DATE_FORMAT = "%a, %d %b %Y %H:%M:%S GMT"
+
+# Smallest valid one page PDF, served as the shipping label
+LABEL_PDF = (
+    b"%PDF-1.4\n1 0 obj<</Type/Catalog/Pages 2 0 R>>endobj\n"
+    b"2 0 obj<</Type/Pages/Kids[3 0 R]/Count 1>>endobj\n"
+    b"3 0 obj<</Type/Page/Parent 2 0 R/MediaBox[0 0 288 432]>>endobj\n"
+    b"trailer<</Root 1 0 R>>\n%%EOF\n"
+)
+
+
+class StubServer:
+    """A local HTTP stand-in for the eShipz API.
+
+    Answers the rates, booking, tracking and cancel endpoints and serves
+    labels, after sleeping for the profile's latency. A share of calls
+    (`error_rate`) fails with a 503, like an overloaded eShipz would.
+
+        with StubServer("typical") as server:
+            frappe.local.conf.eshipz_base_url = server.url
+    """
+
+    def __init__(self, profile="typical", **overrides):
+        self.profile = {**PROFILES[profile], **overrides}
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._get_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="eshipz-stub", daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _get_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                stub.respond(self, body)
+
+            def do_GET(self):
+                stub.respond(self, None)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def respond(self, handler, body):
+        with self._lock:
+            self.requests += 1
+
+        profile = self.profile
+        time.sleep(max(0, random.gauss(profile["latency"], profile["jitter"])) / 1000)
+
+        if random.random() < profile["error_rate"]:
+            return self.send(handler, 503, {"message": "Service Unavailable"})
+
+        path = handler.path.split("?", 1)[0]
+        if path == "/api/v2/services":
+            return self.send(handler, 200, {"data": {"rates": get_rates(profile["services"])}})
+        if path in ("/api/v1/create-shipments", "/api/v1/create-shipments/rule-based"):
+            return self.send(handler, 200, {"data": get_booking(body, self.url)})
+        if path == "/api/v2/trackings":
+            track_ids = body["track_id"] if isinstance(body["track_id"], list) else [body["track_id"]]
+            return self.send(handler, 200, [get_tracking(awb, profile["checkpoints"]) for awb in track_ids])
+        if path == "/api/v1/cancel":
+            return self.send(handler, 200, {"data": {"order_id": body.get("order_id")}})
+        if path.startswith("/labels/"):
+            return self.send(handler, 200, LABEL_PDF, content_type="application/pdf")
+
+        self.send(handler, 404, {"message": f"Unknown path {path}"})
+
+    @staticmethod
+    def send(handler, status, payload, content_type="application/json"):
+        content = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+        handler.send_response(status)
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Content-Length", str(len(content)))
+        handler.end_headers()
+        handler.wfile.write(content)
+
+
+def get_rates(count):
+    return [
+        {
+            "description": f"{CARRIERS[i % len(CARRIERS)].title()} Service {i}",
+            "slug": CARRIERS[i % len(CARRIERS)],
+            "vendor_id": f"vendor-{i}",
+            "technicality": [
+                {
+                    "service_type": service_type,
+                    "total_charge": round(random.uniform(40, 400), 2),
+                    "currency": "INR",
+                    "tat": random.randint(1, 7),
+                }
+                for service_type in ("surface", "express")
+            ],
+        }
+        for i in range(count)
+    ]
+
+
+def get_booking(body, base_url):
+    awb = "BENCH" + "".join(random.choices("0123456789", k=10))
+    return {
+        "files": {"label": {"label_meta": {"url": f"{base_url}/labels/{awb}.pdf", "awb": awb}}},
+        "slug": (body or {}).get("slug") or CARRIERS[0],
+        "status": "Booked",
+        "service_type": (body or {}).get("service_type") or "surface",
+        "order_id": "".join(random.choices("0123456789abcdef", k=24)),
+    }
+
+
+def get_tracking(awb, count):
+    start = datetime.utcnow() - timedelta(days=3)
+    step = timedelta(days=3) / max(count, 1)
+    checkpoints = [
+        {
+            "date": (start + step * i).strftime(TRACKING_DATE_FORMAT),
+            "tag": "InTransit",
+            "subtag": "InTransit_001",
+            "city": f"Hub {i % 20}",
+            "state": "Karnataka",
+            "remark": f"Shipment reached hub {i % 20}",
+        }
+        for i in range(count)
+    ]
+    return {
+        "awb": awb,
+        "tag": "InTransit",
+        "shipment_status": "InTransit",
+        "expected_delivery_date": (datetime.utcnow() + timedelta(days=2)).strftime(TRACKING_DATE_FORMAT),
+        "delivery_date": None,
+        "checkpoints": checkpoints,
+    }
@@ -0,0 +1,81 @@
+# Copyright (c) 2024, Frutter Software Labs Private Limited and contributors
+# For license information, please see license.txt
+
+"""Circuit breakers for eShipz endpoints, shared by every worker of the site.
+
+After `threshold` consecutive failures a circuit opens and calls fail fast
+for `cooldown` seconds. Then a single probe call is let through (half-open):
+its success closes the circuit again, its failure re-opens it. Rate limiting
+(HTTP 429) is not a failure; `eshipz.throttle` deals with it.
+"""
+
+import time
+
+import frappe
+
+from eshipz import client
+
+FAILURES_KEY = "eshipz_breaker_failures:"
+OPEN_UNTIL_KEY = "eshipz_breaker_open_until:"
+PROBE_KEY = "eshipz_breaker_probe:"
+
+# A probe that never reports back (killed worker) frees its slot after this;
+# it outlives the longest call, retries included, so probes never overlap
+PROBE_TTL = client.MAX_CALL_DURATION + 15
+
+
+def allow(name, threshold):
+    """Whether a call may be sent through the circuit `name`."""
+    if not threshold:
+        return True
+
+    cache = frappe.cache()
+    try:
+        open_until = float(cache.get(cache.make_key(OPEN_UNTIL_KEY + name)) or 0)
+        if not open_until:
+            return True
+        if time.time() < open_until:
+            return False
+        return bool(cache.set(cache.make_key(PROBE_KEY + name), 1, nx=True, ex=PROBE_TTL))
+    except Exception:
+        return True
+
+
+def retry_in(name):
+    """Seconds until an open circuit lets a probe through."""
+    cache = frappe.cache()
+    open_until = float(cache.get(cache.make_key(OPEN_UNTIL_KEY + name)) or 0)
+    return max(0, int(open_until - time.time()))
+
+
+def record_success(name):
+    cache = frappe.cache()
+    try:
+        cache.delete(*(cache.make_key(key + name) for key in (FAILURES_KEY, OPEN_UNTIL_KEY, PROBE_KEY)))
+    except Exception:
+        pass
+
+
+def release_probe(name):
+    """Let another probe through after one that neither failed nor succeeded."""
+    cache = frappe.cache()
+    try:
+        cache.delete(cache.make_key(PROBE_KEY + name))
+    except Exception:
+        pass
+
+
+def record_failure(name, threshold, cooldown):
+    if not threshold:
+        return
+
+    cache = frappe.cache()
+    try:
+        failures = cache.incr(cache.make_key(FAILURES_KEY + name))
+        if failures >= threshold:
+            pipe = cache.pipeline()
+            pipe.set(cache.make_key(OPEN_UNTIL_KEY + name), time.time() + cooldown)
+            pipe.delete(cache.make_key(PROBE_KEY + name))
+            pipe.execute()
+    except Exception:
+        pass
@@ -0,0 +1,306 @@
+# Copyright (c) 2024, Frutter Software Labs Private Limited and contributors
+# For license information, please see license.txt
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import frappe
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from eshipz import accounts, metrics, throttle
+
+BASE_URL = "https://app.eshipz.com"
+
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 60
+
+POOL_SIZE = 10
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 0.5
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+MAX_RETRY_AFTER = 30
+
+# Longest a call can take with its retries
+MAX_CALL_DURATION = MAX_RETRIES * (CONNECT_TIMEOUT + READ_TIMEOUT)
+
+TOKEN_CACHE_KEY = "eshipz_api_token"
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+# (site, account) -> (eShipz Settings version, token), see get_account_token
+_account_tokens = {}
+
+
+def get_session():
+    """Return the keep-alive session of this worker process.
+
+    The session is rebuilt after a fork so that gunicorn / RQ workers never
+    share pooled sockets with their parent.
+    """
+    global _session, _session_pid
+
+    pid = os.getpid()
+    if _session is not None and _session_pid == pid:
+        return _session
+
+    with _session_lock:
+        if _session is None or _session_pid != pid:
+            pool_size = frappe.conf.get("eshipz_pool_size") or POOL_SIZE
+            # Only connection errors are retried here; the request has not
+            # reached eShipz yet, so this is safe for every endpoint.
+            adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=pool_size,
+                max_retries=Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.3),
+            )
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update({"Content-Type": "application/json"})
+            _session = session
+            _session_pid = pid
+
+    return _session
+
+
+def get_base_url():
+    """eShipz API root; `eshipz_base_url` in site config points the app at
+    a sandbox or at the local stub used by the benchmarks."""
+    return (frappe.conf.get("eshipz_base_url") or BASE_URL).rstrip("/")
+
+
+def get_api_token(account=None):
+    """API token of the eShipz `account`, or of eShipz Settings."""
+    if account:
+        return get_account_token(account)
+
+    token = frappe.cache().get_value(TOKEN_CACHE_KEY)
+    if token:
+        return token
+
+    token = frappe.db.get_single_value("eShipz Settings", "api_token")
+    if not token:
+        frappe.throw("API token not found in eShipz Settings")
+
+    frappe.cache().set_value(TOKEN_CACHE_KEY, token)
+    return token
+
+
+def get_account_token(account):
+    """Decrypted API token of the eShipz `account`.
+
+    Account tokens are Password fields, so they are kept in the memory of
+    this process rather than in Redis, tagged with the version of eShipz
+    Settings they were read from. Saving the Settings, which is how
+    accounts are added, changed or removed, retires them in every worker.
+    """
+    settings = frappe.get_cached_doc("eShipz Settings")
+    version = str(settings.modified)
+    key = (frappe.local.site, account)
+    cached = _account_tokens.get(key)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    row = next((row for row in settings.accounts if row.account_name == account), None)
+    token = row and row.get_password("api_token", raise_exception=False)
+    if not token:
+        _account_tokens.pop(key, None)
+        frappe.throw(f"API token not found for eShipz account {account}")
+
+    _account_tokens[key] = (version, token)
+    return token
+
+
+def clear_api_token_cache():
+    frappe.cache().delete_value(TOKEN_CACHE_KEY)
+    site = frappe.local.site
+    for key in [key for key in _account_tokens if key[0] == site]:
+        _account_tokens.pop(key, None)
+
+
+class eShipzUnavailableError(frappe.ValidationError):
+    """eShipz could not be reached or failed to answer (timeouts, 5xx)."""
+
+
+class eShipzRateLimitError(eShipzUnavailableError):
+    pass
+
+
+def post(path, data=None, json=None, idempotent=False, timeout=None, slug=None, stream=False, account=None):
+    """POST to an eShipz API path through the shared session.
+
+    `idempotent` calls (rates, tracking) are retried with exponential backoff
+    on timeouts and on 429/5xx responses. Bookings and cancellations are only
+    retried on 429, which eShipz sends before processing the request, so a
+    slow response never turns into a duplicate shipment.
+    Every attempt is paced by the cluster-wide limits of `eshipz.throttle`,
+    and every call is timed and counted per endpoint and carrier `slug`.
+    With `stream` the body of a successful response is left unread for the
+    caller to parse incrementally, and is not logged.
+    The call is made with the token of the eShipz `account` (see
+    `eshipz.accounts`), or of eShipz Settings.
+    """
+    url = get_base_url() + path
+    headers = {"X-API-TOKEN": get_api_token(account)}
+    timeout = timeout or (CONNECT_TIMEOUT, READ_TIMEOUT)
+    call = Call(path, data or json, idempotent=idempotent, slug=slug, account=account)
+
+    while True:
+        call.begin()
+        try:
+            response = get_session().post(url, headers=headers, data=data, json=json, timeout=timeout, stream=stream)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            delay = call.failed(e)
+        else:
+            delay = call.answered(response.status_code, response.headers)
+            if delay is None:
+                call.finish(response.status_code, None if stream and response.ok else response.text)
+                return response
+            response.close()
+
+        time.sleep(delay)
+
+
+class Call:
+    """The attempts of one eShipz call: pacing by `eshipz.throttle`, the
+    retry policy and the metrics, shared by `post` and the asyncio rate
+    fan-out (which runs `begin`, `answered` and `finish`, all Redis bound,
+    off its event loop)."""
+
+    def __init__(self, path, request, idempotent=False, slug=None, account=None):
+        self.path = path
+        self.request = request
+        self.idempotent = idempotent
+        self.slug = slug
+        self.account = account
+        self.family = throttle.get_family(path)
+        self.start = time.perf_counter()
+        self.attempt = 0
+        self.lease = None
+        self.sent = None
+
+    @property
+    def last_attempt(self):
+        return self.attempt == MAX_RETRIES
+
+    def begin(self):
+        """Wait for a lease for the next attempt."""
+        self.attempt += 1
+        self.lease = throttle.acquire(self.family, self.account)
+        self.sent = time.perf_counter()
+
+    def failed(self, error):
+        """The attempt timed out or could not connect: the backoff before
+        the next one, or raise once no attempt is left."""
+        throttle.release(self.family, self.lease, 0, time.perf_counter() - self.sent, self.account)
+        if self.last_attempt or not self.idempotent:
+            self.record(0, str(error))
+            frappe.throw("Could not reach eShipz: " + str(error), exc=eShipzUnavailableError)
+        return BACKOFF_FACTOR * (2 ** (self.attempt - 1))
+
+    def answered(self, status_code, headers):
+        """eShipz answered the attempt: the backoff before retrying it, or
+        None when the response is final and goes to `finish`."""
+        throttle.release(self.family, self.lease, status_code, time.perf_counter() - self.sent, self.account)
+        retry = status_code == 429 or (self.idempotent and status_code in RETRY_STATUSES)
+        if not retry or self.last_attempt:
+            return None
+        return get_retry_delay(headers, self.attempt - 1)
+
+    def finish(self, status_code, body):
+        """Record the final response; a final 429 raises eShipzRateLimitError."""
+        self.record(status_code, body)
+        if status_code == 429:
+            frappe.throw(
+                "eShipz is rate limiting requests, please try again shortly",
+                exc=eShipzRateLimitError,
+                title="eShipz Rate Limit",
+            )
+
+    def record(self, status_code, response):
+        record_call(self.path, status_code, self.start, self.slug, self.attempt, self.request, response)
+
+
+def get_retry_delay(headers, attempt):
+    """Backoff before the next attempt, honouring eShipz's Retry-After."""
+    retry_after = headers.get("Retry-After")
+    if retry_after and retry_after.isdigit():
+        return min(int(retry_after), MAX_RETRY_AFTER)
+    return BACKOFF_FACTOR * (2**attempt)
+
+
+def record_call(path, status_code, start, slug, attempts, request, response):
+    duration = (time.perf_counter() - start) * 1000
+    metrics.add_http_time(duration)
+    metrics.record_call(path, status_code, duration, slug, attempts, request, response)
+
+
+def download(url, timeout=None):
+    """GET a file published by eShipz (e.g. a shipping label) and return its
+    content, retrying like the other idempotent calls."""
+    timeout = timeout or (CONNECT_TIMEOUT, READ_TIMEOUT)
+
+    for attempt in range(MAX_RETRIES):
+        last_attempt = attempt == MAX_RETRIES - 1
+        try:
+            response = get_session().get(url, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if last_attempt:
+                frappe.throw("Could not reach eShipz: " + str(e))
+        else:
+            if response.status_code not in RETRY_STATUSES or last_attempt:
+                if response.status_code != 200:
+                    frappe.throw(f"Failed to download {url}: {response.status_code}")
+                return response.content
+
+        time.sleep(BACKOFF_FACTOR * (2**attempt))
+
+
+def get_executor(max_workers):
+    """Thread pool for fanning out eShipz calls from a request or job.
+
+    Each task runs in a frappe context for the current site (config, cache,
+    message log), set up when it starts and destroyed when it ends, but with
+    no database connection, so the work submitted must only talk HTTP; all
+    reads and writes stay on the calling thread.
+    """
+    # Resolve the tokens and settings on the calling thread so that workers
+    # only ever read them from the cache.
+    frappe.get_cached_doc("eShipz Settings")
+    account_list = accounts.get_accounts()
+    if not account_list or frappe.db.get_single_value("eShipz Settings", "api_token"):
+        get_api_token()
+    for account in account_list:
+        get_api_token(account["account_name"])
+    get_session()
+
+    return SiteThreadPoolExecutor(
+        frappe.local.site,
+        frappe.local.sites_path,
+        max_workers=max_workers,
+        thread_name_prefix="eshipz",
+    )
+
+
+class SiteThreadPoolExecutor(ThreadPoolExecutor):
+    def __init__(self, site, sites_path, **kwargs):
+        super().__init__(**kwargs)
+        self.site = site
+        self.sites_path = sites_path
+
+    def submit(self, fn, /, *args, **kwargs):
+        return super().submit(_run_in_site, self.site, self.sites_path, fn, *args, **kwargs)
+
+
+def _run_in_site(site, sites_path, fn, *args, **kwargs):
+    frappe.init(site=site, sites_path=sites_path)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        frappe.destroy()
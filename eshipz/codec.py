@@ -0,0 +1,99 @@
+# Copyright (c) 2024, Frutter Software Labs Private Limited and contributors
+# For license information, please see license.txt
+
+"""JSON codec for eShipz request bodies and responses.
+
+orjson, a dependency of the app, serializes a booking payload several times
+faster than the standard library and returns bytes that go on the wire as
+they are. Where it is missing the standard library produces the same compact
+JSON.
+Payload models (`eshipz.custom.shipment.models`) are encoded through their
+`to_json`, which leaves out unset optional fields.
+
+Large array responses are decoded incrementally with ijson, also a
+dependency (`iter_array`), so only one element is held in memory at a time.
+"""
+
+import dataclasses
+import datetime
+import decimal
+import json
+import warnings
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# Events that complete an element of the top-level array
+ELEMENT_END_EVENTS = frozenset(("end_map", "end_array", "string", "number", "boolean", "null"))
+
+
+def default(obj):
+    if dataclasses.is_dataclass(obj):
+        return obj.to_json()
+    if isinstance(obj, (datetime.date, datetime.time)):
+        return str(obj)
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+if orjson:
+
+    def dumps(obj):
+        """Compact JSON of `obj` as bytes."""
+        return orjson.dumps(obj, default=default, option=orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_PASSTHROUGH_DATETIME)
+
+    def loads(data):
+        return orjson.loads(data)
+
+else:
+
+    def dumps(obj):
+        """Compact JSON of `obj` as bytes."""
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False, default=default).encode()
+
+    def loads(data):
+        return json.loads(data)
+
+
+# Both implementations raise this (orjson's error subclasses it)
+DecodeError = json.JSONDecodeError
+
+
+def iter_array(stream):
+    """Yield the elements of the JSON array read from the binary file-like
+    `stream`, each decoded as soon as it is complete. Raises ValueError when
+    the body is not a JSON array."""
+    if ijson is None:
+        warnings.warn("ijson is not installed, reading the whole JSON body into memory", RuntimeWarning)
+        result = loads(stream.read())
+        if not isinstance(result, list):
+            raise ValueError("JSON body is not an array")
+        yield from result
+        return
+
+    try:
+        events = ijson.parse(stream, use_float=True)
+        _prefix, event, _value = next(events, ("", None, None))
+        if event != "start_array":
+            raise ValueError("JSON body is not an array")
+
+        builder = None
+        for prefix, event, value in events:
+            if not prefix:
+                return
+            if builder is None:
+                builder = ijson.ObjectBuilder()
+            builder.event(event, value)
+            if prefix == "item" and event in ELEMENT_END_EVENTS:
+                yield builder.value
+                builder = None
+    except ijson.JSONError as e:
+        raise ValueError(f"Invalid JSON body: {e}") from e
@@ -0,0 +1,241 @@
+# Copyright (c) 2024, Frutter Software Labs Private Limited and contributors
+# For license information, please see license.txt
+
+from concurrent.futures import as_completed
+
+import frappe
+from frappe.utils import cint
+
+from eshipz import accounts, client
+from eshipz.custom.shipment.rate_cache import get_rates
+from eshipz.custom.shipment.rate_shopping import select_service
+from eshipz.custom.shipment.shipment import (
+    CANCELLED_VALUES,
+    cancel_orders,
+    dump_payload,
+    get_booking_result,
+    get_booking_values,
+    get_rates_payload,
+    get_shipment_payload,
+)
+from eshipz.custom.shipment.labels import enqueue_label_download
+from eshipz.custom.shipment.webhook import forget_awb
+from eshipz.custom.shipment.writeback import ShipmentWriter
+
+WRITE_BATCH_SIZE = 50
+
+
+@frappe.whitelist()
+def bulk_create_shipments(docnames, selected_service=None, auto_select=0):
+    """Queue the booking of many Shipments: all with `selected_service`,
+    each with the service the selection policy picks from its own rates
+    (`auto_select`), or rule based."""
+    docnames = frappe.parse_json(docnames)
+    auto_select = cint(auto_select)
+    if selected_service and not auto_select:
+        selected_service = frappe.parse_json(selected_service)
+    else:
+        selected_service = None
+
+    if not frappe.db.get_single_value("eShipz Settings", "enabled"):
+        frappe.throw("eShipz is not enabled in eShipz Settings")
+
+    for docname in docnames:
+        frappe.has_permission("Shipment", "write", docname, throw=True)
+
+    job = frappe.enqueue(
+        "eshipz.custom.shipment.bulk.process_bulk_booking",
+        queue="long",
+        timeout=3600,
+        docnames=docnames,
+        selected_service=selected_service,
+        auto_select=auto_select,
+    )
+    return job.id
+
+
+def process_bulk_booking(docnames, selected_service=None, auto_select=0):
+    path = "/api/v1/create-shipments" if selected_service or auto_select else "/api/v1/create-shipments/rule-based"
+    settings = frappe.get_cached_doc("eShipz Settings")
+    concurrency = settings.bulk_booking_concurrency or 4
+
+    results = {}
+    payloads = {}
+    rates_payloads = {}
+    # Company and pickup Address, to route each call to an eShipz account
+    routes = {}
+    for docname in docnames:
+        try:
+            doc = frappe.get_doc("Shipment", docname)
+            if doc.docstatus != 1 or doc.awb_number:
+                frappe.throw(f"Shipment {docname} is not a submitted, unbooked Shipment")
+            routes[docname] = (doc.pickup_company, doc.pickup_address_name)
+            if auto_select:
+                # Completed with the selected service once rates are in
+                payloads[docname] = get_shipment_payload(doc)
+                rates_payloads[docname] = get_rates_payload(doc)
+            else:
+                payloads[docname] = dump_payload(get_shipment_payload(doc, selected_service))
+        except Exception as e:
+            results[docname] = {"success": False, "error": str(e)}
+        frappe.clear_messages()
+
+    total = len(docnames)
+    writer = ShipmentWriter()
+
+    with client.get_executor(concurrency) as executor:
+        if auto_select:
+            futures = {
+                executor.submit(quote_and_book, path, data, rates_payloads[docname], settings, routes[docname]): docname
+                for docname, data in payloads.items()
+            }
+        else:
+            slug = selected_service["slug"] if selected_service else None
+            futures = {
+                executor.submit(book, path, data, slug, accounts.route(*routes[docname], slug)): docname
+                for docname, data in payloads.items()
+            }
+
+        for future in as_completed(futures):
+            docname = futures[future]
+            try:
+                booking = future.result()
+            except Exception as e:
+                results[docname] = {"success": False, "error": str(e)}
+            else:
+                results[docname] = {"success": True, **booking.as_dict()}
+                writer.set(docname, get_booking_values(booking))
+                enqueue_label_download(docname, booking.label_url)
+
+            if len(writer) >= WRITE_BATCH_SIZE:
+                writer.flush()
+
+            frappe.publish_progress(
+                len(results) * 100 / total,
+                title="Booking Shipments",
+                description=f"{len(results)} of {total}",
+            )
+
+    writer.flush()
+
+    frappe.publish_realtime("eshipz_bulk_booking", results, user=frappe.session.user)
+    return results
+
+
+def book(path, data, slug=None, account=None):
+    return get_booking_result(client.post(path, data=data, slug=slug, account=account), account)
+
+
+def quote_and_book(path, data, rates_data, settings, route):
+    service = select_service(get_rates(rates_data, accounts.route(*route)), settings)
+    return book(path, dump_payload(data.use_service(service)), service["slug"], accounts.route(*route, service["slug"]))
+
+
+@frappe.whitelist()
+def bulk_cancel_shipments(docnames):
+    """Queue the cancellation of many booked Shipments."""
+    docnames = frappe.parse_json(docnames)
+
+    if not frappe.db.get_single_value("eShipz Settings", "enabled"):
+        frappe.throw("eShipz is not enabled in eShipz Settings")
+
+    for docname in docnames:
+        frappe.has_permission("Shipment", "write", docname, throw=True)
+
+    job = frappe.enqueue(
+        "eshipz.custom.shipment.bulk.process_bulk_cancel",
+        queue="long",
+        timeout=3600,
+        docnames=docnames,
+    )
+    return job.id
+
+
+def process_bulk_cancel(docnames):
+    """Cancel Shipments with `cancel_batch_size` order ids per eShipz call,
+    then reset every cancelled Shipment in one write."""
+    settings = frappe.get_cached_doc("eShipz Settings")
+    batch_size = settings.cancel_batch_size or 50
+    concurrency = settings.cancel_concurrency or 4
+
+    results = {docname: {"success": False, "error": f"Shipment {docname} not found"} for docname in docnames}
+    shipments = {}
+    for shipment in frappe.get_all(
+        "Shipment",
+        filters={"name": ("in", docnames)},
+        fields=["name", "docstatus", "status", "shipment_id", "awb_number", "fsl_eshipz_account"],
+    ):
+        if shipment.docstatus != 1 or not shipment.shipment_id or shipment.status == "Cancelled":
+            results[shipment.name] = {"success": False, "error": f"Shipment {shipment.name} is not a booked Shipment"}
+        else:
+            shipments[shipment.shipment_id] = shipment
+
+    # Orders are cancelled with the eShipz account that booked them
+    by_account = {}
+    for order_id, shipment in shipments.items():
+        by_account.setdefault(shipment.fsl_eshipz_account or None, []).append(order_id)
+    batches = [
+        (account, order_ids[i : i + batch_size])
+        for account, order_ids in by_account.items()
+        for i in range(0, len(order_ids), batch_size)
+    ]
+    writer = ShipmentWriter()
+    done = 0
+
+    with client.get_executor(concurrency) as executor:
+        futures = {executor.submit(cancel_batch, batch, account): batch for account, batch in batches}
+
+        for future in as_completed(futures):
+            batch = futures[future]
+            try:
+                errors = future.result()
+            except Exception as e:
+                errors = dict.fromkeys(batch, str(e))
+
+            for order_id in batch:
+                shipment = shipments[order_id]
+                if order_id in errors:
+                    results[shipment.name] = {"success": False, "error": errors[order_id]}
+                else:
+                    results[shipment.name] = {"success": True}
+                    writer.set(shipment.name, CANCELLED_VALUES)
+
+            done += len(batch)
+            frappe.publish_progress(
+                done * 100 / len(shipments),
+                title="Cancelling Shipments",
+                description=f"{done} of {len(shipments)}",
+            )
+
+    # Identical values: one UPDATE for all cancelled Shipments
+    writer.flush()
+    for shipment in shipments.values():
+        if results[shipment.name]["success"]:
+            forget_awb(shipment.awb_number)
+
+    frappe.publish_realtime("eshipz_bulk_cancel", results, user=frappe.session.user)
+    return results
+
+
+def cancel_batch(order_ids, account=None):
+    """Cancel `order_ids` in one call. When eShipz rejects the whole batch,
+    e.g. for one order it cannot cancel, each order is retried on its own
+    so the others still go through."""
+    try:
+        return cancel_orders(order_ids, account=account)
+    except client.eShipzUnavailableError:
+        raise
+    except frappe.ValidationError:
+        if len(order_ids) == 1:
+            raise
+
+    frappe.clear_messages()
+    errors = {}
+    for order_id in order_ids:
+        try:
+            errors.update(cancel_orders([order_id], account=account))
+        except client.eShipzUnavailableError:
+            raise
+        except frappe.ValidationError as e:
+            errors[order_id] = str(e)
+    return errors
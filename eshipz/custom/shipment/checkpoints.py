@@ -0,0 +1,84 @@
+# Copyright (c) 2024, Frutter Software Labs Private Limited and contributors
+# For license information, please see license.txt
+
+import hashlib
+from datetime import datetime
+from functools import lru_cache
+
+import frappe
+from frappe.utils import convert_utc_to_system_timezone, get_datetime, now
+
+CHECKPOINT_FIELDS = (
+    "name", "creation", "modified", "owner", "modified_by",
+    "shipment", "awb_number", "checkpoint_date", "tag", "subtag", "city", "state", "remark",
+)
+
+
+@lru_cache(maxsize=8192)
+def parse_tracking_date(value):
+    return datetime.strptime(value, "%a, %d %b %Y %H:%M:%S %Z")
+
+
+def get_new_checkpoints(checkpoints, watermark=None):
+    """Return the latest checkpoint with its date and the checkpoints not
+    older than `watermark`, in one pass over the list.
+
+    Checkpoints dated at the watermark are kept: a new one can share the
+    timestamp of the last stored one, and repeats of stored ones are skipped
+    by `insert_checkpoints`.
+    """
+    latest = latest_date = None
+    new_checkpoints = []
+
+    for checkpoint in checkpoints:
+        checkpoint_date = parse_tracking_date(checkpoint['date'])
+        if latest_date is None or checkpoint_date > latest_date:
+            latest, latest_date = checkpoint, checkpoint_date
+        if watermark is None or checkpoint_date >= watermark:
+            new_checkpoints.append((checkpoint_date, checkpoint))
+
+    return latest, latest_date, new_checkpoints
+
+
+def insert_checkpoints(checkpoints):
+    """Bulk insert (shipment, awb_number, checkpoint_date, checkpoint) rows.
+
+    A checkpoint is named after its content, so the same checkpoint
+    delivered twice (a webhook push racing a scheduled poll) hits the
+    primary key and is skipped instead of stored again.
+    """
+    if not checkpoints:
+        return
+
+    timestamp = now()
+    user = frappe.session.user
+    frappe.db.bulk_insert(
+        "eShipz Tracking Checkpoint",
+        CHECKPOINT_FIELDS,
+        [
+            (
+                get_checkpoint_name(shipment, checkpoint_date, checkpoint), timestamp, timestamp, user, user,
+                shipment, awb_number, checkpoint_date,
+                checkpoint.get('tag'), checkpoint.get('subtag'), checkpoint.get('city'),
+                checkpoint.get('state'), checkpoint.get('remark'),
+            )
+            for shipment, awb_number, checkpoint_date, checkpoint in checkpoints
+        ],
+        ignore_duplicates=True,
+    )
+
+
+def get_checkpoint_name(shipment, checkpoint_date, checkpoint):
+    identity = "|".join(
+        str(value or "")
+        for value in (
+            shipment, checkpoint_date, checkpoint.get('tag'), checkpoint.get('subtag'),
+            checkpoint.get('city'), checkpoint.get('remark'),
+        )
+    )
+    return hashlib.sha1(identity.encode()).hexdigest()[:20]
+
+
+def to_system_datetime(value):
+    """A GMT date from eShipz, as stored by this app, in the system time zone."""
+    return convert_utc_to_system_timezone(get_datetime(value)).replace(tzinfo=None)
@@ -0,0 +1,143 @@
+# Copyright (c) 2024, Frutter Software Labs Private Limited and contributors
+# For license information, please see license.txt
+
+import hashlib
+
+import frappe
+from frappe.utils import now_datetime
+from pypdf import PdfWriter
+
+from eshipz import client
+
+# Labels merged into one PDF; each part is held in memory while it is written
+LABELS_PER_FILE = 100
+
+
+def enqueue_label_download(docname, label_url):
+    if label_url:
+        frappe.enqueue(
+            "eshipz.custom.shipment.labels.store_label",
+            queue="short",
+            enqueue_after_commit=True,
+            docname=docname,
+            label_url=label_url,
+        )
+
+
+def store_label(docname, label_url):
+    """Download a Shipment's label once and attach it as a private File.
+
+    Labels are content addressed: a label whose content is already attached
+    to the Shipment is not stored again, and File itself shares the file on
+    disk between documents with the same content hash.
+    """
+    content = client.download(label_url)
+    content_hash = hashlib.md5(content).hexdigest()
+
+    file_url = frappe.db.get_value(
+        "File",
+        {"attached_to_doctype": "Shipment", "attached_to_name": docname, "content_hash": content_hash},
+        "file_url",
+    )
+    if not file_url:
+        awb_number = frappe.db.get_value("Shipment", docname, "awb_number")
+        file_doc = frappe.get_doc(
+            {
+                "doctype": "File",
+                "file_name": f"{awb_number or docname}.pdf",
+                "attached_to_doctype": "Shipment",
+                "attached_to_name": docname,
+                "attached_to_field": "fsl_label",
+                "is_private": 1,
+                "content": content,
+            }
+        ).insert(ignore_permissions=True)
+        file_url = file_doc.file_url
+
+    frappe.db.set_value("Shipment", docname, "fsl_label", file_url, update_modified=False)
+    frappe.db.commit()
+    return file_url
+
+
+@frappe.whitelist()
+def print_labels(docnames):
+    docnames = frappe.parse_json(docnames)
+    for docname in docnames:
+        frappe.has_permission("Shipment", "print", docname, throw=True)
+
+    frappe.enqueue("eshipz.custom.shipment.labels.merge_labels", queue="long", timeout=1800, docnames=docnames)
+
+
+def merge_labels(docnames):
+    """Merge the stored labels of `docnames` into print-ready PDFs.
+
+    pypdf keeps every appended page in memory until the merged document is
+    written, so labels are merged LABELS_PER_FILE at a time: each part is
+    written straight to the site's private files and released before the
+    next one is started.
+    """
+    shipments = frappe.get_all(
+        "Shipment",
+        filters={"name": ("in", docnames), "docstatus": 1, "status": ("!=", "Cancelled")},
+        fields=["name", "fsl_label", "tracking_url"],
+    )
+    shipments = {shipment.name: shipment for shipment in shipments}
+
+    # Draft, cancelled and deleted Shipments have no label to print and are
+    # reported as missing with the ones whose label could not be fetched
+    paths = []
+    missing = []
+    for docname in dict.fromkeys(docnames):
+        shipment = shipments.get(docname)
+        if not shipment:
+            missing.append(docname)
+            continue
+
+        file_url = shipment.fsl_label
+        if not file_url and shipment.tracking_url:
+            try:
+                file_url = store_label(shipment.name, shipment.tracking_url)
+            except Exception:
+                frappe.log_error(title=f"eShipz label download failed for {shipment.name}")
+        if not file_url:
+            missing.append(shipment.name)
+            continue
+
+        paths.append(frappe.get_doc("File", {"file_url": file_url}).get_full_path())
+
+    batch_id = f"{now_datetime():%Y%m%d-%H%M%S}-{frappe.generate_hash(length=6)}"
+    parts = [paths[i : i + LABELS_PER_FILE] for i in range(0, len(paths), LABELS_PER_FILE)]
+    file_urls = [
+        write_labels(part, f"eshipz-labels-{batch_id}{f'-{i}' if len(parts) > 1 else ''}.pdf")
+        for i, part in enumerate(parts, 1)
+    ]
+
+    frappe.db.commit()
+    frappe.publish_realtime(
+        "eshipz_labels_ready",
+        {"file_urls": file_urls, "missing": missing},
+        user=frappe.session.user,
+    )
+
+
+def write_labels(paths, file_name):
+    """Merge the label files at `paths` into the private file `file_name`."""
+    writer = PdfWriter()
+    try:
+        for path in paths:
+            writer.append(path)
+        # Write straight into the private files folder and register it,
+        # instead of passing its bytes through File.content.
+        with open(frappe.get_site_path("private", "files", file_name), "wb") as merged:
+            writer.write(merged)
+    finally:
+        writer.close()
+
+    return frappe.get_doc(
+        {
+            "doctype": "File",
+            "file_name": file_name,
+            "file_url": f"/private/files/{file_name}",
+            "is_private": 1,
+        }
+    ).insert(ignore_permissions=True).file_url
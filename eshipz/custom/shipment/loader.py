@@ -0,0 +1,61 @@
+# Copyright (c) 2024, Frutter Software Labs Private Limited and contributors
+# For license information, please see license.txt
+
+import frappe
+
+
+ITEM_FIELDS = ("item_name", "uom", "gst_hsn_code", "qty", "amount")
+
+
+def load_delivery_note_items(delivery_notes, fields=(*ITEM_FIELDS, "against_sales_invoice")):
+    """Item rows of `delivery_notes` with one query, in Delivery Note and
+    row order."""
+    position = {name: i for i, name in enumerate(dict.fromkeys(delivery_notes))}
+    if not position:
+        return []
+
+    items = frappe.get_all(
+        "Delivery Note Item",
+        filters={"parent": ("in", list(position)), "parenttype": "Delivery Note"},
+        fields=["parent", "idx", *fields],
+    )
+    items.sort(key=lambda item: (position[item.parent], item.idx))
+    return items
+
+
+def load_delivery_notes(delivery_notes):
+    """Load the item rows, Sales Invoices and e-Waybill dates behind a set of
+    Delivery Notes with one query per table, whatever the number of lines.
+
+    Returns `items` in Delivery Note order and `invoices`, a dict of the
+    referenced Sales Invoices in the order they first appear.
+    """
+    items = load_delivery_note_items(delivery_notes)
+
+    invoice_names = list(dict.fromkeys(item.against_sales_invoice for item in items if item.against_sales_invoice))
+    invoices = {}
+    if invoice_names:
+        rows = frappe.get_all(
+            "Sales Invoice",
+            filters={"name": ("in", invoice_names)},
+            fields=["name", "posting_date", "currency", "grand_total", "ewaybill"],
+        )
+        rows = {row.name: row for row in rows}
+        invoices = {name: rows[name] for name in invoice_names if name in rows}
+
+    ewaybills = [invoice.ewaybill for invoice in invoices.values() if invoice.ewaybill]
+    ewaybill_dates = {}
+    if ewaybills:
+        ewaybill_dates = dict(
+            frappe.get_all(
+                "e-Waybill Log",
+                filters={"name": ("in", ewaybills)},
+                fields=["name", "created_on"],
+                as_list=True,
+            )
+        )
+
+    for invoice in invoices.values():
+        invoice.ewaybill_date = ewaybill_dates.get(invoice.ewaybill) if invoice.ewaybill else ""
+
+    return frappe._dict(items=items, invoices=invoices)
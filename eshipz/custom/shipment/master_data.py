@@ -0,0 +1,74 @@
+# Copyright (c) 2024, Frutter Software Labs Private Limited and contributors
+# For license information, please see license.txt
+
+import frappe
+
+ADDRESS_CACHE_KEY = "eshipz_address_blocks"
+COUNTRY_CACHE_KEY = "eshipz_country_codes"
+
+
+def get_address_block(address_name):
+    """Address fields of an eShipz ship_from / ship_to / return_to block.
+
+    Blocks are compiled once and kept in a Redis hash shared by all workers,
+    with the `modified` of the Address they were compiled from. A block is
+    served while the Address still has that `modified`, so a repeat
+    warehouse costs one primary key read instead of the Address and Country
+    documents, and an Address changed without its hooks running (a direct
+    `db.set_value`) is compiled again. Saving the Address, or any Country,
+    drops the block at once.
+    """
+    modified = frappe.db.get_value("Address", address_name, "modified")
+    if not modified:
+        frappe.throw(f"Address {address_name} not found")
+
+    cache = frappe.cache()
+    cached = cache.hget(ADDRESS_CACHE_KEY, address_name)
+    if cached and cached["modified"] == str(modified):
+        return cached["block"]
+
+    block = compile_address_block(address_name)
+    cache.hset(ADDRESS_CACHE_KEY, address_name, {"modified": str(modified), "block": block})
+    return block
+
+
+def compile_address_block(address_name):
+    address = frappe.db.get_value(
+        "Address",
+        address_name,
+        ["address_title", "address_line1", "address_line2", "city", "state", "pincode", "country", "phone", "email_id", "gstin"],
+        as_dict=True,
+    )
+    if not address:
+        frappe.throw(f"Address {address_name} not found")
+
+    return {
+        "address_title": address.address_title,
+        "street1": address.address_line1,
+        "street2": address.address_line2,
+        "city": address.city,
+        "state": address.state,
+        "postal_code": address.pincode,
+        "phone": address.phone,
+        "email": address.email_id,
+        "tax_id": address.gstin,
+        "country": get_country_code(address.country),
+    }
+
+
+def get_country_code(country_name):
+    codes = frappe.cache().get_value(COUNTRY_CACHE_KEY, generator=get_country_codes)
+    return codes.get(country_name)
+
+
+def get_country_codes():
+    return {country.name: (country.code or "").upper() for country in frappe.get_all("Country", fields=["name", "code"])}
+
+
+def clear_address_cache(doc, method=None):
+    frappe.cache().hdel(ADDRESS_CACHE_KEY, doc.name)
+
+
+def clear_country_cache(doc, method=None):
+    frappe.cache().delete_value(COUNTRY_CACHE_KEY)
+    frappe.cache().delete_value(ADDRESS_CACHE_KEY)
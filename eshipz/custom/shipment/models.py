@@ -0,0 +1,265 @@
+# Copyright (c) 2024, Frutter Software Labs Private Limited and contributors
+# For license information, please see license.txt
+
+"""Typed eShipz payloads.
+
+Requests are built from these slotted dataclasses and serialized with
+`eshipz.codec`; fields listed in `OPTIONAL` are left out of the JSON while
+unset, matching what eShipz expects on each endpoint. Responses are read
+with `read_response` and `require`, which fail with an `eShipzResponseError`
+naming the missing key instead of a bare KeyError.
+"""
+
+import dataclasses
+from dataclasses import dataclass, field
+
+import frappe
+from frappe.utils import flt
+
+from eshipz import codec
+
+
+class eShipzResponseError(frappe.ValidationError):
+    """eShipz answered with a body that is not what the endpoint returns."""
+
+
+class Model:
+    __slots__ = ()
+
+    # Fields omitted from the JSON while None
+    OPTIONAL = frozenset()
+
+    def to_json(self):
+        return {
+            name: value
+            for name in self.__slots__
+            if (value := getattr(self, name)) is not None or name not in self.OPTIONAL
+        }
+
+    def as_dict(self):
+        return dataclasses.asdict(self)
+
+
+@dataclass(slots=True)
+class Weight(Model):
+    value: float
+    unit: str = "kg"
+
+    def __post_init__(self):
+        self.value = flt(self.value)
+        if self.value < 0:
+            frappe.throw(f"Weight cannot be negative: {self.value}")
+
+
+@dataclass(slots=True)
+class Money(Model):
+    amount: float
+    currency: str = "INR"
+
+    def __post_init__(self):
+        self.amount = flt(self.amount)
+
+
+@dataclass(slots=True)
+class Dimension(Model):
+    width: float
+    height: float
+    length: float
+    unit: str = "cm"
+
+    def __post_init__(self):
+        if min(flt(self.width), flt(self.height), flt(self.length)) < 0:
+            frappe.throw(f"Parcel dimensions cannot be negative: {self.length} x {self.width} x {self.height}")
+
+
+@dataclass(slots=True)
+class Address(Model):
+    contact_name: str
+    company_name: str
+    type: str
+    street1: str = None
+    street2: str = None
+    city: str = None
+    state: str = None
+    postal_code: str = None
+    country: str = None
+    phone: str = None
+    email: str = None
+    tax_id: str = None
+    is_primary: bool = None
+
+    OPTIONAL = frozenset(("street2", "tax_id", "is_primary"))
+
+    def __post_init__(self):
+        if not self.postal_code:
+            frappe.throw(f"The address of {self.company_name or self.contact_name} has no postal code")
+
+    @classmethod
+    def from_block(cls, block, fields, contact_name, company_name, type, is_primary=None):
+        """An address from a `master_data.get_address_block`, keeping only
+        the address `fields` the endpoint takes."""
+        return cls(
+            contact_name=contact_name,
+            company_name=company_name,
+            type=type,
+            is_primary=is_primary,
+            **{name: block[name] for name in fields},
+        )
+
+
+@dataclass(slots=True)
+class Item(Model):
+    description: str
+    origin_country: str
+    quantity: float
+    price: Money
+    weight: Weight
+    sku: str = None
+    hs_code: str = None
+    variant: str = None
+
+    OPTIONAL = frozenset(("sku", "hs_code", "variant"))
+
+
+@dataclass(slots=True)
+class Parcel(Model):
+    description: str
+    box_type: str
+    weight: Weight
+    dimension: Dimension
+    items: list
+    quantity: int = None
+    order_value: float = None
+
+    OPTIONAL = frozenset(("quantity", "order_value"))
+
+
+@dataclass(slots=True)
+class GstInvoice(Model):
+    invoice_number: str
+    invoice_date: str
+    invoice_value: float
+    ewaybill_number: str = ""
+    ewaybill_date: str = ""
+
+
+@dataclass(slots=True)
+class Shipment(Model):
+    ship_from: Address
+    ship_to: Address
+    return_to: Address
+    parcels: list
+    purpose: str = None
+    is_reverse: bool = False
+    is_cod: bool = None
+    collect_on_delivery: Money = None
+    is_to_pay: bool = None
+
+    OPTIONAL = frozenset(("purpose", "is_cod", "collect_on_delivery", "is_to_pay"))
+
+    def __post_init__(self):
+        if not self.parcels:
+            frappe.throw("A Shipment needs at least one parcel")
+
+
+@dataclass(slots=True)
+class RatesRequest(Model):
+    """Body of /api/v2/services."""
+
+    shipment: Shipment
+    is_document: bool = False
+
+
+@dataclass(slots=True)
+class ShipmentRequest(Model):
+    """Body of /api/v1/create-shipments and its rule-based variant, where
+    `vendor_id`, `slug` and `service_type` stay null."""
+
+    shipment: Shipment
+    customer_reference: str
+    charged_weight: Weight
+    gst_invoices: list
+    invoice_number: str
+    invoice_date: str
+    collect_on_delivery: Money
+    purpose: str = None
+    parcel_contents: str = None
+    vendor_id: str = None
+    description: str = "Bluedart"
+    slug: str = None
+    service_type: str = None
+    billing: dict = field(default_factory=lambda: {"paid_by": "shipper"})
+    order_source: str = "manual"
+    is_document: bool = False
+    is_cod: bool = False
+
+    def use_service(self, service):
+        """Book with `service`, a service of a rates response with its
+        `selected_service_type`."""
+        self.vendor_id = service["vendor_id"]
+        self.description = service["description"]
+        self.slug = service["slug"]
+        self.service_type = service["selected_service_type"]
+        return self
+
+
+@dataclass(slots=True)
+class TrackingRequest(Model):
+    """Body of /api/v2/trackings: one AWB, or a list of them."""
+
+    track_id: str | list
+
+
+@dataclass(slots=True)
+class CancelRequest(Model):
+    order_id: list
+
+
+@dataclass(slots=True)
+class Booking(Model):
+    """A shipment booked by eShipz."""
+
+    label_url: str
+    awb_number: str
+    service_provider: str
+    tracking_status_info: str
+    carrier_service: str
+    shipment_id: str
+    # Name of the eShipz account it was booked with, None for the default
+    account: str = None
+
+    @classmethod
+    def from_response(cls, result, account=None):
+        data = require(result, "data")
+        if "files" not in data:
+            frappe.throw("Files key not found in API response: " + frappe.as_json(result), exc=eShipzResponseError)
+
+        label_meta = require(data, "files", "label", "label_meta", name="data")
+        return cls(
+            label_url=require(label_meta, "url", name="data.files.label.label_meta"),
+            awb_number=require(label_meta, "awb", name="data.files.label.label_meta"),
+            service_provider=require(data, "slug", name="data"),
+            tracking_status_info=data.get("status"),
+            carrier_service=data.get("service_type"),
+            shipment_id=require(data, "order_id", name="data"),
+            account=account,
+        )
+
+
+def read_response(text):
+    """Decode the JSON body of an eShipz response."""
+    try:
+        return codec.loads(text)
+    except (codec.DecodeError, TypeError):
+        frappe.throw(f"eShipz returned a response that is not JSON: {text[:500]}", exc=eShipzResponseError)
+
+
+def require(obj, *path, name=None):
+    """`obj[path[0]][path[1]]...`, failing with the dotted path of the first
+    key eShipz left out."""
+    for i, key in enumerate(path):
+        if not isinstance(obj, dict) or obj.get(key) is None:
+            dotted = ".".join(filter(None, (name, *path[: i + 1])))
+            frappe.throw(f"eShipz response has no {dotted}", exc=eShipzResponseError)
+        obj = obj[key]
+    return obj
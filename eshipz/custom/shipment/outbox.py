@@ -0,0 +1,156 @@
+# Copyright (c) 2024, Frutter Software Labs Private Limited and contributors
+# For license information, please see license.txt
+
+import json
+from datetime import timedelta
+
+import frappe
+from frappe.utils import add_to_date, now_datetime
+
+from eshipz import client
+
+DOCTYPE = "eShipz Booking Request"
+OPEN_STATUSES = ("Queued", "Processing")
+
+# A request still Processing after the job timeout lost its worker
+PROCESSING_TIMEOUT = 600
+RETRY_BACKOFF = 60
+
+
+def get_booking_queue():
+    """The dedicated `eshipz` queue when the bench runs workers for it
+    (`workers` in common_site_config.json), the long queue otherwise."""
+    return "eshipz" if "eshipz" in (frappe.conf.get("workers") or {}) else "long"
+
+
+def queue_booking(doc, booking_type, selected_service=None, item_data=None):
+    """Record a booking in the outbox and enqueue it; returns at once.
+
+    A Shipment has at most one open request: asking again returns it.
+    """
+    name = frappe.db.get_value(DOCTYPE, {"shipment": doc.name, "status": ("in", OPEN_STATUSES)}, "name")
+    if not name:
+        request = frappe.get_doc(
+            {
+                "doctype": DOCTYPE,
+                "shipment": doc.name,
+                "booking_type": booking_type,
+                "status": "Queued",
+                "selected_service": json.dumps(selected_service) if selected_service else None,
+                "item_data": json.dumps(item_data) if item_data else None,
+                # Safety net: the scheduler enqueues it again if this job is lost
+                "next_attempt_at": add_to_date(now_datetime(), seconds=PROCESSING_TIMEOUT),
+            }
+        ).insert(ignore_permissions=True)
+        name = request.name
+        enqueue_booking(name)
+
+    return {"queued": True, "booking_request": name}
+
+
+def enqueue_booking(name):
+    frappe.enqueue(
+        "eshipz.custom.shipment.outbox.process_booking_request",
+        queue=get_booking_queue(),
+        timeout=PROCESSING_TIMEOUT,
+        job_id=f"eshipz_booking::{name}",
+        deduplicate=True,
+        enqueue_after_commit=True,
+        name=name,
+    )
+
+
+def process_booking_request(name):
+    # shipment.py queues through this module, so its booking functions are
+    # resolved here
+    from eshipz.custom.shipment.rate_shopping import auto_book
+    from eshipz.custom.shipment.shipment import book_rule_based, book_with_service
+
+    request = frappe.get_doc(DOCTYPE, name)
+    if request.status != "Queued":
+        return
+
+    doc = frappe.get_doc("Shipment", request.shipment)
+    if doc.awb_number:
+        # Booked meanwhile, e.g. by an earlier attempt whose result was lost
+        finish(request, "Booked", awb_number=doc.awb_number)
+        return
+
+    max_attempts = frappe.get_cached_doc("eShipz Settings").booking_max_attempts or 3
+    if request.attempts >= max_attempts:
+        finish(request, "Failed", error=request.error or "Booking did not complete")
+        return
+
+    request.db_set({"status": "Processing", "attempts": request.attempts + 1}, commit=True)
+
+    selected_service = json.loads(request.selected_service) if request.selected_service else None
+    item_data = json.loads(request.item_data) if request.item_data else None
+    try:
+        # Every attempt sends customer_reference = Shipment name, which
+        # eShipz uses to recognise a repeated booking
+        if request.booking_type == "Selected Service":
+            booking = book_with_service(doc, selected_service, item_data)
+        elif request.booking_type == "Selection Policy":
+            booking = auto_book(doc)
+        else:
+            booking = book_rule_based(doc, item_data)
+    except client.eShipzUnavailableError as e:
+        frappe.db.rollback()
+        if request.attempts < max_attempts:
+            finish(
+                request,
+                "Queued",
+                error=str(e),
+                next_attempt_at=add_to_date(now_datetime(), seconds=RETRY_BACKOFF * 2 ** (request.attempts - 1)),
+            )
+        else:
+            finish(request, "Failed", error=str(e))
+    except Exception as e:
+        frappe.db.rollback()
+        finish(request, "Failed", error=str(e))
+    else:
+        finish(request, "Booked", awb_number=booking["awb_number"], booking=booking)
+    finally:
+        frappe.clear_messages()
+
+
+def finish(request, status, error=None, awb_number=None, next_attempt_at=None, booking=None):
+    request.db_set(
+        {"status": status, "error": error, "awb_number": awb_number, "next_attempt_at": next_attempt_at},
+        commit=True,
+    )
+    frappe.publish_realtime(
+        "eshipz_booking",
+        {
+            "shipment": request.shipment,
+            "booking_request": request.name,
+            "status": status,
+            "error": error,
+            "booking": booking,
+        },
+        doctype="Shipment",
+        docname=request.shipment,
+    )
+
+
+def retry_booking_requests():
+    """Scheduled: enqueue requests whose retry is due and requeue the ones
+    whose worker died while Processing."""
+    now = now_datetime()
+
+    stale = frappe.get_all(
+        DOCTYPE,
+        filters={"status": "Processing", "modified": ("<", now - timedelta(seconds=PROCESSING_TIMEOUT * 2))},
+        pluck="name",
+    )
+    if stale:
+        frappe.db.set_value(DOCTYPE, {"name": ("in", stale)}, "status", "Queued")
+
+    due = frappe.get_all(
+        DOCTYPE,
+        filters={"status": "Queued", "next_attempt_at": ("<=", now)},
+        pluck="name",
+    )
+    for name in set(due) | set(stale):
+        enqueue_booking(name)
+    frappe.db.commit()
@@ -0,0 +1,84 @@
+# Copyright (c) 2024, Frutter Software Labs Private Limited and contributors
+# For license information, please see license.txt
+
+"""Rates fetched in the background when a Shipment is submitted.
+
+The quote is stored on the Shipment (`fsl_rates`) with the time it was
+fetched, how long it is shown for and the quote key of the payload it
+answers. `fetch_available_services`, behind Create Shipment, serves them
+while they are fresh and their key still matches the Shipment, and calls
+eShipz otherwise.
+"""
+
+import frappe
+from frappe.utils import add_to_date, get_datetime, now_datetime
+
+from eshipz import codec
+from eshipz.accounts import route_shipment
+from eshipz.custom.shipment import rate_cache
+
+
+def on_submit(doc, method=None):
+    enqueue_precompute(doc)
+
+
+def enqueue_precompute(doc):
+    settings = frappe.get_cached_doc("eShipz Settings")
+    if doc.awb_number or not (settings.enabled and settings.precompute_rates):
+        return
+
+    frappe.enqueue(
+        "eshipz.custom.shipment.precompute.precompute_rates",
+        queue="short",
+        timeout=rate_cache.FLIGHT_TIMEOUT + 60,
+        job_id=f"eshipz_precompute_rates::{doc.name}",
+        deduplicate=True,
+        enqueue_after_commit=True,
+        docname=doc.name,
+    )
+
+
+def precompute_rates(docname):
+    # shipment.py reads stored rates through this module, so the payload
+    # builder is resolved here
+    from eshipz.custom.shipment.shipment import get_rates_payload
+
+    doc = frappe.get_doc("Shipment", docname)
+    if doc.docstatus != 1 or doc.awb_number:
+        return
+
+    payload = get_rates_payload(doc)
+    account = route_shipment(doc)
+    key = rate_cache.get_quote_key(payload, account)
+    if doc.fsl_rates_key == key and get_stored_rates(doc, key) is not None:
+        return
+
+    # Straight from eShipz: a cached quote may already be up to its TTL old
+    settings = frappe.get_cached_doc("eShipz Settings")
+    fetched_at = now_datetime()
+    rates = rate_cache.fetch_quote(key, payload, settings, account)
+    if settings.rate_cache_ttl or settings.serve_last_good_quote:
+        rate_cache.store_quote(key, rates, settings)
+
+    ttl = settings.precomputed_rates_ttl or 30
+    frappe.db.set_value(
+        "Shipment",
+        docname,
+        {
+            "fsl_rates": codec.dumps(rates).decode(),
+            "fsl_rates_key": key,
+            "fsl_rates_fetched_at": fetched_at,
+            "fsl_rates_valid_till": add_to_date(fetched_at, minutes=ttl),
+        },
+        update_modified=False,
+    )
+    frappe.db.commit()
+
+
+def get_stored_rates(doc, key):
+    """Rates stored on `doc` for the quote `key` while fresh, else None."""
+    if not doc.fsl_rates or doc.fsl_rates_key != key:
+        return None
+    if not doc.fsl_rates_valid_till or get_datetime(doc.fsl_rates_valid_till) < now_datetime():
+        return None
+    return codec.loads(doc.fsl_rates)
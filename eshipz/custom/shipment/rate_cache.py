@@ -0,0 +1,206 @@
+# Copyright (c) 2024, Frutter Software Labs Private Limited and contributors
+# For license information, please see license.txt
+
+import hashlib
+import json
+import time
+from datetime import datetime
+
+import frappe
+from frappe.utils import cint, pretty_date
+
+from eshipz import breaker, client, codec, singleflight
+from eshipz.custom.shipment.models import eShipzResponseError, read_response, require
+
+CACHE_PREFIX = "eshipz_rate_quote:"
+INDEX_KEY = "eshipz_rate_quote_index"
+HITS_KEY = "eshipz_rate_quote_hits"
+STALE_HITS_KEY = "eshipz_rate_quote_stale_hits"
+MISSES_KEY = "eshipz_rate_quote_misses"
+LAST_GOOD_HITS_KEY = "eshipz_rate_quote_last_good_hits"
+FLIGHT_PREFIX = "rates:"
+RATES_CIRCUIT = "rates"
+
+# Longest a rates call can take with its retries
+FLIGHT_TIMEOUT = client.MAX_CALL_DURATION + 10
+
+
+def fetch_rates(data, account=None):
+    response = client.post("/api/v2/services", data=codec.dumps(data), idempotent=True, account=account)
+    if response.status_code >= 500:
+        frappe.throw("eShipz failed to return rates: " + response.text, exc=client.eShipzUnavailableError)
+    return parse_rates(response.status_code, response.text)
+
+
+def fetch_quote(key, data, settings, account=None):
+    """Fetch rates through the circuit breaker, sharing one upstream call
+    among identical requests in flight on any worker."""
+    threshold = settings.rate_circuit_breaker_threshold or 0
+    if not breaker.allow(RATES_CIRCUIT, threshold):
+        frappe.throw(
+            f"eShipz rates are unavailable after repeated failures, retrying in {breaker.retry_in(RATES_CIRCUIT)} seconds",
+            exc=client.eShipzUnavailableError,
+        )
+
+    def call():
+        try:
+            rates = fetch_rates(data, account)
+        except client.eShipzRateLimitError:
+            # Throttled, not down: the throttle paces calls, the circuit stays as it is
+            breaker.release_probe(RATES_CIRCUIT)
+            raise
+        except client.eShipzUnavailableError:
+            breaker.record_failure(RATES_CIRCUIT, threshold, settings.rate_circuit_breaker_cooldown or 30)
+            raise
+        except Exception:
+            # Rejected request or unexpected body: eShipz answered, so a
+            # probe neither closes nor re-opens the circuit but frees its slot
+            breaker.release_probe(RATES_CIRCUIT)
+            raise
+        breaker.record_success(RATES_CIRCUIT)
+        return rates
+
+    return singleflight.run(FLIGHT_PREFIX + key, call, timeout=FLIGHT_TIMEOUT)
+
+
+def parse_rates(status_code, text):
+    if status_code == 200:
+        rates = require(read_response(text), "data", "rates")
+        if not isinstance(rates, list):
+            frappe.throw("Rates in API response are not a list: " + frappe.as_json(rates), exc=eShipzResponseError)
+        return rates
+    else:
+        frappe.throw("Failed to fetch services: " + text)
+
+
+def get_quote_key(data, account=None):
+    """Hash only the parts of a `RatesRequest` that change the price, and
+    the eShipz account quoting it."""
+    shipment = data.shipment
+    ship_from = shipment.ship_from
+    ship_to = shipment.ship_to
+
+    shape = [
+        shipment.purpose,
+        ship_from.postal_code,
+        ship_from.country,
+        ship_from.type,
+        ship_to.postal_code,
+        ship_to.country,
+        ship_to.type,
+        [
+            [
+                parcel.weight.value,
+                parcel.dimension.length,
+                parcel.dimension.width,
+                parcel.dimension.height,
+                parcel.items[0].quantity if parcel.items else None,
+            ]
+            for parcel in shipment.parcels
+        ],
+    ]
+    if account:
+        shape.append(account)
+
+    canonical = json.dumps(shape, separators=(',', ':'), sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def get_rates(data, account=None):
+    settings = frappe.get_cached_doc("eShipz Settings")
+    ttl = settings.rate_cache_ttl or 0
+    keep_quotes = ttl > 0 or settings.serve_last_good_quote
+
+    cache = frappe.cache()
+    key = get_quote_key(data, account)
+    entry = cache.get_value(CACHE_PREFIX + key) if keep_quotes else None
+
+    if entry and ttl > 0:
+        age = time.time() - entry["fetched_at"]
+        if age <= ttl:
+            cache.incr(cache.make_key(HITS_KEY))
+            return entry["rates"]
+
+        if settings.rate_cache_stale_while_revalidate and age <= ttl + (settings.rate_cache_stale_ttl or 0):
+            cache.incr(cache.make_key(STALE_HITS_KEY))
+            frappe.enqueue(
+                "eshipz.custom.shipment.rate_cache.refresh_quote",
+                queue="short",
+                job_id=f"eshipz_rate_refresh::{key}",
+                deduplicate=True,
+                data=data,
+                account=account,
+            )
+            return entry["rates"]
+
+    if ttl > 0:
+        cache.incr(cache.make_key(MISSES_KEY))
+
+    try:
+        rates = fetch_quote(key, data, settings, account)
+    except client.eShipzUnavailableError:
+        if not (entry and settings.serve_last_good_quote):
+            raise
+        # Serve the last good quote instead of the error
+        frappe.clear_last_message()
+        cache.incr(cache.make_key(LAST_GOOD_HITS_KEY))
+        frappe.msgprint(
+            f"eShipz is not responding, showing the rates quoted {pretty_date(datetime.fromtimestamp(entry['fetched_at']))}",
+            indicator="orange",
+            alert=True,
+        )
+        return entry["rates"]
+
+    if keep_quotes:
+        store_quote(key, rates, settings)
+    return rates
+
+
+def refresh_quote(data, account=None):
+    settings = frappe.get_cached_doc("eShipz Settings")
+    key = get_quote_key(data, account)
+    store_quote(key, fetch_quote(key, data, settings, account), settings)
+
+
+def store_quote(key, rates, settings):
+    cache = frappe.cache()
+    expires_in = (settings.rate_cache_ttl or 0) + (
+        (settings.rate_cache_stale_ttl or 0) if settings.rate_cache_stale_while_revalidate else 0
+    )
+    # Quotes outlive their freshness to be served while eShipz is down
+    if settings.serve_last_good_quote:
+        expires_in = max(expires_in, (settings.last_good_quote_ttl or 24) * 60 * 60)
+    now = time.time()
+
+    cache.set_value(CACHE_PREFIX + key, {"rates": rates, "fetched_at": now}, expires_in_sec=expires_in)
+
+    # The index is a sorted set of quote keys scored by write time, used to
+    # evict the oldest quotes once the configured size is exceeded.
+    index_key = cache.make_key(INDEX_KEY)
+    cache.zadd(index_key, {key: now})
+    cache.zremrangebyscore(index_key, "-inf", now - expires_in)
+
+    overflow = cache.zcard(index_key) - (settings.rate_cache_max_entries or 0)
+    if settings.rate_cache_max_entries and overflow > 0:
+        for evicted, _score in cache.zpopmin(index_key, overflow):
+            cache.delete_value(CACHE_PREFIX + frappe.safe_decode(evicted))
+
+
+@frappe.whitelist()
+def get_rate_cache_stats():
+    frappe.only_for("System Manager")
+
+    cache = frappe.cache()
+    hits, stale_hits, misses, last_good_hits = (
+        cint(cache.get(cache.make_key(key))) for key in (HITS_KEY, STALE_HITS_KEY, MISSES_KEY, LAST_GOOD_HITS_KEY)
+    )
+    total = hits + stale_hits + misses
+    return {
+        "hits": hits,
+        "stale_hits": stale_hits,
+        "misses": misses,
+        "last_good_hits": last_good_hits,
+        "circuit": "open" if breaker.retry_in(RATES_CIRCUIT) else "closed",
+        "hit_ratio": (hits + stale_hits) / total if total else 0,
+        "entries": cache.zcard(cache.make_key(INDEX_KEY)),
+    }
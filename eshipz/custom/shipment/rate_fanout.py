@@ -0,0 +1,140 @@
+# Copyright (c) 2024, Frutter Software Labs Private Limited and contributors
+# For license information, please see license.txt
+
+import asyncio
+import json
+
+import aiohttp
+import frappe
+from frappe.utils import cint
+
+from eshipz import client
+from eshipz.accounts import route_shipment
+from eshipz.custom.shipment.rate_cache import get_quote_key, parse_rates, store_quote
+from eshipz.custom.shipment.shipment import dump_payload, get_rates_payload
+
+RESULTS_KEY = "eshipz_rate_fanout:"
+STATUS_KEY = "eshipz_rate_fanout_status:"
+RESULTS_TTL = 24 * 60 * 60
+
+
+@frappe.whitelist()
+def quote_shipments(docnames):
+    """Queue a concurrent rate request for many Shipments.
+
+    Results are published as `eshipz_rate_quote` realtime events as they
+    arrive and can be paged with `get_quote_results`.
+    """
+    docnames = frappe.parse_json(docnames)
+    for docname in docnames:
+        frappe.has_permission("Shipment", "read", docname, throw=True)
+
+    fanout_id = frappe.generate_hash(length=12)
+    frappe.enqueue(
+        "eshipz.custom.shipment.rate_fanout.run_quote_fanout",
+        queue="long",
+        timeout=1800,
+        fanout_id=fanout_id,
+        docnames=docnames,
+    )
+    return fanout_id
+
+
+@frappe.whitelist()
+def get_quote_results(fanout_id, start=0, page_length=50):
+    cache = frappe.cache()
+    start = cint(start)
+    page_length = cint(page_length)
+
+    rows = cache.lrange(RESULTS_KEY + fanout_id, start, start + page_length - 1)
+    received = cache.llen(RESULTS_KEY + fanout_id)
+
+    status = cache.get_value(STATUS_KEY + fanout_id) or {}
+    return {
+        "results": [json.loads(row) for row in rows],
+        "total": status.get("total"),
+        "received": received,
+        "done": status.get("done", False),
+    }
+
+
+def run_quote_fanout(fanout_id, docnames):
+    settings = frappe.get_cached_doc("eShipz Settings")
+    cache = frappe.cache()
+    results_key = cache.make_key(RESULTS_KEY + fanout_id)
+    cache.set_value(STATUS_KEY + fanout_id, {"total": len(docnames), "done": False}, expires_in_sec=RESULTS_TTL)
+
+    def on_result(docname, rates=None, error=None, payload=None, account=None):
+        if rates is not None and (settings.rate_cache_ttl or settings.serve_last_good_quote):
+            store_quote(get_quote_key(payload, account), rates, settings)
+        result = {"fanout_id": fanout_id, "shipment": docname, "rates": rates, "error": error}
+        cache.rpush(RESULTS_KEY + fanout_id, json.dumps(result))
+        frappe.publish_realtime("eshipz_rate_quote", result, user=frappe.session.user)
+
+    payloads = {}
+    for docname in docnames:
+        try:
+            doc = frappe.get_doc("Shipment", docname)
+            payloads[docname] = (get_rates_payload(doc), route_shipment(doc))
+        except Exception as e:
+            on_result(docname, error=str(e))
+    frappe.clear_messages()
+
+    concurrency = settings.rate_fanout_concurrency or 20
+    with client.get_executor(concurrency) as executor:
+        asyncio.run(fan_out(payloads, concurrency, on_result, executor))
+
+    cache.expire(results_key, RESULTS_TTL)
+    cache.set_value(STATUS_KEY + fanout_id, {"total": len(docnames), "done": True}, expires_in_sec=RESULTS_TTL)
+    frappe.publish_realtime("eshipz_rate_quote_done", {"fanout_id": fanout_id}, user=frappe.session.user)
+
+
+async def fan_out(payloads, concurrency, on_result, executor):
+    semaphore = asyncio.Semaphore(concurrency)
+    headers = {"Content-Type": "application/json"}
+    timeout = aiohttp.ClientTimeout(sock_connect=client.CONNECT_TIMEOUT, sock_read=client.READ_TIMEOUT)
+
+    async with aiohttp.ClientSession(
+        headers=headers, timeout=timeout, connector=aiohttp.TCPConnector(limit=concurrency)
+    ) as session:
+
+        async def quote(docname, payload, account):
+            async with semaphore:
+                try:
+                    status, text = await post_rates(session, dump_payload(payload), executor, account)
+                    return docname, payload, account, parse_rates(status, text), None
+                except Exception as e:
+                    return docname, payload, account, None, str(e)
+
+        for task in asyncio.as_completed(
+            [quote(docname, payload, account) for docname, (payload, account) in payloads.items()]
+        ):
+            docname, payload, account, rates, error = await task
+            on_result(docname, rates=rates, error=error, payload=payload, account=account)
+            frappe.clear_messages()
+
+
+async def post_rates(session, data, executor, account=None):
+    """`client.post` of a rates request on aiohttp. Pacing, retries and
+    metrics go through the same `client.Call`; its Redis calls run on
+    `executor` so they never block the event loop."""
+    loop = asyncio.get_running_loop()
+    path = "/api/v2/services"
+    url = client.get_base_url() + path
+    headers = {"X-API-TOKEN": await loop.run_in_executor(executor, client.get_api_token, account)}
+    call = client.Call(path, data, idempotent=True, account=account)
+
+    while True:
+        await loop.run_in_executor(executor, call.begin)
+        try:
+            async with session.post(url, data=data, headers=headers) as response:
+                text = await response.text()
+        except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+            delay = await loop.run_in_executor(executor, call.failed, e)
+        else:
+            delay = await loop.run_in_executor(executor, call.answered, response.status, response.headers)
+            if delay is None:
+                await loop.run_in_executor(executor, call.finish, response.status, text)
+                return response.status, text
+
+        await asyncio.sleep(delay)
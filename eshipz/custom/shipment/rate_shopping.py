@@ -0,0 +1,125 @@
+# Copyright (c) 2024, Frutter Software Labs Private Limited and contributors
+# For license information, please see license.txt
+
+import frappe
+import numpy as np
+from frappe.utils import cint, flt
+
+from eshipz.accounts import route_shipment
+from eshipz.custom.shipment import rate_cache
+from eshipz.custom.shipment.outbox import queue_booking
+from eshipz.custom.shipment.shipment import book_with_service, get_rates_payload
+
+SERVICE_FIELDS = ("vendor_id", "slug", "description")
+
+
+@frappe.whitelist()
+def auto_book_shipment(docname):
+    """Quote a Shipment, pick a service with the selection policy of eShipz
+    Settings and book it, in one step."""
+    frappe.has_permission("Shipment", "write", docname, throw=True)
+    doc = frappe.get_doc("Shipment", docname)
+    if frappe.get_cached_doc("eShipz Settings").enable_async_booking:
+        return queue_booking(doc, "Selection Policy")
+    return auto_book(doc)
+
+
+def auto_book(doc):
+    service = select_service(rate_cache.get_rates(get_rates_payload(doc), route_shipment(doc)))
+    return book_with_service(doc, service)
+
+
+def select_service(rates, settings=None):
+    """Pick the service to book from an eShipz rates response.
+
+    Every service type of every carrier is a candidate. Candidates over the
+    Max Price or Max Transit Days are dropped, then the policy ranks the
+    rest:
+
+    * Cheapest / Fastest: lowest price / transit time, the other breaking ties
+    * Preferred Carrier: first carrier of Preferred Carriers, then cheapest
+    * Weighted Score: min-max normalised price and transit time weighted by
+      Price Weight and Transit Weight, less Preferred Carrier Weight for
+      preferred carriers; lowest score wins
+
+    All candidates are scored at once with NumPy. Returns the `vendor_id`,
+    `slug`, `description` and `selected_service_type` `create_shipment`
+    expects, along with the price and transit time that won.
+    """
+    settings = settings or frappe.get_cached_doc("eShipz Settings")
+    price_field = settings.rate_price_field or "total_charge"
+    transit_field = settings.rate_transit_field or "tat"
+
+    candidates = [(rate, service_type) for rate in rates or [] for service_type in rate.get("technicality") or []]
+    if not candidates:
+        frappe.throw("eShipz returned no services to select from")
+
+    price = np.array([to_number(service_type.get(price_field)) for _rate, service_type in candidates])
+    transit = np.array([to_number(service_type.get(transit_field)) for _rate, service_type in candidates])
+    preferred = get_preferred_carriers(settings)
+    preference = np.array(
+        [preferred.index(rate.get("slug")) if rate.get("slug") in preferred else len(preferred) for rate, _type in candidates]
+    )
+
+    # Candidates without a price or transit time lose every comparison on it
+    price = np.where(np.isnan(price), np.inf, price)
+    transit = np.where(np.isnan(transit), np.inf, transit)
+
+    allowed = np.ones(len(candidates), dtype=bool)
+    if flt(settings.max_price):
+        allowed &= price <= flt(settings.max_price)
+    if cint(settings.max_transit_days):
+        allowed &= transit <= cint(settings.max_transit_days)
+    if not allowed.any():
+        frappe.throw("No eShipz service is within the Max Price and Max Transit Days of eShipz Settings")
+
+    policy = settings.service_selection_policy or "Cheapest"
+    if policy == "Fastest":
+        keys = (price, transit)
+    elif policy == "Preferred Carrier":
+        keys = (transit, price, preference)
+    elif policy == "Weighted Score":
+        score = (
+            flt(settings.price_weight) * normalise(price, allowed)
+            + flt(settings.transit_weight) * normalise(transit, allowed)
+            - flt(settings.preferred_carrier_weight) * (preference < len(preferred))
+        )
+        keys = (price, score)
+    else:
+        keys = (transit, price)
+
+    # np.lexsort sorts by its last key first; excluded candidates go last
+    best = np.lexsort((*keys, ~allowed))[0]
+    rate, service_type = candidates[best]
+    return {
+        **{field: rate.get(field) for field in SERVICE_FIELDS},
+        "selected_service_type": service_type.get("service_type"),
+        "price": None if np.isinf(price[best]) else float(price[best]),
+        "transit": None if np.isinf(transit[best]) else float(transit[best]),
+    }
+
+
+def to_number(value):
+    """`value` as a float, NaN when it is missing or not a number (e.g.
+    "2-3 days"), so the candidate ranks last on it instead of as 0."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def normalise(values, allowed):
+    """Scale `values` to 0..1 over the allowed candidates; missing values
+    score 1, the worst."""
+    finite = allowed & np.isfinite(values)
+    if not finite.any():
+        return np.ones(len(values))
+
+    low, high = values[finite].min(), values[finite].max()
+    scaled = (values - low) / (high - low) if high > low else np.zeros(len(values))
+    return np.where(np.isfinite(values), scaled, 1.0)
+
+
+def get_preferred_carriers(settings):
+    return [slug.strip() for slug in (settings.preferred_carriers or "").replace(",", "\n").splitlines() if slug.strip()]
+
@@ -13,6 +13,11 @@ frappe.ui.form.on('Shipment', {
 		callback: function(r) {
 		    if (r.message && r.message.enabled == 1) {
 			// Add buttons if enabled is true
+			if (frm.doc.docstatus == 0 && (frm.doc.shipment_delivery_note || []).length) {
+			    frm.add_custom_button(__('Auto Pack Parcels'), function() {
+				auto_pack_parcels(frm);
+			    });
+			}
 			if (frm.doc.docstatus == 1 && !frm.doc.awb_number) {
 			    // Check if enable_allocation is enabled
 			    frappe.call({
@@ -43,13 +48,31 @@ frappe.ui.form.on('Shipment', {
 						}
 					    });
 					}).addClass('btn-info').css({'background':'#239b56', 'color':'white'});
+					frm.add_custom_button(__('Book Best Service'), function() {
+					    frappe.call({
+						method: 'eshipz.custom.shipment.rate_shopping.auto_book_shipment',
+						args: {
+						    docname: frm.docname
+						},
+						freeze: true,
+						freeze_message: __('Selecting a service and creating Shipment... Please wait...'),
+						callback: function(r) {
+						    if (r.message && r.message.queued) {
+							show_booking_queued();
+						    } else if (r.message) {
+							frappe.msgprint(__('Shipment booked with {0} ({1})', [r.message.service_provider, r.message.carrier_service]));
+							frm.reload_doc();
+						    }
+						}
+					    });
+					});
 				    }
 				}
 			    });
 			}
 			if (frm.doc.docstatus == 1 && frm.doc.awb_number && frm.doc.status != 'Cancelled') {
 			    frm.add_custom_button(__('Download/Print Label'), function() {
-				window.open(frm.doc.tracking_url, '_blank');
+				window.open(frm.doc.fsl_label || frm.doc.tracking_url, '_blank');
 			    }).addClass('btn-primary').css({'background':'#21618c', 'color':'white'});
 			    frm.add_custom_button(__('Cancel Shipment'), function() {
 				frappe.call({
@@ -96,9 +119,66 @@ frappe.ui.form.on('Shipment', {
 		    }
 		}
 	    });
+	},
+	shipment_parcel_add: function(frm) {
+	    // A packing only holds for the parcels it created
+	    frm.set_value('fsl_parcel_allocation', '');
+	},
+	shipment_parcel_remove: function(frm) {
+	    frm.set_value('fsl_parcel_allocation', '');
+	}
+    });
+    
+    // Result of a booking queued in the background (eShipz Booking Request)
+    frappe.realtime.on('eshipz_booking', function(data) {
+	if (!cur_frm || cur_frm.doctype !== 'Shipment' || cur_frm.docname !== data.shipment) {
+	    return;
+	}
+	if (data.status === 'Booked') {
+	    frappe.show_alert({message: __('Shipment created successfully...✨🎉'), indicator: 'green'});
+	    cur_frm.reload_doc();
+	} else if (data.status === 'Queued') {
+	    frappe.show_alert({message: __('eShipz did not respond, booking will be retried'), indicator: 'orange'});
+	} else {
+	    frappe.msgprint({
+		title: __('Error'),
+		indicator: 'red',
+		message: __('An error occurred while creating Shipment...🤯') + (data.error ? '<br>' + frappe.utils.escape_html(data.error) : '')
+	    });
 	}
     });
     
+    function show_booking_queued() {
+	frappe.show_alert({
+	    message: __('Booking queued, the Shipment will update when eShipz responds'),
+	    indicator: 'blue'
+	});
+    }
+    
+    
+    function auto_pack_parcels(frm) {
+	frappe.call({
+	    method: 'eshipz.custom.shipment.packing.pack_parcels',
+	    args: {
+		delivery_notes: frm.doc.shipment_delivery_note.map(dn => dn.delivery_note)
+	    },
+	    freeze: true,
+	    freeze_message: __('Packing Parcels...'),
+	    callback: function(r) {
+		if (r.message) {
+		    frm.clear_table('shipment_parcel');
+		    r.message.parcels.forEach(parcel => frm.add_child('shipment_parcel', parcel));
+		    frm.refresh_field('shipment_parcel');
+		    frm.set_value('fsl_parcel_allocation', JSON.stringify(r.message.item_data));
+		    frappe.show_alert({
+			message: __('Packed into {0} parcels', [r.message.parcels.length]),
+			indicator: 'green'
+		    });
+		}
+	    }
+	});
+    }
+    
     function show_service_popup(services) {
 	let header_columns = ["Service Type", "Description", "Slug", "Vendor ID"];
 	let html = `
@@ -159,20 +239,24 @@ frappe.ui.form.on('Shipment', {
     }
     
     function fetch_and_show_item_selection_popup(service, parcel_count, method = 'create_shipment') {
-	let shipment_delivery_notes = cur_frm.doc.shipment_delivery_note;
-	let delivery_note_items = [];
+	// Parcels packed automatically already carry their items
+	if (cur_frm.doc.fsl_parcel_allocation) {
+	    let item_data = JSON.parse(cur_frm.doc.fsl_parcel_allocation);
+	    if (method === 'create_shipment') {
+		create_shipment(service, item_data);
+	    } else {
+		create_rule_based_shipment(item_data);
+	    }
+	    return;
+	}
 	
-	let fetch_items = shipment_delivery_notes.map(dn => {
-	    return frappe.call({
-		method: 'eshipz.custom.shipment.shipment.get_delivery_note_items',
-		args: { delivery_note: dn.delivery_note }
-	    }).then(response => {
-		delivery_note_items.push(...response.message);
-	    });
-	});
+	let delivery_notes = cur_frm.doc.shipment_delivery_note.map(dn => dn.delivery_note);
 	
-	Promise.all(fetch_items).then(() => {
-	    let unique_items = get_unique_items(delivery_note_items);
+	frappe.call({
+	    method: 'eshipz.custom.shipment.shipment.get_delivery_notes_items',
+	    args: { delivery_notes: delivery_notes }
+	}).then(response => {
+	    let unique_items = response.message || [];
 	    let item_selection_popup = new frappe.ui.Dialog({
 		title: __('Select Items for Parcels'),
 		fields: [
@@ -197,21 +281,6 @@ frappe.ui.form.on('Shipment', {
 	});
     }
     
-    function get_unique_items(items) {
-	let unique_items = [];
-	let item_map = {};
-	
-	items.forEach(item => {
-	    let key = `${item.item_name}-${item.qty}-${item.uom}-${item.gst_hsn_code}-${item.amount}`;
-	    if (!item_map[key]) {
-		item_map[key] = true;
-		unique_items.push(item);
-	    }
-	});
-	
-	return unique_items;
-    }
-    
     function generate_parcel_selection_html(parcel_count, delivery_note_items) {
 	let html = '<div><h5>Select items for each parcel</h5>';
 	for (let i = 1; i <= parcel_count; i++) {
@@ -276,7 +345,9 @@ frappe.ui.form.on('Shipment', {
 	    freeze: true,
 	    freeze_message: __('Creating Shipment... Please wait...⏳☕'),
 	    callback: function(r) {
-		if (r.message) {
+		if (r.message && r.message.queued) {
+		    show_booking_queued();
+		} else if (r.message) {
 		    frappe.msgprint(__('Shipment created successfully...✨🎉'));
 		    cur_frm.reload_doc();
 		} else {
@@ -300,7 +371,9 @@ frappe.ui.form.on('Shipment', {
 	    freeze: true,
 	    freeze_message: __('Creating Rule Based Shipment... Please wait...⏳☕'),
 	    callback: function(r) {
-		if (r.message) {
+		if (r.message && r.message.queued) {
+		    show_booking_queued();
+		} else if (r.message) {
 		    frappe.msgprint(__('Rule Based Shipment created successfully...✨🎉'));
 		    cur_frm.reload_doc();
 		} else {
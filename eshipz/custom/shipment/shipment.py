@@ -1,121 +1,88 @@
-import requests
 import frappe
 import json
 from collections import defaultdict
-from datetime import datetime
+from datetime import datetime, timedelta
+from frappe.utils import get_datetime, now_datetime
+
+from eshipz import client, codec
+from eshipz.accounts import route_shipment
+from eshipz.custom.shipment import precompute, rate_cache
+from eshipz.custom.shipment.checkpoints import get_new_checkpoints, parse_tracking_date, to_system_datetime
+from eshipz.custom.shipment.labels import enqueue_label_download
+from eshipz.custom.shipment.loader import ITEM_FIELDS, load_delivery_note_items, load_delivery_notes
+from eshipz.custom.shipment.master_data import get_address_block
+from eshipz.custom.shipment.models import (
+    Address,
+    Booking,
+    CancelRequest,
+    Dimension,
+    GstInvoice,
+    Item,
+    Money,
+    Parcel,
+    RatesRequest,
+    Shipment,
+    ShipmentRequest,
+    TrackingRequest,
+    Weight,
+    eShipzResponseError,
+    read_response,
+)
+from eshipz.custom.shipment.outbox import queue_booking
+from eshipz.custom.shipment.writeback import ShipmentWriter, write_shipment
+
+RATES_ADDRESS_FIELDS = ("street1", "city", "state", "postal_code", "country", "phone", "email")
+SHIPPER_ADDRESS_FIELDS = ("street1", "street2", "city", "state", "postal_code", "phone", "email", "tax_id", "country")
+RECEIVER_ADDRESS_FIELDS = ("street1", "street2", "city", "state", "postal_code", "phone", "email", "country")
 
 @frappe.whitelist()
 def fetch_available_services(docname):
     doc = frappe.get_doc('Shipment', docname)
-    
-    pickup_address = frappe.get_doc('Address', doc.pickup_address_name)
-    delivery_address = frappe.get_doc('Address', doc.delivery_address_name)
-
-    def get_country_code(country_name):
-        country = frappe.get_doc('Country', country_name)
-        return country.code.upper()
-
-    pickup_country_code = get_country_code(pickup_address.country)
-    delivery_country_code = get_country_code(delivery_address.country)
-
-    api_token = frappe.db.get_single_value('eShipz Settings', 'api_token')
-    if not api_token:
-        frappe.throw("API token not found in eShipz Settings")
-
-    url = "https://app.eshipz.com/api/v2/services"
-    headers = {
-        "X-API-TOKEN": api_token,
-        "Content-Type": "application/json"
-    }
+    payload = get_rates_payload(doc)
+    account = route_shipment(doc)
+    rates = precompute.get_stored_rates(doc, rate_cache.get_quote_key(payload, account))
+    if rates is not None:
+        return rates
+    return rate_cache.get_rates(payload, account)
+
+def get_rates_payload(doc):
+    pickup_address = get_address_block(doc.pickup_address_name)
+    delivery_address = get_address_block(doc.delivery_address_name)
+
+    pickup_country_code = pickup_address["country"]
+    ship_from = Address.from_block(
+        pickup_address, RATES_ADDRESS_FIELDS, doc.pickup_contact_person, doc.pickup_company, doc.fsl_pickup_type, is_primary=True
+    )
 
-    data = {    
-        "is_document": False,
-        "shipment": {
-            "is_reverse": False,
-            "purpose": doc.fsl_purpose,
-            "is_cod": False,
-            "collect_on_delivery": {"amount": 0, "currency": "INR"},
-            "ship_from": {
-                "contact_name": doc.pickup_contact_person,
-                "company_name": doc.pickup_company,
-                "street1": pickup_address.address_line1,
-                "city": pickup_address.city,
-                "state": pickup_address.state,
-                "postal_code": pickup_address.pincode,
-                "country": pickup_country_code,
-                "type": doc.fsl_pickup_type,
-                "phone": pickup_address.phone,
-                "email": pickup_address.email_id,
-                "is_primary": True
-            },
-            "ship_to": {
-                "contact_name": doc.delivery_contact_name,
-                "company_name": delivery_address.address_title,
-                "street1": delivery_address.address_line1,
-                "city": delivery_address.city,
-                "state": delivery_address.state,
-                "postal_code": delivery_address.pincode,
-                "country": delivery_country_code,
-                "type": doc.fsl_delivery_type,
-                "phone": delivery_address.phone,
-                "email": delivery_address.email_id,
-            },
-            "return_to": {
-                "contact_name": doc.pickup_contact_person,
-                "company_name": doc.pickup_company,
-                "street1": pickup_address.address_line1,
-                "city": pickup_address.city,
-                "state": pickup_address.state,
-                "postal_code": pickup_address.pincode,
-                "country": pickup_country_code,
-                "type": doc.fsl_pickup_type,
-                "phone": pickup_address.phone,
-                "email": pickup_address.email_id,
-                "is_primary": True
-            },
-            "parcels": [
-                {
-                    "description": doc.description_of_content,
-                    "box_type": doc.shipment_type,
-                    "weight": {"value": parcel.weight, "unit": "kg"},
-                    "dimension": {
-                        "width": parcel.width,
-                        "height": parcel.height,
-                        "length": parcel.length,
-                        "unit": "cm"
-                    },
-                    "items": [
-                        {
-                            "description": doc.description_of_content,
-                            "origin_country": pickup_country_code,
-                            "quantity": parcel.count,
-                            "price": {
-                                "amount": doc.value_of_goods,
-                                "currency": "INR"
-                            },
-                            "weight": {
-                                "unit": "kg",
-                                "value": parcel.weight
-                            }
-                        }
-                    ]
-                } for parcel in doc.get("shipment_parcel")
+    return RatesRequest(
+        shipment=Shipment(
+            purpose=doc.fsl_purpose,
+            is_cod=False,
+            collect_on_delivery=Money(0),
+            ship_from=ship_from,
+            ship_to=Address.from_block(
+                delivery_address, RATES_ADDRESS_FIELDS, doc.delivery_contact_name, delivery_address["address_title"], doc.fsl_delivery_type
+            ),
+            return_to=ship_from,
+            parcels=[
+                Parcel(
+                    description=doc.description_of_content,
+                    box_type=doc.shipment_type,
+                    weight=Weight(parcel.weight),
+                    dimension=Dimension(parcel.width, parcel.height, parcel.length),
+                    items=[
+                        Item(
+                            description=doc.description_of_content,
+                            origin_country=pickup_country_code,
+                            quantity=parcel.count,
+                            price=Money(doc.value_of_goods),
+                            weight=Weight(parcel.weight),
+                        )
+                    ],
+                ) for parcel in doc.get("shipment_parcel")
             ]
-        }
-    }
-
-    json_data = json.dumps(data, separators=(',', ':'), default=lambda x: str(x).lower() if isinstance(x, bool) else x)
-
-    response = requests.post(url, headers=headers, data=json_data)
-
-    if response.status_code == 200:
-        result = response.json()
-        if 'rates' in result['data']:
-            return result['data']['rates']
-        else:
-            frappe.throw("Rates key not found in API response: " + frappe.as_json(result))
-    else:
-        frappe.throw("Failed to fetch services: " + response.text)
+        )
+    )
 
 @frappe.whitelist()
 def create_shipment(docname, selected_service, item_data=None):
@@ -125,227 +92,17 @@ def create_shipment(docname, selected_service, item_data=None):
     if item_data:
         item_data = json.loads(item_data)
 
-    pickup_address = frappe.get_doc('Address', doc.pickup_address_name)
-    delivery_address = frappe.get_doc('Address', doc.delivery_address_name)
-    
-    def get_country_code(country_name):
-        country = frappe.get_doc('Country', country_name)
-        return country.code.upper()
-
-    pickup_country_code = get_country_code(pickup_address.country)
-    delivery_country_code = get_country_code(delivery_address.country)
-
-    api_token = frappe.db.get_single_value('eShipz Settings', 'api_token')
-    if not api_token:
-        frappe.throw("API token not found in eShipz Settings")
-
-    url = "https://app.eshipz.com/api/v1/create-shipments"
-    headers = {
-        "X-API-TOKEN": api_token,
-        "Content-Type": "application/json"
-    }
-
-    charged_weight = sum(parcel.weight for parcel in doc.get("shipment_parcel"))
-
-    invoice_numbers = set()
-    invoice_dates = set()
-    consolidated_items = defaultdict(lambda: {"weight": 0, "amount": 0})
-    gst_invoices = []
-
-    total_order_value = 0
-
-    for dn in doc.get("shipment_delivery_note"):
-        delivery_note = frappe.get_doc('Delivery Note', dn.delivery_note)
-        for item in delivery_note.items:
-            if item.against_sales_invoice:
-                invoice_number = item.against_sales_invoice
-                invoice_numbers.add(invoice_number)
-                invoice_date = frappe.get_value("Sales Invoice", invoice_number, "posting_date")
-                invoice_currency = frappe.get_value("Sales Invoice", invoice_number, "currency")
-                invoice_value = frappe.get_value("Sales Invoice", invoice_number, "grand_total")
-                ewaybill_number = frappe.get_value("Sales Invoice", invoice_number, "ewaybill")
-                if ewaybill_number:
-                    ewaybill_date = frappe.get_value('e-Waybill Log', ewaybill_number, 'created_on')
-                else:
-                    ewaybill_number = ""
-                    ewaybill_date = ""
-                invoice_dates.add(str(invoice_date))
-            item_key = (item.item_name, item.uom, item.gst_hsn_code, item.qty, item.amount)
-            consolidated_items[item_key]["weight"] += item.qty if item.uom == "Kg" else 1
-            consolidated_items[item_key]["amount"] += item.amount
-
-    gst_invoices.append({
-                    "invoice_number": invoice_number,
-                    "invoice_date": str(invoice_date),
-                    "invoice_value": invoice_value,
-                    "ewaybill_number": ewaybill_number,
-                    "ewaybill_date": str(ewaybill_date)
-                })
-    items = [
-        {
-            "description": item_key[0],
-            "origin_country": pickup_country_code,
-            "sku": item_key[1],
-            "hs_code": item_key[2],
-            "variant": "",
-            "quantity": item_key[3],
-            "price": {
-                "amount": item_info["amount"],
-                "currency": invoice_currency
-            },
-            "weight": {
-                "value": item_info["weight"],
-                "unit": "kg"
-            }
-        } for item_key, item_info in consolidated_items.items()
-    ]
-
-    parcels = []
-    for parcel in doc.get("shipment_parcel"):
-        parcel_items = items
-        parcel_order_value = 0
-        if item_data:
-            parcel_items = []
-            for item in item_data[str(parcel.idx)]:
-                item_key = (item["item_name"], item["uom"], item["gst_hsn_code"], item["qty"], item["amount"])
-                parcel_order_value += item["amount"]
-                parcel_items.append({
-                    "description": item["item_name"],
-                    "origin_country": pickup_country_code,
-                    "sku": item["uom"],
-                    "hs_code": item["gst_hsn_code"],
-                    "variant": "",
-                    "quantity": item["qty"],
-                    "price": {
-                        "amount": item["amount"],
-                        "currency": invoice_currency
-                    },
-                    "weight": {
-                        "value": item.get("weight", 0),
-                        "unit": "kg"
-                    }
-                })
-        else:
-            for item in consolidated_items.keys():
-                parcel_order_value += consolidated_items[item]["amount"]
-
-        parcels.append({
-            "description": doc.description_of_content,
-            "box_type": doc.shipment_type,
-            "quantity": parcel.count,
-            "weight": {
-                "value": parcel.weight,
-                "unit": "kg"
-            },
-            "dimension": {
-                "width": parcel.width,
-                "height": parcel.height,
-                "length": parcel.length,
-                "unit": "cm"
-            },
-            "items": parcel_items,
-            "order_value": parcel_order_value
-        })
-        total_order_value += parcel_order_value
-
-    data = {
-        "billing": {
-            "paid_by": "shipper"
-        },
-        "vendor_id": selected_service['vendor_id'],
-        "description": selected_service['description'],
-        "slug": selected_service['slug'],
-        "purpose": doc.fsl_purpose,
-        "order_source": "manual",
-        "parcel_contents": doc.description_of_content,
-        "is_document": False,
-        "service_type": selected_service['selected_service_type'],
-        "charged_weight": {
-            "unit": "KG",
-            "value": charged_weight
-        },
-        "customer_reference": doc.name,
-        "invoice_number": ", ".join(invoice_numbers),
-        "invoice_date": ", ".join(invoice_dates),
-        "is_cod": False,
-        "collect_on_delivery": {"amount": 0, "currency": invoice_currency},
-        "shipment": {
-            "ship_from": {
-                "contact_name": doc.pickup_contact_person,
-                "company_name": doc.pickup_company,
-                "street1": pickup_address.address_line1,
-                "street2": pickup_address.address_line2,
-                "city": pickup_address.city,
-                "state": pickup_address.state,
-                "postal_code": pickup_address.pincode,
-                "phone": pickup_address.phone,
-                "email": pickup_address.email_id,
-                "tax_id": pickup_address.gstin,
-                "country": pickup_country_code,
-                "type": doc.fsl_pickup_type
-            },
-            "ship_to": {
-                "contact_name": doc.delivery_contact_name,
-                "company_name": delivery_address.address_title,
-                "street1": delivery_address.address_line1,
-                "street2": delivery_address.address_line2,
-                "city": delivery_address.city,
-                "state": delivery_address.state,
-                "postal_code": delivery_address.pincode,
-                "phone": delivery_address.phone,
-                "email": delivery_address.email_id,
-                "country": delivery_country_code,
-                "type": doc.fsl_delivery_type
-            },
-            "return_to": {
-                "contact_name": doc.pickup_contact_person,
-                "company_name": doc.pickup_company,
-                "street1": pickup_address.address_line1,
-                "street2": pickup_address.address_line2,
-                "city": pickup_address.city,
-                "state": pickup_address.state,
-                "postal_code": pickup_address.pincode,
-                "phone": pickup_address.phone,
-                "email": pickup_address.email_id,
-                "tax_id": pickup_address.gstin,
-                "country": pickup_country_code,
-                "type": doc.fsl_pickup_type
-            },
-            "is_reverse": False,
-            "is_to_pay": False,
-            "parcels": parcels
-        },
-        "gst_invoices": gst_invoices
-    }
+    if frappe.get_cached_doc('eShipz Settings').enable_async_booking:
+        return queue_booking(doc, "Selected Service", selected_service, item_data)
+    return book_with_service(doc, selected_service, item_data)
 
-    json_data = json.dumps(data, separators=(',', ':'), default=lambda x: str(x).lower() if isinstance(x, bool) else x)
-
-    response = requests.post(url, headers=headers, data=json_data)
-
-    if response.status_code == 200:
-        result = response.json()
-        if 'files' in result['data']:
-            label_url = result['data']['files']['label']['label_meta']['url']
-            awb_number = result['data']['files']['label']['label_meta']['awb']
-            service_provider = result['data']['slug']
-            tracking_status_info = result['data']['status']
-            carrier_service = result['data']['service_type']
-            shipment_id = result['data']['order_id']
-
-            doc.db_set('tracking_url', label_url)
-            doc.db_set('awb_number', awb_number)
-            doc.db_set('status', "Booked")
-            doc.db_set('tracking_status', "In Progress")
-            doc.db_set('service_provider', service_provider)
-            doc.db_set('shipment_id', shipment_id)
-            doc.db_set('tracking_status_info', tracking_status_info)
-            doc.db_set('carrier_service', carrier_service)
-            frappe.db.commit()
-            return {"label_url": label_url, "awb_number": awb_number, "service_provider": service_provider, "tracking_status_info": tracking_status_info, "carrier_service": carrier_service, "shipment_id": shipment_id}
-        else:
-            frappe.throw("Files key not found in API response: " + frappe.as_json(result))
-    else:
-        frappe.throw("Failed to create shipment: " + response.text)
+def book_with_service(doc, selected_service, item_data=None):
+    data = get_shipment_payload(doc, selected_service, item_data)
+    account = route_shipment(doc, selected_service['slug'])
+    response = client.post("/api/v1/create-shipments", data=dump_payload(data), slug=selected_service['slug'], account=account)
+    booking = get_booking_result(response, account)
+    set_booking_result(doc, booking)
+    return booking.as_dict()
 
 @frappe.whitelist()
 def create_rule_based_shipment(docname, item_data=None):
@@ -354,79 +111,60 @@ def create_rule_based_shipment(docname, item_data=None):
     if item_data:
         item_data = json.loads(item_data)
 
-    pickup_address = frappe.get_doc('Address', doc.pickup_address_name)
-    delivery_address = frappe.get_doc('Address', doc.delivery_address_name)
-    
-    def get_country_code(country_name):
-        country = frappe.get_doc('Country', country_name)
-        return country.code.upper()
+    if frappe.get_cached_doc('eShipz Settings').enable_async_booking:
+        return queue_booking(doc, "Rule Based", item_data=item_data)
+    return book_rule_based(doc, item_data)
 
-    pickup_country_code = get_country_code(pickup_address.country)
-    delivery_country_code = get_country_code(delivery_address.country)
+def book_rule_based(doc, item_data=None):
+    data = get_shipment_payload(doc, item_data=item_data)
+    account = route_shipment(doc)
+    response = client.post("/api/v1/create-shipments/rule-based", data=dump_payload(data), account=account)
+    booking = get_booking_result(response, account)
+    set_booking_result(doc, booking)
+    return booking.as_dict()
 
-    api_token = frappe.db.get_single_value('eShipz Settings', 'api_token')
-    if not api_token:
-        frappe.throw("API token not found in eShipz Settings")
+def get_shipment_payload(doc, selected_service=None, item_data=None):
+    """Build the create-shipments payload; without a selected service the
+    payload is the rule-based variant and eShipz allocates the carrier."""
+    pickup_address = get_address_block(doc.pickup_address_name)
+    delivery_address = get_address_block(doc.delivery_address_name)
 
-    url = "https://app.eshipz.com/api/v1/create-shipments/rule-based"
-    headers = {
-        "X-API-TOKEN": api_token,
-        "Content-Type": "application/json"
-    }
+    pickup_country_code = pickup_address["country"]
 
     charged_weight = sum(parcel.weight for parcel in doc.get("shipment_parcel"))
 
-    invoice_numbers = set()
-    invoice_dates = set()
+    if not item_data and doc.get("fsl_parcel_allocation"):
+        item_data = get_parcel_allocation(doc)
+
     consolidated_items = defaultdict(lambda: {"weight": 0, "amount": 0})
-    gst_invoices = []
 
     total_order_value = 0
 
-    for dn in doc.get("shipment_delivery_note"):
-        delivery_note = frappe.get_doc('Delivery Note', dn.delivery_note)
-        for item in delivery_note.items:
-            if item.against_sales_invoice:
-                invoice_number = item.against_sales_invoice
-                invoice_numbers.add(invoice_number)
-                invoice_date = frappe.get_value("Sales Invoice", invoice_number, "posting_date")
-                invoice_currency = frappe.get_value("Sales Invoice", invoice_number, "currency")
-                invoice_value = frappe.get_value("Sales Invoice", invoice_number, "grand_total")
-                ewaybill_number = frappe.get_value("Sales Invoice", invoice_number, "ewaybill")
-                if ewaybill_number:
-                    ewaybill_date = frappe.get_value('e-Waybill Log', ewaybill_number, 'created_on')
-                else:
-                    ewaybill_number = ""
-                    ewaybill_date = ""
-                invoice_dates.add(str(invoice_date))
-            item_key = (item.item_name, item.uom, item.gst_hsn_code, item.qty, item.amount)
-            consolidated_items[item_key]["weight"] += item.qty if item.uom == "Kg" else 1
-            consolidated_items[item_key]["amount"] += item.amount
-
-    gst_invoices.append({
-                    "invoice_number": invoice_number,
-                    "invoice_date": str(invoice_date),
-                    "invoice_value": invoice_value,
-                    "ewaybill_number": ewaybill_number,
-                    "ewaybill_date": str(ewaybill_date)
-                })
+    delivery_notes = load_delivery_notes([dn.delivery_note for dn in doc.get("shipment_delivery_note")])
+    if not delivery_notes.invoices:
+        frappe.throw(f"No Sales Invoice found against the Delivery Notes of Shipment {doc.name}")
+
+    for item in delivery_notes.items:
+        item_key = (item.item_name, item.uom, item.gst_hsn_code, item.qty, item.amount)
+        consolidated_items[item_key]["weight"] += item.qty if item.uom == "Kg" else 1
+        consolidated_items[item_key]["amount"] += item.amount
+
+    invoice_numbers = list(delivery_notes.invoices)
+    invoice_dates = list(dict.fromkeys(str(invoice.posting_date) for invoice in delivery_notes.invoices.values()))
+    invoice_currency = delivery_notes.invoices[invoice_numbers[-1]].currency
+
+    gst_invoices = [
+        GstInvoice(
+            invoice_number=invoice.name,
+            invoice_date=str(invoice.posting_date),
+            invoice_value=invoice.grand_total,
+            ewaybill_number=invoice.ewaybill or "",
+            ewaybill_date=str(invoice.ewaybill_date or "")
+        ) for invoice in delivery_notes.invoices.values()
+    ]
     items = [
-        {
-            "description": item_key[0],
-            "origin_country": pickup_country_code,
-            "sku": item_key[1],
-            "hs_code": item_key[2],
-            "variant": "",
-            "quantity": item_key[3],
-            "price": {
-                "amount": item_info["amount"],
-                "currency": invoice_currency
-            },
-            "weight": {
-                "value": item_info["weight"],
-                "unit": "kg"
-            }
-        } for item_key, item_info in consolidated_items.items()
+        get_item(item_key[0], item_key[1], item_key[2], item_key[3], item_info["amount"], item_info["weight"], pickup_country_code, invoice_currency)
+        for item_key, item_info in consolidated_items.items()
     ]
 
     parcels = []
@@ -436,263 +174,284 @@ def create_rule_based_shipment(docname, item_data=None):
         if item_data:
             parcel_items = []
             for item in item_data[str(parcel.idx)]:
-                item_key = (item["item_name"], item["uom"], item["gst_hsn_code"], item["qty"], item["amount"])
                 parcel_order_value += item["amount"]
-                parcel_items.append({
-                    "description": item["item_name"],
-                    "origin_country": pickup_country_code,
-                    "sku": item["uom"],
-                    "hs_code": item["gst_hsn_code"],
-                    "variant": "",
-                    "quantity": item["qty"],
-                    "price": {
-                        "amount": item["amount"],
-                        "currency": invoice_currency
-                    },
-                    "weight": {
-                        "value": item.get("weight", 0),
-                        "unit": "kg"
-                    }
-                })
+                parcel_items.append(get_item(
+                    item["item_name"], item["uom"], item["gst_hsn_code"], item["qty"], item["amount"], item.get("weight", 0),
+                    pickup_country_code, invoice_currency
+                ))
         else:
             for item in consolidated_items.keys():
                 parcel_order_value += consolidated_items[item]["amount"]
 
-        parcels.append({
-            "description": doc.description_of_content,
-            "box_type": doc.shipment_type,
-            "quantity": parcel.count,
-            "weight": {
-                "value": parcel.weight,
-                "unit": "kg"
-            },
-            "dimension": {
-                "width": parcel.width,
-                "height": parcel.height,
-                "length": parcel.length,
-                "unit": "cm"
-            },
-            "items": parcel_items,
-            "order_value": parcel_order_value
-        })
+        parcels.append(Parcel(
+            description=doc.description_of_content,
+            box_type=doc.shipment_type,
+            quantity=parcel.count,
+            weight=Weight(parcel.weight),
+            dimension=Dimension(parcel.width, parcel.height, parcel.length),
+            items=parcel_items,
+            order_value=parcel_order_value
+        ))
         total_order_value += parcel_order_value
 
-    data = {
-        "billing": {
-            "paid_by": "shipper"
-        },
-        "vendor_id": None,
-        "description": "Bluedart",
-        "slug": None,
-        "purpose": doc.fsl_purpose,
-        "order_source": "manual",
-        "parcel_contents": doc.description_of_content,
-        "is_document": False,
-        "service_type": None,
-        "charged_weight": {
-            "unit": "KG",
-            "value": charged_weight
-        },
-        "customer_reference": doc.name,
-        "invoice_number": ", ".join(invoice_numbers),
-        "invoice_date": ", ".join(invoice_dates),
-        "is_cod": False,
-        "collect_on_delivery": {"amount": 0, "currency": invoice_currency},
-        "shipment": {
-            "ship_from": {
-                "contact_name": doc.pickup_contact_person,
-                "company_name": doc.pickup_company,
-                "street1": pickup_address.address_line1,
-                "street2": pickup_address.address_line2,
-                "city": pickup_address.city,
-                "state": pickup_address.state,
-                "postal_code": pickup_address.pincode,
-                "phone": pickup_address.phone,
-                "email": pickup_address.email_id,
-                "tax_id": pickup_address.gstin,
-                "country": pickup_country_code,
-                "type": doc.fsl_pickup_type
-            },
-            "ship_to": {
-                "contact_name": doc.delivery_contact_name,
-                "company_name": delivery_address.address_title,
-                "street1": delivery_address.address_line1,
-                "street2": delivery_address.address_line2,
-                "city": delivery_address.city,
-                "state": delivery_address.state,
-                "postal_code": delivery_address.pincode,
-                "phone": delivery_address.phone,
-                "email": delivery_address.email_id,
-                "country": delivery_country_code,
-                "type": doc.fsl_delivery_type
-            },
-            "return_to": {
-                "contact_name": doc.pickup_contact_person,
-                "company_name": doc.pickup_company,
-                "street1": pickup_address.address_line1,
-                "street2": pickup_address.address_line2,
-                "city": pickup_address.city,
-                "state": pickup_address.state,
-                "postal_code": pickup_address.pincode,
-                "phone": pickup_address.phone,
-                "email": pickup_address.email_id,
-                "tax_id": pickup_address.gstin,
-                "country": pickup_country_code,
-                "type": doc.fsl_pickup_type
-            },
-            "is_reverse": False,
-            "is_to_pay": False,
-            "parcels": parcels
-        },
-        "gst_invoices": gst_invoices
-    }
+    ship_from = Address.from_block(
+        pickup_address, SHIPPER_ADDRESS_FIELDS, doc.pickup_contact_person, doc.pickup_company, doc.fsl_pickup_type
+    )
+    data = ShipmentRequest(
+        purpose=doc.fsl_purpose,
+        parcel_contents=doc.description_of_content,
+        charged_weight=Weight(charged_weight, "KG"),
+        customer_reference=doc.name,
+        invoice_number=", ".join(invoice_numbers),
+        invoice_date=", ".join(invoice_dates),
+        collect_on_delivery=Money(0, invoice_currency),
+        shipment=Shipment(
+            ship_from=ship_from,
+            ship_to=Address.from_block(
+                delivery_address, RECEIVER_ADDRESS_FIELDS, doc.delivery_contact_name, delivery_address["address_title"], doc.fsl_delivery_type
+            ),
+            return_to=ship_from,
+            is_to_pay=False,
+            parcels=parcels
+        ),
+        gst_invoices=gst_invoices
+    )
+    if selected_service:
+        data.use_service(selected_service)
+
+    return data
+
+def get_item(item_name, uom, hsn_code, qty, amount, weight, origin_country, currency):
+    return Item(
+        description=item_name,
+        origin_country=origin_country,
+        sku=uom,
+        hs_code=hsn_code,
+        variant="",
+        quantity=qty,
+        price=Money(amount, currency),
+        weight=Weight(weight)
+    )
 
-    json_data = json.dumps(data, separators=(',', ':'), default=lambda x: str(x).lower() if isinstance(x, bool) else x)
+def get_parcel_allocation(doc):
+    """Items per parcel saved by the automatic packing of the Shipment."""
+    item_data = json.loads(doc.fsl_parcel_allocation)
+    if set(item_data) != {str(parcel.idx) for parcel in doc.get("shipment_parcel")}:
+        frappe.throw(f"The parcels of Shipment {doc.name} changed after they were packed, please pack them again")
+    return item_data
 
-    response = requests.post(url, headers=headers, data=json_data)
+def dump_payload(data):
+    return codec.dumps(data)
 
+def get_booking_result(response, account=None):
     if response.status_code == 200:
-        result = response.json()
-        if 'files' in result['data']:
-            label_url = result['data']['files']['label']['label_meta']['url']
-            awb_number = result['data']['files']['label']['label_meta']['awb']
-            service_provider = result['data']['slug']
-            tracking_status_info = result['data']['status']
-            carrier_service = result['data']['service_type']
-            shipment_id = result['data']['order_id']
-
-            doc.db_set('tracking_url', label_url)
-            doc.db_set('awb_number', awb_number)
-            doc.db_set('status', "Booked")
-            doc.db_set('tracking_status', "In Progress")
-            doc.db_set('service_provider', service_provider)
-            doc.db_set('shipment_id', shipment_id)
-            doc.db_set('tracking_status_info', tracking_status_info)
-            doc.db_set('carrier_service', carrier_service)
-            frappe.db.commit()
-            return {"label_url": label_url, "awb_number": awb_number, "service_provider": service_provider, "tracking_status_info": tracking_status_info, "carrier_service": carrier_service, "shipment_id": shipment_id}
-        else:
-            frappe.throw("Files key not found in API response: " + frappe.as_json(result))
+        return Booking.from_response(read_response(response.text), account)
     else:
         frappe.throw("Failed to create shipment: " + response.text)
 
+def get_booking_values(booking):
+    return {
+        "tracking_url": booking.label_url,
+        "awb_number": booking.awb_number,
+        "status": "Booked",
+        "tracking_status": "In Progress",
+        "service_provider": booking.service_provider,
+        "shipment_id": booking.shipment_id,
+        "tracking_status_info": booking.tracking_status_info,
+        "carrier_service": booking.carrier_service,
+        "fsl_eshipz_account": booking.account
+    }
+
+def set_booking_result(doc, booking):
+    write_shipment(doc.name, get_booking_values(booking))
+    enqueue_label_download(doc.name, booking.label_url)
+
+CANCELLED_VALUES = {
+    "tracking_url": "",
+    "fsl_label": "",
+    "status": "Cancelled",
+    "tracking_status": "",
+    "service_provider": "",
+    "tracking_status_info": "Cancelled",
+    "carrier_service": ""
+}
+
 @frappe.whitelist()
 def cancel_shipment(docname):
     doc = frappe.get_doc('Shipment', docname)
-    
-    api_token = frappe.db.get_single_value('eShipz Settings', 'api_token')
-    if not api_token:
-        frappe.throw("API token not found in eShipz Settings")
-
-    url = "https://app.eshipz.com/api/v1/cancel"
-    headers = {
-        "X-API-TOKEN": api_token,
-        "Content-Type": "application/json"
-    }
 
-    data = {
-        "order_id" :[
-            doc.shipment_id,
-            ]
-    }
+    # Cancelled, like tracked, with the account that booked it
+    errors = cancel_orders([doc.shipment_id], doc.service_provider, doc.fsl_eshipz_account)
+    if errors:
+        frappe.throw("Failed to cancel shipment: " + errors[doc.shipment_id])
 
-    response = requests.post(url, headers=headers, json=data)
+    write_shipment(doc.name, CANCELLED_VALUES)
 
-    if response.status_code == 200:
-        doc.db_set('tracking_url', "")
-        doc.db_set('status', "Cancelled")
-        doc.db_set('tracking_status', "")
-        doc.db_set('service_provider', "")
-        doc.db_set('tracking_status_info', "Cancelled")
-        doc.db_set('carrier_service', "")
-        frappe.db.commit()
-    else:
-        frappe.throw("Failed to create shipment: " + response.text)
+    from eshipz.custom.shipment.webhook import forget_awb
+    forget_awb(doc.awb_number)
+
+def cancel_orders(order_ids, slug=None, account=None):
+    """Cancel the eShipz `order_ids` in one call and return the error of
+    each order eShipz reports it could not cancel."""
+    data = CancelRequest(order_id=list(order_ids))
+
+    response = client.post("/api/v1/cancel", data=dump_payload(data), slug=slug, account=account)
+
+    if response.status_code >= 500:
+        frappe.throw("eShipz failed to cancel shipments: " + response.text, exc=client.eShipzUnavailableError)
+    if response.status_code != 200:
+        frappe.throw("Failed to cancel shipment: " + response.text)
+
+    try:
+        result = codec.loads(response.text)
+    except ValueError:
+        result = None
+    return get_cancel_errors(result, order_ids)
+
+def get_cancel_errors(result, order_ids):
+    """Errors by order id from a cancel response. A list under `data` holds
+    one outcome per order id; any other successful response cancelled them
+    all."""
+    data = result.get('data') if isinstance(result, dict) else None
+    if not isinstance(data, list):
+        return {}
+
+    errors = dict.fromkeys(order_ids, "No outcome returned by eShipz")
+    for outcome in data:
+        if isinstance(outcome, dict) and outcome.get('order_id') in errors:
+            failed = outcome.get('success') is False or outcome.get('error')
+            errors[outcome['order_id']] = (outcome.get('error') or outcome.get('message') or "Not cancelled by eShipz") if failed else None
+
+    return {order_id: error for order_id, error in errors.items() if error}
 
 @frappe.whitelist()
 def update_status(docname):
 
     doc = frappe.get_doc('Shipment', docname)
 
-    api_token = frappe.db.get_single_value('eShipz Settings', 'api_token')
-    if not api_token:
-        frappe.throw("API token not found in eShipz Settings")
+    tracking_data = fetch_tracking(doc.awb_number, doc.service_provider, doc.fsl_eshipz_account)
+    values, summary, checkpoints = get_tracking_update(tracking_data, doc.fsl_last_checkpoint_date)
+
+    writer = ShipmentWriter()
+    writer.set(doc.name, values)
+    writer.add_checkpoints(doc.name, doc.awb_number, checkpoints)
+    writer.flush()
+
+    return summary
+
+def fetch_tracking(awb_number, slug=None, account=None):
+    for tracking_data in fetch_tracking_records([awb_number], slug, account):
+        return tracking_data
+
+    frappe.throw("API response is empty", exc=eShipzResponseError)
+
+def fetch_tracking_records(awb_numbers, slug=None, account=None):
+    """Yield the tracking records of `awb_numbers`, asked for in one call.
+
+    The response is parsed as it streams in, one record at a time, so a
+    batch with long checkpoint histories is never held in memory at once.
+    """
+    data = TrackingRequest(track_id=awb_numbers[0] if len(awb_numbers) == 1 else awb_numbers)
+
+    response = client.post("/api/v2/trackings", data=dump_payload(data), idempotent=True, slug=slug, stream=True, account=account)
+
+    with response:
+        if response.status_code != 200:
+            frappe.throw("Failed to retrieve shipment status: " + response.text)
+
+        response.raw.decode_content = True
+        try:
+            for tracking_data in codec.iter_array(response.raw):
+                if not isinstance(tracking_data, dict) or not isinstance(tracking_data.get('checkpoints'), list):
+                    frappe.throw("Invalid tracking data format: " + frappe.as_json(tracking_data), exc=eShipzResponseError)
+                yield tracking_data
+        except ValueError as e:
+            frappe.throw(f"Invalid tracking response: {e}", exc=eShipzResponseError)
+
+def get_tracking_awb(tracking_data):
+    """AWB a tracking record belongs to."""
+    for key in ('awb_number', 'awb', 'tracking_number', 'track_id'):
+        if tracking_data.get(key):
+            return str(tracking_data[key])
+
+def get_tracking_update(tracking_data, last_checkpoint_date=None):
+    """Map an eShipz tracking record to Shipment field values.
+
+    Returns the values to write, the summary returned to the form and the
+    checkpoints newer than `last_checkpoint_date` as (date, checkpoint).
+    """
+    values = {}
+
+    checkpoints = tracking_data.get('checkpoints', [])
+    delivery_date = tracking_data.get('delivery_date')
+    expected_delivery_date = tracking_data.get('expected_delivery_date')
+    shipment_status = tracking_data.get('shipment_status')
+    tag = tracking_data.get('tag')
+
+    latest_city = None
+    latest_remark = None
+    latest_tag = None
+
+    watermark = get_datetime(last_checkpoint_date) if last_checkpoint_date else None
+    latest_checkpoint, latest_checkpoint_date, new_checkpoints = get_new_checkpoints(checkpoints, watermark)
+
+    if latest_checkpoint:
+        latest_city = latest_checkpoint.get('city')
+        latest_remark = latest_checkpoint.get('remark')
+        latest_tag = latest_checkpoint.get('tag')
+
+        values['fsl_latest_location'] = latest_city
+        values['fsl_last_checkpoint_date'] = latest_checkpoint_date.strftime("%Y-%m-%d %H:%M:%S")
+
+    if tag == "Delivered":
+        values['status'] = "Completed"
+        values['tracking_status'] = "Delivered"
+    elif tag == "InTransit":
+        values['tracking_status'] = "In Progress"
+
+    delivery_date_erp = None
+    if delivery_date:
+        delivery_date_erp = parse_tracking_date(delivery_date).strftime("%Y-%m-%d %H:%M:%S")
+        values['fsl_delivery_date'] = delivery_date_erp
+
+    expected_delivery_date_erp = None
+    if expected_delivery_date:
+        expected_delivery_date_erp = parse_tracking_date(expected_delivery_date).strftime("%Y-%m-%d %H:%M:%S")
+        values['fsl_expected_delivery_date'] = expected_delivery_date_erp
+
+    values['fsl_last_update_received'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    values['tracking_status_info'] = latest_remark
+    values['fsl_next_tracking_update'] = None if tag == "Delivered" else get_next_tracking_update(
+        expected_delivery_date_erp, latest_checkpoint_date
+    )
 
-    url = "https://app.eshipz.com/api/v2/trackings"
-    headers = {
-        "X-API-TOKEN": api_token,
-        "Content-Type": "application/json"
+    summary = {
+        "latest_checkpoint": {
+            "fsl_latest_location": latest_city,
+            "remark": latest_remark,
+            "tag": latest_tag
+        },
+        "tracking_status_info": latest_remark,
+        "fsl_delivery_date": delivery_date_erp,
+        "fsl_expected_delivery_date": expected_delivery_date_erp,
+        "shipment_status": shipment_status,
+        "tag": tag,
     }
+    return values, summary, new_checkpoints
 
-    data = {
-        "track_id": doc.awb_number
-    }
+def get_next_tracking_update(expected_delivery_date=None, last_checkpoint_date=None):
+    """Poll often close to the expected delivery, rarely for idle shipments."""
+    settings = frappe.get_cached_doc('eShipz Settings')
+    now = now_datetime()
 
-    response = requests.post(url, headers=headers, json=data)
+    # eShipz dates are GMT, now_datetime is in the system time zone
+    interval = settings.tracking_interval or 120
+    if expected_delivery_date and to_system_datetime(expected_delivery_date) - now <= timedelta(days=1):
+        interval = settings.tracking_interval_near_delivery or 30
+    elif last_checkpoint_date and now - to_system_datetime(last_checkpoint_date) >= timedelta(days=settings.tracking_idle_days or 3):
+        interval = settings.tracking_interval_idle or 360
 
-    if response.status_code == 200:
-        result = response.json()
-        if not result:
-            frappe.throw("API response is empty")
-
-        if not isinstance(result, list):
-            frappe.throw("API response format is not a list: " + frappe.as_json(result))
-
-        tracking_data = result[0] if result else None
-        if not tracking_data or 'checkpoints' not in tracking_data:
-            frappe.throw("Invalid tracking data format: " + frappe.as_json(result))
-
-        checkpoints = tracking_data.get('checkpoints', [])
-        delivery_date = tracking_data.get('delivery_date')
-        expected_delivery_date = tracking_data.get('expected_delivery_date')
-        shipment_status = tracking_data.get('shipment_status')
-        tag = tracking_data.get('tag')
-
-        latest_city = None
-        latest_remark = None
-        latest_tag = None
-
-        if checkpoints:
-            latest_checkpoint = sorted(checkpoints, key=lambda x: datetime.strptime(x['date'], "%a, %d %b %Y %H:%M:%S %Z"), reverse=True)[0]
-            latest_city = latest_checkpoint.get('city')
-            latest_remark = latest_checkpoint.get('remark')
-            latest_tag = latest_checkpoint.get('tag')
-
-            doc.db_set('fsl_latest_location', latest_city)
-
-        if tag == "Delivered":
-            doc.db_set('status', "Completed")
-            doc.db_set('tracking_status', "Delivered")
-        elif tag == "InTransit":
-            doc.db_set('tracking_status', "In Progress")
-
-        if delivery_date:
-            delivery_date_erp = datetime.strptime(delivery_date, "%a, %d %b %Y %H:%M:%S %Z").strftime("%Y-%m-%d %H:%M:%S")
-            doc.db_set('fsl_delivery_date', delivery_date_erp)
-
-        if expected_delivery_date:
-            expected_delivery_date_erp = datetime.strptime(expected_delivery_date, "%a, %d %b %Y %H:%M:%S %Z").strftime("%Y-%m-%d %H:%M:%S")
-            doc.db_set('fsl_expected_delivery_date', expected_delivery_date_erp)
-
-        last_update_received = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        doc.db_set('fsl_last_update_received', last_update_received)
-        doc.db_set('tracking_status_info', latest_remark)
-        frappe.db.commit()
-
-        return {
-            "latest_checkpoint": {
-                "fsl_latest_location": latest_city,
-                "remark": latest_remark,
-                "tag": latest_tag
-            },
-            "tracking_status_info": latest_remark,
-            "fsl_delivery_date": delivery_date_erp if delivery_date else None,
-            "fsl_expected_delivery_date": expected_delivery_date_erp if expected_delivery_date else None,
-            "shipment_status": shipment_status,
-            "tag": tag,
-        }
-    else:
-        frappe.throw("Failed to retrieve shipment status: " + response.text)
+    return (now + timedelta(minutes=interval)).strftime("%Y-%m-%d %H:%M:%S")
 
 @frappe.whitelist()
 def get_delivery_note_items(delivery_note):
@@ -704,3 +463,20 @@ def get_delivery_note_items(delivery_note):
         fields=['item_name', 'qty', 'uom', 'gst_hsn_code', 'amount']
     )
     return items
+
+@frappe.whitelist()
+def get_delivery_notes_items(delivery_notes):
+    """Items of several Delivery Notes for the parcel selection dialog, with
+    identical lines (same item, qty, uom, HSN code and amount) listed once."""
+    delivery_notes = list(dict.fromkeys(frappe.parse_json(delivery_notes)))
+
+    permitted = set(frappe.get_list('Delivery Note', filters={'name': ('in', delivery_notes)}, pluck='name'))
+    if len(permitted) != len(delivery_notes):
+        raise frappe.PermissionError
+
+    unique_items = {}
+    for item in load_delivery_note_items(delivery_notes, ITEM_FIELDS):
+        key = tuple(item[field] for field in ITEM_FIELDS)
+        unique_items.setdefault(key, {field: item[field] for field in ITEM_FIELDS})
+
+    return list(unique_items.values())
@@ -0,0 +1,199 @@
+// Copyright (c) 2024, Frutter Software Labs Private Limited and contributors
+// For license information, please see license.txt
+
+frappe.listview_settings['Shipment'] = frappe.listview_settings['Shipment'] || {};
+
+(function(settings) {
+    let onload = settings.onload;
+
+    settings.onload = function(listview) {
+	if (onload) {
+	    onload(listview);
+	}
+
+	listview.page.add_action_item(__('Book with eShipz'), function() {
+	    let docnames = listview.get_checked_items(true);
+	    show_bulk_booking_dialog(docnames);
+	});
+
+	listview.page.add_action_item(__('Cancel with eShipz'), function() {
+	    let docnames = listview.get_checked_items(true);
+	    frappe.confirm(__('Cancel {0} Shipments with eShipz?', [docnames.length]), function() {
+		frappe.call({
+		    method: 'eshipz.custom.shipment.bulk.bulk_cancel_shipments',
+		    args: { docnames: docnames },
+		    callback: function() {
+			frappe.show_alert({ message: __('Cancellation queued for {0} Shipments', [docnames.length]), indicator: 'blue' });
+		    }
+		});
+	    });
+	});
+
+	listview.page.add_action_item(__('Print eShipz Labels'), function() {
+	    frappe.call({
+		method: 'eshipz.custom.shipment.labels.print_labels',
+		args: { docnames: listview.get_checked_items(true) },
+		callback: function() {
+		    frappe.show_alert({ message: __('Merging labels, the PDF will open when ready'), indicator: 'blue' });
+		}
+	    });
+	});
+
+	listview.page.add_action_item(__('Compare eShipz Rates'), function() {
+	    let docnames = listview.get_checked_items(true);
+	    frappe.call({
+		method: 'eshipz.custom.shipment.rate_fanout.quote_shipments',
+		args: { docnames: docnames },
+		callback: function(r) {
+		    if (r.message) {
+			show_rate_comparison_dialog(r.message, docnames.length);
+		    }
+		}
+	    });
+	});
+    };
+})(frappe.listview_settings['Shipment']);
+
+function show_bulk_booking_dialog(docnames) {
+    let d = new frappe.ui.Dialog({
+	title: __('Book {0} Shipments with eShipz', [docnames.length]),
+	fields: [
+	    {
+		fieldname: 'service_selection',
+		fieldtype: 'Select',
+		label: __('Service'),
+		options: ['Rule Based', 'Selection Policy', 'Fixed Service'],
+		default: 'Rule Based',
+		description: __('Rule Based lets eShipz allocate the carrier; Selection Policy picks from each Shipment\'s rates as set in eShipz Settings')
+	    },
+	    { fieldname: 'vendor_id', fieldtype: 'Data', label: __('Vendor ID'), depends_on: "eval:doc.service_selection == 'Fixed Service'", mandatory_depends_on: "eval:doc.service_selection == 'Fixed Service'" },
+	    { fieldname: 'slug', fieldtype: 'Data', label: __('Slug'), depends_on: "eval:doc.service_selection == 'Fixed Service'", mandatory_depends_on: "eval:doc.service_selection == 'Fixed Service'" },
+	    { fieldname: 'service_type', fieldtype: 'Data', label: __('Service Type'), depends_on: "eval:doc.service_selection == 'Fixed Service'", mandatory_depends_on: "eval:doc.service_selection == 'Fixed Service'" },
+	    { fieldname: 'description', fieldtype: 'Data', label: __('Description'), depends_on: "eval:doc.service_selection == 'Fixed Service'" }
+	],
+	primary_action_label: __('Book'),
+	primary_action(values) {
+	    let selected_service = null;
+	    if (values.service_selection === 'Fixed Service') {
+		selected_service = {
+		    vendor_id: values.vendor_id,
+		    slug: values.slug,
+		    description: values.description || values.slug,
+		    selected_service_type: values.service_type
+		};
+	    }
+
+	    frappe.call({
+		method: 'eshipz.custom.shipment.bulk.bulk_create_shipments',
+		args: {
+		    docnames: docnames,
+		    selected_service: selected_service,
+		    auto_select: values.service_selection === 'Selection Policy' ? 1 : 0
+		},
+		callback: function() {
+		    frappe.show_alert({ message: __('Booking queued for {0} Shipments', [docnames.length]), indicator: 'blue' });
+		}
+	    });
+	    d.hide();
+	}
+    });
+    d.show();
+}
+
+function show_rate_comparison_dialog(fanout_id, total) {
+    let d = new frappe.ui.Dialog({
+	title: __('eShipz Rates'),
+	size: 'large',
+	fields: [{ fieldname: 'rates_html', fieldtype: 'HTML' }]
+    });
+    let $wrapper = d.fields_dict.rates_html.$wrapper;
+    $wrapper.html(`
+	<p class="text-muted rate-progress">${__('Received {0} of {1}', [0, total])}</p>
+	<table class="table table-bordered">
+	    <thead class="grid-heading-row">
+		<tr><th>${__('Shipment')}</th><th>${__('Services')}</th></tr>
+	    </thead>
+	    <tbody></tbody>
+	</table>
+    `);
+
+    let received = 0;
+    let on_quote = function(result) {
+	if (result.fanout_id !== fanout_id) {
+	    return;
+	}
+	received++;
+	let services = result.error
+	    ? `<span class="text-danger">${frappe.utils.escape_html(result.error)}</span>`
+	    : (result.rates || []).map(service =>
+		`${frappe.utils.escape_html(service.description || '')} (${frappe.utils.escape_html(service.slug || '')})`
+	    ).join('<br>') || __('No Services Available');
+	$wrapper.find('tbody').append(`<tr><td>${frappe.utils.get_form_link('Shipment', result.shipment, true)}</td><td>${services}</td></tr>`);
+	$wrapper.find('.rate-progress').text(__('Received {0} of {1}', [received, total]));
+    };
+
+    frappe.realtime.on('eshipz_rate_quote', on_quote);
+    d.onhide = function() {
+	frappe.realtime.off('eshipz_rate_quote', on_quote);
+    };
+    d.show();
+}
+
+frappe.realtime.on('eshipz_labels_ready', function(data) {
+    if (data.file_urls.length == 1) {
+	window.open(data.file_urls[0], '_blank');
+    } else if (data.file_urls.length) {
+	// Large batches are merged in parts; popups would be blocked after the first
+	frappe.msgprint({
+	    title: __('Labels ready'),
+	    message: data.file_urls.map((file_url, i) =>
+		`<a href="${encodeURI(file_url)}" target="_blank">${__('Labels part {0}', [i + 1])}</a>`
+	    ).join('<br>')
+	});
+    }
+    if (data.missing.length) {
+	frappe.msgprint({
+	    title: __('Labels not available'),
+	    indicator: 'orange',
+	    message: data.missing.map(name => frappe.utils.escape_html(name)).join(', ')
+	});
+    }
+});
+
+frappe.realtime.on('eshipz_bulk_booking', function(results) {
+    let failed = Object.keys(results).filter(name => !results[name].success);
+    let booked = Object.keys(results).length - failed.length;
+
+    let message = __('{0} Shipments booked', [booked]);
+    if (failed.length) {
+	message += '<br><br>' + failed.map(name => `<b>${frappe.utils.escape_html(name)}</b>: ${frappe.utils.escape_html(results[name].error)}`).join('<br>');
+    }
+    frappe.msgprint({
+	title: __('eShipz Bulk Booking'),
+	indicator: failed.length ? 'orange' : 'green',
+	message: message
+    });
+
+    if (cur_list && cur_list.doctype === 'Shipment') {
+	cur_list.refresh();
+    }
+});
+
+frappe.realtime.on('eshipz_bulk_cancel', function(results) {
+    let failed = Object.keys(results).filter(name => !results[name].success);
+    let cancelled = Object.keys(results).length - failed.length;
+
+    let message = __('{0} Shipments cancelled', [cancelled]);
+    if (failed.length) {
+	message += '<br><br>' + failed.map(name => `<b>${frappe.utils.escape_html(name)}</b>: ${frappe.utils.escape_html(results[name].error)}`).join('<br>');
+    }
+    frappe.msgprint({
+	title: __('eShipz Bulk Cancel'),
+	indicator: failed.length ? 'orange' : 'green',
+	message: message
+    });
+
+    if (cur_list && cur_list.doctype === 'Shipment') {
+	cur_list.refresh();
+    }
+});
@@ -0,0 +1,194 @@
+# Copyright (c) 2024, Frutter Software Labs Private Limited and contributors
+# For license information, please see license.txt
+
+"""Pre-aggregated Shipment counts for dashboards.
+
+eShipz Shipment Summary holds one row per (pickup date, carrier, status,
+tracking status) with the number of submitted Shipments in it, so number
+cards and charts read a few hundred rows instead of counting Shipments.
+Rows are kept up to date by deltas: `ShipmentWriter.flush` moves a Shipment
+from its old bucket to its new one in the transaction that changes it, and
+submit / cancel add and remove it. `reconcile` recounts from Shipment on a
+schedule and corrects any drift.
+"""
+
+from collections import Counter
+import hashlib
+
+import frappe
+from frappe.utils import add_days, getdate, now, today
+
+DOCTYPE = "eShipz Shipment Summary"
+
+KEY_FIELDS = ("pickup_date", "service_provider", "status", "tracking_status")
+
+# Fields ShipmentWriter changes that move a Shipment to another bucket
+TRACKED_FIELDS = frozenset(("service_provider", "status", "tracking_status"))
+
+# Days of pickup dates recounted by the daily pass; the weekly pass recounts all
+RECONCILE_DAYS = 30
+
+NUMBER_CARDS = (
+    ("eShipz Shipments Booked", [["status", "=", "Booked"]]),
+    ("eShipz Shipments Delivered", [["tracking_status", "=", "Delivered"]]),
+    ("eShipz Shipments Cancelled", [["status", "=", "Cancelled"]]),
+)
+CARRIER_CHART = "eShipz Shipments by Carrier"
+
+
+def get_key(row):
+    return (
+        getdate(row.get("pickup_date")) if row.get("pickup_date") else None,
+        row.get("service_provider") or "",
+        row.get("status") or "",
+        row.get("tracking_status") or "",
+    )
+
+
+def get_summary_name(key):
+    return hashlib.sha1("|".join(str(value or "") for value in key).encode()).hexdigest()[:20]
+
+
+def lock_shipments(docnames):
+    """Current bucket of the submitted Shipments in `docnames`, locking
+    their rows until commit so concurrent writers move each one once."""
+    return frappe.get_all(
+        "Shipment",
+        filters={"name": ("in", docnames), "docstatus": 1},
+        fields=["name", *KEY_FIELDS],
+        order_by="name",
+        for_update=True,
+    )
+
+
+def get_deltas(rows, changes):
+    """Bucket deltas for moving `rows` (from `lock_shipments`) to the values
+    in `changes` ({docname: values})."""
+    deltas = Counter()
+    for row in rows:
+        old = get_key(row)
+        new = get_key({**row, **changes[row.name]})
+        if old != new:
+            deltas[old] -= 1
+            deltas[new] += 1
+    return deltas
+
+
+def apply_deltas(deltas):
+    """Add each delta to the count of its bucket, creating missing rows.
+    Upserts are atomic, so concurrent transactions never lose a count."""
+    timestamp = now()
+    user = frappe.session.user
+    for key, delta in sorted(deltas.items(), key=lambda item: get_summary_name(item[0])):
+        if not delta:
+            continue
+        values = (get_summary_name(key), timestamp, timestamp, user, user, *key, delta)
+        if frappe.db.db_type == "postgres":
+            frappe.db.sql(
+                """insert into "tabeShipz Shipment Summary"
+                    (name, creation, modified, modified_by, owner, pickup_date, service_provider, status, tracking_status, shipments)
+                values (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                on conflict (name) do update
+                set shipments = "tabeShipz Shipment Summary".shipments + excluded.shipments, modified = excluded.modified""",
+                values,
+            )
+        else:
+            frappe.db.sql(
+                """insert into `tabeShipz Shipment Summary`
+                    (name, creation, modified, modified_by, owner, pickup_date, service_provider, status, tracking_status, shipments)
+                values (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                on duplicate key update shipments = shipments + values(shipments), modified = values(modified)""",
+                values,
+            )
+
+
+def on_submit(doc, method=None):
+    apply_deltas({get_key(doc): 1})
+
+
+def before_cancel(doc, method=None):
+    # Still in its submitted bucket here; cancelled Shipments are not counted
+    apply_deltas({get_key(doc): -1})
+
+
+def reconcile(days=RECONCILE_DAYS):
+    """Recount submitted Shipments with a pickup date in the last `days`
+    days (all when 0) and correct the summary rows that drifted.
+
+    Corrections are applied as deltas, so counts moved by writers while the
+    recount runs are kept. Returns the number of buckets corrected.
+    """
+    shipment_filters = {"docstatus": 1}
+    summary_filters = {}
+    if days:
+        since = add_days(today(), -days)
+        shipment_filters["pickup_date"] = (">=", since)
+        summary_filters["pickup_date"] = (">=", since)
+
+    counts = {
+        get_key(row): row.shipments
+        for row in frappe.get_all(
+            "Shipment",
+            filters=shipment_filters,
+            fields=[*KEY_FIELDS, "count(name) as shipments"],
+            group_by=", ".join(KEY_FIELDS),
+        )
+    }
+    stored = {
+        get_key(row): row.shipments
+        for row in frappe.get_all(DOCTYPE, filters=summary_filters, fields=[*KEY_FIELDS, "shipments"])
+    }
+
+    deltas = Counter({key: counts.get(key, 0) - stored.get(key, 0) for key in counts.keys() | stored.keys()})
+    apply_deltas(deltas)
+    frappe.db.delete(DOCTYPE, {"shipments": 0})
+    frappe.db.commit()
+    return sum(1 for delta in deltas.values() if delta)
+
+
+def reconcile_recent():
+    """Scheduled daily."""
+    reconcile()
+
+
+def reconcile_all():
+    """Scheduled weekly, and run once to fill the summary on install."""
+    reconcile(days=0)
+
+
+def create_dashboard():
+    """Number cards and a chart over the summary, for the Shipment workspace."""
+    for label, filters in NUMBER_CARDS:
+        if frappe.db.exists("Number Card", label):
+            continue
+        frappe.get_doc(
+            {
+                "doctype": "Number Card",
+                "name": label,
+                "label": label,
+                "type": "Document Type",
+                "document_type": DOCTYPE,
+                "function": "Sum",
+                "aggregate_function_based_on": "shipments",
+                "filters_json": frappe.as_json([[DOCTYPE, *condition, False] for condition in filters]),
+                "is_public": 1,
+                "show_percentage_stats": 0,
+            }
+        ).insert(ignore_permissions=True)
+
+    if not frappe.db.exists("Dashboard Chart", CARRIER_CHART):
+        frappe.get_doc(
+            {
+                "doctype": "Dashboard Chart",
+                "chart_name": CARRIER_CHART,
+                "chart_type": "Group By",
+                "document_type": DOCTYPE,
+                "group_by_type": "Sum",
+                "group_by_based_on": "service_provider",
+                "aggregate_function_based_on": "shipments",
+                "type": "Donut",
+                "filters_json": frappe.as_json([[DOCTYPE, "status", "=", "Booked", False]]),
+                "is_public": 1,
+                "timeseries": 0,
+            }
+        ).insert(ignore_permissions=True)
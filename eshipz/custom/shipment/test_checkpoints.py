@@ -0,0 +1,55 @@
+# Copyright (c) 2024, Frutter Software Labs Private Limited and Contributors
+# See license.txt
+
+from datetime import datetime
+
+from frappe.tests.utils import FrappeTestCase
+
+from eshipz.custom.shipment.checkpoints import get_checkpoint_name, get_new_checkpoints
+
+
+def checkpoint(time, remark):
+    return {"date": f"Mon, 01 Jan 2024 {time} GMT", "tag": "InTransit", "city": "Mumbai", "remark": remark}
+
+
+class TestCheckpoints(FrappeTestCase):
+    def test_all_checkpoints_are_new_without_watermark(self):
+        checkpoints = [checkpoint("10:00:00", "Picked up"), checkpoint("12:00:00", "Arrived at hub")]
+
+        latest, latest_date, new_checkpoints = get_new_checkpoints(checkpoints)
+
+        self.assertEqual(latest, checkpoints[1])
+        self.assertEqual(latest_date, datetime(2024, 1, 1, 12))
+        self.assertEqual([cp for _date, cp in new_checkpoints], checkpoints)
+
+    def test_checkpoints_before_watermark_are_dropped(self):
+        checkpoints = [
+            checkpoint("10:00:00", "Picked up"),
+            checkpoint("12:00:00", "Arrived at hub"),
+            checkpoint("11:00:00", "Left origin"),
+        ]
+
+        latest, _latest_date, new_checkpoints = get_new_checkpoints(checkpoints, datetime(2024, 1, 1, 11))
+
+        self.assertEqual(latest, checkpoints[1])
+        self.assertEqual(
+            new_checkpoints,
+            [(datetime(2024, 1, 1, 12), checkpoints[1]), (datetime(2024, 1, 1, 11), checkpoints[2])],
+        )
+
+    def test_checkpoint_at_watermark_is_kept(self):
+        # A new event can share the timestamp of the last stored one
+        stored = checkpoint("11:00:00", "Left origin")
+        new = checkpoint("11:00:00", "Scanned at gateway")
+
+        _latest, _latest_date, new_checkpoints = get_new_checkpoints([stored, new], datetime(2024, 1, 1, 11))
+
+        self.assertEqual([cp for _date, cp in new_checkpoints], [stored, new])
+
+    def test_checkpoint_name_follows_content(self):
+        date = datetime(2024, 1, 1, 11)
+        name = get_checkpoint_name("SHIP-0001", date, checkpoint("11:00:00", "Left origin"))
+
+        self.assertEqual(name, get_checkpoint_name("SHIP-0001", date, checkpoint("11:00:00", "Left origin")))
+        self.assertNotEqual(name, get_checkpoint_name("SHIP-0001", date, checkpoint("11:00:00", "Scanned at gateway")))
+        self.assertNotEqual(name, get_checkpoint_name("SHIP-0002", date, checkpoint("11:00:00", "Left origin")))
@@ -0,0 +1,95 @@
+# Copyright (c) 2024, Frutter Software Labs Private Limited and Contributors
+# See license.txt
+
+import math
+
+import frappe
+import numpy as np
+from frappe.tests.utils import FrappeTestCase
+
+from eshipz.custom.shipment.packing import first_fit_decreasing, get_parcel, split_lines
+
+
+def item(qty, total_weight, weight_uom="Kg", item_code="WIDGET", amount=100):
+    return frappe._dict(
+        item_name=item_code,
+        item_code=item_code,
+        uom="Nos",
+        gst_hsn_code="8471",
+        qty=qty,
+        stock_qty=qty,
+        amount=amount,
+        total_weight=total_weight,
+        weight_uom=weight_uom,
+    )
+
+
+def template(length, width, height, weight=0):
+    row = frappe._dict(length=length, width=width, height=height, weight=weight)
+    row.sides = sorted((length, width, height))
+    row.volume = math.prod(row.sides)
+    return row
+
+
+class TestSplitLines(FrappeTestCase):
+    def test_line_within_limits_is_kept(self):
+        lines, sizes = split_lines([item(2, 500, "Gram")], {"WIDGET": [5, 10, 20]}, 25, math.inf)
+
+        self.assertEqual([(line["qty"], line["weight"]) for line in lines], [(2, 0.5)])
+        self.assertEqual(sizes, [{"volume": 2000, "sides": [5, 10, 20]}])
+
+    def test_heavy_line_is_split_by_whole_units(self):
+        lines, sizes = split_lines([item(10, 30)], {}, 25, math.inf)
+
+        self.assertEqual([(line["qty"], line["weight"], line["amount"]) for line in lines], [(8, 24, 80), (2, 6, 20)])
+        self.assertEqual([size["volume"] for size in sizes], [0, 0])
+
+    def test_bulky_line_is_split_by_volume(self):
+        lines, sizes = split_lines([item(4, 2)], {"WIDGET": [10, 10, 10]}, 25, 2000)
+
+        self.assertEqual([line["qty"] for line in lines], [2, 2])
+        self.assertEqual([size["volume"] for size in sizes], [2000, 2000])
+
+    def test_fractional_quantity_is_split_evenly(self):
+        lines, _sizes = split_lines([item(1.5, 60)], {}, 25, math.inf)
+
+        self.assertEqual([line["qty"] for line in lines], [0.5, 0.5, 0.5])
+        self.assertEqual([line["weight"] for line in lines], [20, 20, 20])
+
+
+class TestFirstFitDecreasing(FrappeTestCase):
+    def test_packs_by_weight(self):
+        assignment, loads, volumes = first_fit_decreasing(
+            np.array([10.0, 20.0, 5.0, 15.0]), np.zeros(4), 25, math.inf
+        )
+
+        self.assertEqual(assignment.tolist(), [1, 0, 0, 1])
+        self.assertEqual(loads.tolist(), [25, 25])
+        self.assertEqual(volumes.tolist(), [0, 0])
+
+    def test_packs_by_volume(self):
+        assignment, loads, volumes = first_fit_decreasing(
+            np.array([1.0, 1.0, 1.0]), np.array([600.0, 600.0, 300.0]), 25, 1000
+        )
+
+        self.assertEqual(assignment.tolist(), [0, 1, 0])
+        self.assertEqual(loads.tolist(), [2, 1])
+        self.assertEqual(volumes.tolist(), [900, 600])
+
+
+class TestGetParcel(FrappeTestCase):
+    def test_smallest_template_that_holds_the_bin(self):
+        templates = [template(30, 30, 30, weight=0.5), template(60, 40, 40, weight=1)]
+
+        self.assertEqual(
+            get_parcel(10, 8000, [10, 20, 20], templates),
+            {"length": 30, "width": 30, "height": 30, "weight": 10.5, "count": 1},
+        )
+        # Fits the small template by volume, but its longest item does not
+        self.assertEqual(get_parcel(10, 8000, [5, 10, 50], templates)["length"], 60)
+
+    def test_bin_no_template_holds(self):
+        self.assertEqual(
+            get_parcel(4, 0, [5, 10, 20], []),
+            {"length": 20, "width": 5, "height": 10, "weight": 4, "count": 1},
+        )
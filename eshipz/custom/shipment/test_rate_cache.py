@@ -0,0 +1,55 @@
+# Copyright (c) 2024, Frutter Software Labs Private Limited and Contributors
+# See license.txt
+
+from frappe.tests.utils import FrappeTestCase
+
+from eshipz.custom.shipment.models import Address, Dimension, Item, Money, Parcel, RatesRequest, Shipment, Weight
+from eshipz.custom.shipment.rate_cache import get_quote_key
+
+
+def rates_request(weight=2.0, length=30, quantity=1, contact_name="Warehouse", to_postal_code="560001"):
+    ship_from = Address(contact_name=contact_name, company_name="Frutter", type="business", postal_code="400001", country="IN")
+    ship_to = Address(contact_name="Customer", company_name="Customer", type="residential", postal_code=to_postal_code, country="IN")
+    parcel = Parcel(
+        description="Widgets",
+        box_type="box",
+        weight=Weight(value=weight),
+        dimension=Dimension(width=20, height=10, length=length),
+        items=[
+            Item(
+                description="Widget",
+                origin_country="IN",
+                quantity=quantity,
+                price=Money(amount=100),
+                weight=Weight(value=weight),
+            )
+        ],
+    )
+    return RatesRequest(
+        shipment=Shipment(ship_from=ship_from, ship_to=ship_to, return_to=ship_from, parcels=[parcel], purpose="commercial")
+    )
+
+
+class TestQuoteKey(FrappeTestCase):
+    def test_same_shape_same_key(self):
+        self.assertEqual(get_quote_key(rates_request()), get_quote_key(rates_request()))
+        # Contact details do not change the price
+        self.assertEqual(get_quote_key(rates_request()), get_quote_key(rates_request(contact_name="Dock 2")))
+
+    def test_priced_fields_change_the_key(self):
+        key = get_quote_key(rates_request())
+
+        for changed in (
+            rates_request(weight=2.5),
+            rates_request(length=40),
+            rates_request(quantity=2),
+            rates_request(to_postal_code="110001"),
+        ):
+            with self.subTest(changed=changed):
+                self.assertNotEqual(key, get_quote_key(changed))
+
+    def test_account_changes_the_key(self):
+        request = rates_request()
+
+        self.assertNotEqual(get_quote_key(request), get_quote_key(request, "north"))
+        self.assertNotEqual(get_quote_key(request, "north"), get_quote_key(request, "south"))
@@ -0,0 +1,78 @@
+# Copyright (c) 2024, Frutter Software Labs Private Limited and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from eshipz.custom.shipment.rate_shopping import select_service
+
+RATES = [
+    {
+        "vendor_id": 1,
+        "slug": "bluedart",
+        "description": "Bluedart",
+        "technicality": [
+            {"service_type": "AIR", "total_charge": 120, "tat": 2},
+            {"service_type": "SURFACE", "total_charge": 80, "tat": 5},
+        ],
+    },
+    {
+        "vendor_id": 2,
+        "slug": "delhivery",
+        "description": "Delhivery",
+        "technicality": [{"service_type": "EXPRESS", "total_charge": 100, "tat": "2-3 days"}],
+    },
+]
+
+
+def select(**settings):
+    return select_service(RATES, frappe._dict(settings))
+
+
+class TestSelectService(FrappeTestCase):
+    def test_cheapest(self):
+        service = select(service_selection_policy="Cheapest")
+
+        self.assertEqual(
+            service,
+            {
+                "vendor_id": 1,
+                "slug": "bluedart",
+                "description": "Bluedart",
+                "selected_service_type": "SURFACE",
+                "price": 80.0,
+                "transit": 5.0,
+            },
+        )
+
+    def test_fastest_ranks_unparsable_transit_last(self):
+        service = select(service_selection_policy="Fastest")
+
+        self.assertEqual(service["selected_service_type"], "AIR")
+
+    def test_preferred_carrier(self):
+        service = select(service_selection_policy="Preferred Carrier", preferred_carriers="delhivery\nbluedart")
+
+        self.assertEqual(service["slug"], "delhivery")
+        self.assertIsNone(service["transit"])
+
+    def test_weighted_score(self):
+        settings = {"service_selection_policy": "Weighted Score", "price_weight": 1, "transit_weight": 1}
+
+        # AIR and SURFACE score the same; the lower price breaks the tie
+        self.assertEqual(select(**settings)["selected_service_type"], "SURFACE")
+        self.assertEqual(
+            select(**settings, preferred_carriers="delhivery", preferred_carrier_weight=1)["selected_service_type"],
+            "EXPRESS",
+        )
+
+    def test_limits_drop_candidates(self):
+        self.assertEqual(select(service_selection_policy="Fastest", max_price=90)["selected_service_type"], "SURFACE")
+        self.assertEqual(select(max_transit_days=3)["selected_service_type"], "AIR")
+
+        with self.assertRaises(frappe.ValidationError):
+            select(max_price=50)
+
+    def test_no_services(self):
+        with self.assertRaises(frappe.ValidationError):
+            select_service([{"slug": "bluedart", "technicality": []}], frappe._dict(service_selection_policy="Cheapest"))
@@ -0,0 +1,34 @@
+# Copyright (c) 2024, Frutter Software Labs Private Limited and Contributors
+# See license.txt
+
+from frappe.tests.utils import FrappeTestCase
+
+from eshipz.custom.shipment.shipment import get_cancel_errors
+
+
+class TestCancelErrors(FrappeTestCase):
+    def test_response_without_outcomes_cancels_all(self):
+        self.assertEqual(get_cancel_errors({"status": "success"}, ["A", "B"]), {})
+        self.assertEqual(get_cancel_errors({"data": {"message": "Cancelled"}}, ["A", "B"]), {})
+        self.assertEqual(get_cancel_errors(None, ["A", "B"]), {})
+
+    def test_outcome_per_order(self):
+        result = {
+            "data": [
+                {"order_id": "A", "success": True},
+                {"order_id": "B", "success": False, "message": "Already picked up"},
+                {"order_id": "C", "error": "Unknown order"},
+                {"order_id": "Z", "success": False},
+                "not an outcome",
+            ]
+        }
+
+        self.assertEqual(
+            get_cancel_errors(result, ["A", "B", "C", "D"]),
+            {"B": "Already picked up", "C": "Unknown order", "D": "No outcome returned by eShipz"},
+        )
+
+    def test_failed_outcome_without_message(self):
+        result = {"data": [{"order_id": "A", "success": False}]}
+
+        self.assertEqual(get_cancel_errors(result, ["A"]), {"A": "Not cancelled by eShipz"})
@@ -0,0 +1,126 @@
+# Copyright (c) 2024, Frutter Software Labs Private Limited and contributors
+# For license information, please see license.txt
+
+from concurrent.futures import as_completed
+from datetime import timedelta
+
+import frappe
+from frappe.utils import now_datetime
+
+from eshipz import client
+from eshipz.custom.shipment.shipment import fetch_tracking_records, get_tracking_awb, get_tracking_update
+from eshipz.custom.shipment.writeback import ShipmentWriter
+
+BATCH_SIZE = 100
+
+
+def refresh_open_shipments():
+    """Scheduled refresh of booked shipments whose next poll is due.
+
+    Shipments are walked in name order (keyset pagination) and each cycle
+    stops after `tracking_refresh_budget` shipments, so one run never
+    outgrows its API and DB budget however many AWBs are open.
+    """
+    settings = frappe.get_cached_doc("eShipz Settings")
+    if not settings.enabled or not settings.enable_tracking_refresh:
+        return
+
+    budget = settings.tracking_refresh_budget or 500
+    concurrency = settings.tracking_refresh_concurrency or 4
+    # A page keeps every worker busy with a full batch
+    page_size = max(BATCH_SIZE, (settings.tracking_batch_size or 1) * concurrency)
+    now = now_datetime()
+    last_name = ""
+    refreshed = 0
+
+    with client.get_executor(concurrency) as executor:
+        while refreshed < budget:
+            shipments = get_due_shipments(now, last_name, min(page_size, budget - refreshed))
+            if not shipments:
+                break
+
+            refresh_batch(executor, shipments, settings)
+            refreshed += len(shipments)
+            last_name = shipments[-1].name
+
+
+def get_due_shipments(now, last_name, limit):
+    return frappe.get_all(
+        "Shipment",
+        filters={
+            "docstatus": 1,
+            "status": "Booked",
+            "awb_number": ("is", "set"),
+            "name": (">", last_name),
+        },
+        or_filters=[
+            ["fsl_next_tracking_update", "<=", now],
+            ["fsl_next_tracking_update", "is", "not set"],
+        ],
+        fields=["name", "awb_number", "service_provider", "fsl_last_checkpoint_date", "fsl_eshipz_account"],
+        order_by="name asc",
+        limit=limit,
+    )
+
+
+def refresh_batch(executor, shipments, settings):
+    batch_size = settings.tracking_batch_size or 1
+    # AWBs are tracked with the eShipz account that booked them
+    by_account = {}
+    for shipment in shipments:
+        by_account.setdefault(shipment.fsl_eshipz_account or None, []).append(shipment)
+    batches = [
+        group[i : i + batch_size] for group in by_account.values() for i in range(0, len(group), batch_size)
+    ]
+    futures = {executor.submit(track_batch, batch): batch for batch in batches}
+    writer = ShipmentWriter()
+
+    for future in as_completed(futures):
+        batch = futures[future]
+        try:
+            updates = future.result()
+        except Exception:
+            updates = {}
+            frappe.log_error(title=f"eShipz tracking refresh failed for {len(batch)} Shipments from {batch[0].name}")
+
+        for shipment in batch:
+            if shipment.name in updates:
+                values, checkpoints = updates[shipment.name]
+                writer.add_checkpoints(shipment.name, shipment.awb_number, checkpoints)
+            else:
+                # Back off a failing AWB to the regular interval instead of
+                # retrying it on every cycle.
+                values = {
+                    "fsl_next_tracking_update": now_datetime() + timedelta(minutes=settings.tracking_interval or 120)
+                }
+            writer.set(shipment.name, values)
+
+    writer.flush()
+    frappe.clear_messages()
+
+
+def track_batch(shipments):
+    """Fetch the tracking of `shipments`, all booked with the same eShipz
+    account, in one call and map every record to its Shipment, as
+    `{name: (values, new checkpoints)}`.
+
+    Records are reduced to their updates as they stream in, so only the new
+    checkpoints of a batch are kept. AWBs eShipz has no record for are left
+    out.
+    """
+    by_awb = {shipment.awb_number: shipment for shipment in shipments}
+    updates = {}
+
+    for tracking_data in fetch_tracking_records(list(by_awb), account=shipments[0].fsl_eshipz_account):
+        awb_number = get_tracking_awb(tracking_data)
+        if awb_number is None and len(by_awb) == 1:
+            awb_number = next(iter(by_awb))
+
+        shipment = by_awb.get(awb_number)
+        if not shipment:
+            continue
+
+        values, _summary, checkpoints = get_tracking_update(tracking_data, shipment.fsl_last_checkpoint_date)
+        updates[shipment.name] = (values, checkpoints)
+
+    return updates
@@ -0,0 +1,144 @@
+# Copyright (c) 2024, Frutter Software Labs Private Limited and contributors
+# For license information, please see license.txt
+
+import hashlib
+import hmac
+from datetime import datetime
+
+import frappe
+
+from eshipz.custom.shipment.checkpoints import parse_tracking_date
+from eshipz.custom.shipment.shipment import get_tracking_update
+from eshipz.custom.shipment.writeback import ShipmentWriter
+
+AWB_CACHE_PREFIX = "eshipz_awb:"
+AWB_CACHE_TTL = 7 * 24 * 60 * 60
+EVENT_CACHE_PREFIX = "eshipz_tracking_event:"
+EVENT_CACHE_TTL = 24 * 60 * 60
+
+
+@frappe.whitelist(allow_guest=True, methods=["POST"])
+def tracking():
+    """Receive eShipz tracking pushes, a single event or a list of them.
+
+    Configure the URL /api/method/eshipz.custom.shipment.webhook.tracking in
+    eShipz with the Webhook Token from eShipz Settings sent as the
+    X-Webhook-Token header (or a `token` query parameter).
+    """
+    verify_token()
+
+    payload = frappe.parse_json(frappe.request.get_data(as_text=True))
+    events = payload if isinstance(payload, list) else [payload]
+
+    # A batch may carry several pushes for one AWB; only the one with the
+    # newest checkpoint matters, wherever it is in the batch. A malformed
+    # event is logged and skipped so it does not fail the rest.
+    latest = {}
+    event_dates = {}
+    for event in events:
+        if not (isinstance(event, dict) and event.get("awb_number")):
+            continue
+        awb = event["awb_number"]
+        try:
+            event_date = get_event_date(event)
+        except Exception:
+            log_event_error(awb)
+            continue
+        if awb not in latest or (event_date or datetime.min) >= (event_dates[awb] or datetime.min):
+            latest[awb] = event
+            event_dates[awb] = event_date
+
+    cache = frappe.cache()
+    fingerprints = {awb: get_event_key(awb, event, event_dates[awb]) for awb, event in latest.items()}
+    latest = {awb: event for awb, event in latest.items() if not cache.exists(fingerprints[awb])}
+    shipments = get_shipments_by_awb(list(latest))
+
+    watermarks = dict(
+        frappe.get_all(
+            "Shipment",
+            filters={"name": ("in", list(shipments.values()))},
+            fields=["name", "fsl_last_checkpoint_date"],
+            as_list=True,
+        )
+    ) if shipments else {}
+
+    writer = ShipmentWriter()
+    for awb, event in latest.items():
+        if awb in shipments:
+            docname = shipments[awb]
+            try:
+                values, _summary, checkpoints = get_tracking_update(event, watermarks.get(docname))
+            except Exception:
+                log_event_error(awb)
+                continue
+            writer.set(docname, values)
+            writer.add_checkpoints(docname, awb, checkpoints)
+
+    updated = len(writer)
+    writer.flush()
+
+    # Remember applied events only once they are committed, so a push that
+    # failed half-way is applied again when eShipz retries it.
+    for awb in latest:
+        cache.set(cache.make_key(fingerprints[awb]), 1, ex=EVENT_CACHE_TTL)
+
+    return {"received": len(events), "updated": updated}
+
+
+def verify_token():
+    settings = frappe.get_cached_doc("eShipz Settings")
+    expected = settings.enabled and settings.get_password("webhook_token", raise_exception=False)
+    received = frappe.get_request_header("X-Webhook-Token") or frappe.form_dict.get("token")
+
+    if not expected or not received or not hmac.compare_digest(expected, received):
+        raise frappe.AuthenticationError
+
+
+def get_event_date(event):
+    """Date of the newest checkpoint of `event`, None when it has none."""
+    return max(
+        (parse_tracking_date(checkpoint["date"]) for checkpoint in event.get("checkpoints") or [] if checkpoint.get("date")),
+        default=None,
+    )
+
+
+def get_event_key(awb, event, event_date):
+    checkpoints = event.get("checkpoints") or []
+    fingerprint = hashlib.sha1(
+        "|".join((str(awb), str(event.get("tag")), str(len(checkpoints)), str(event_date or ""))).encode()
+    ).hexdigest()
+
+    return EVENT_CACHE_PREFIX + fingerprint
+
+
+def log_event_error(awb):
+    frappe.log_error(title=f"eShipz tracking push for AWB {awb} could not be applied")
+
+
+def get_shipments_by_awb(awb_numbers):
+    cache = frappe.cache()
+    shipments = {}
+    misses = []
+
+    for awb in awb_numbers:
+        name = cache.get_value(AWB_CACHE_PREFIX + awb)
+        if name:
+            shipments[awb] = name
+        else:
+            misses.append(awb)
+
+    if misses:
+        for row in frappe.get_all(
+            "Shipment",
+            filters={"awb_number": ("in", misses), "docstatus": 1, "status": ("!=", "Cancelled")},
+            fields=["name", "awb_number"],
+        ):
+            shipments[row.awb_number] = row.name
+            cache.set_value(AWB_CACHE_PREFIX + row.awb_number, row.name, expires_in_sec=AWB_CACHE_TTL)
+
+    return shipments
+
+
+def forget_awb(awb_number):
+    if awb_number:
+        frappe.cache().delete_value(AWB_CACHE_PREFIX + awb_number)
@@ -0,0 +1,85 @@
+# Copyright (c) 2024, Frutter Software Labs Private Limited and contributors
+# For license information, please see license.txt
+
+from collections import defaultdict
+
+import frappe
+from frappe.utils import now
+
+from eshipz.custom.shipment import summary
+from eshipz.custom.shipment.checkpoints import insert_checkpoints
+
+
+class ShipmentWriter:
+    """Collects field changes for Shipments and writes each document once.
+
+    `doc.db_set` issues one UPDATE (and one `modified` bump) per field. The
+    writer merges every change made to a Shipment and, on `flush`, applies
+    them with a single UPDATE per document; documents receiving identical
+    values (e.g. a bulk cancel) share one `UPDATE ... WHERE name IN (...)`.
+    New tracking checkpoints are bulk inserted and the eShipz Shipment
+    Summary counts moved in the same transaction.
+    Everything is committed together and the form / list views are
+    notified once per document, after commit.
+    """
+
+    def __init__(self):
+        self.changes = {}
+        self.checkpoints = []
+
+    def set(self, docname, values):
+        self.changes.setdefault(docname, {}).update(values)
+
+    def add_checkpoints(self, docname, awb_number, checkpoints):
+        self.checkpoints.extend(
+            (docname, awb_number, checkpoint_date, checkpoint) for checkpoint_date, checkpoint in checkpoints
+        )
+
+    def __len__(self):
+        return len(self.changes)
+
+    def flush(self):
+        if not self.changes:
+            return
+
+        modified = now()
+        modified_by = frappe.session.user
+
+        moved = [docname for docname, values in self.changes.items() if summary.TRACKED_FIELDS & values.keys()]
+        deltas = summary.get_deltas(summary.lock_shipments(moved), self.changes) if moved else None
+
+        groups = defaultdict(list)
+        for docname, values in self.changes.items():
+            groups[tuple(sorted(values.items()))].append(docname)
+
+        for values, docnames in groups.items():
+            frappe.db.set_value(
+                "Shipment",
+                docnames[0] if len(docnames) == 1 else {"name": ("in", docnames)},
+                dict(values),
+                modified=modified,
+                modified_by=modified_by,
+            )
+
+        if deltas:
+            summary.apply_deltas(deltas)
+        insert_checkpoints(self.checkpoints)
+        frappe.db.commit()
+
+        for docname in self.changes:
+            frappe.publish_realtime(
+                "doc_update",
+                {"modified": modified, "doctype": "Shipment", "name": docname},
+                doctype="Shipment",
+                docname=docname,
+            )
+        frappe.publish_realtime("list_update", {"doctype": "Shipment"}, doctype="Shipment")
+
+        self.changes = {}
+        self.checkpoints = []
+
+
+def write_shipment(docname, values):
+    writer = ShipmentWriter()
+    writer.set(docname, values)
+    writer.flush()
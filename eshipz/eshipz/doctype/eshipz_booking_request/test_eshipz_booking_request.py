@@ -0,0 +1,9 @@
+# Copyright (c) 2024, Frutter Software Labs Private Limited and Contributors
+# See license.txt
+
+# import frappe
+from frappe.tests.utils import FrappeTestCase
+
+
+class TesteShipzBookingRequest(FrappeTestCase):
+	pass
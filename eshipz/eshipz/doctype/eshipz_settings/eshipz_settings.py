@@ -1,9 +1,22 @@
 # Copyright (c) 2024, Frutter Software Labs Private Limited and contributors
 # For license information, please see license.txt
 
-# import frappe
+import frappe
 from frappe.model.document import Document
 
+from eshipz.accounts import clear_accounts_cache
+from eshipz.client import clear_api_token_cache
+from eshipz.metrics import clear_sample_rate_cache
+
 
 class eShipzSettings(Document):
-	pass
+	def validate(self):
+		account_names = [row.account_name for row in self.accounts]
+		duplicates = {name for name in account_names if account_names.count(name) > 1}
+		if duplicates:
+			frappe.throw(f"eShipz account names must be unique: {', '.join(sorted(duplicates))}")
+
+	def on_update(self):
+		clear_api_token_cache()
+		clear_accounts_cache()
+		clear_sample_rate_cache()
@@ -0,0 +1,8 @@
+// Copyright (c) 2024, Frutter Software Labs Private Limited and contributors
+// For license information, please see license.txt
+
+// frappe.ui.form.on("eShipz Tracking Checkpoint", {
+// 	refresh(frm) {
+
+// 	},
+// });
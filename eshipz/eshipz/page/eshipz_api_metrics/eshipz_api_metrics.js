@@ -0,0 +1,100 @@
+// Copyright (c) 2024, Frutter Software Labs Private Limited and contributors
+// For license information, please see license.txt
+
+frappe.pages['eshipz-api-metrics'].on_page_load = function(wrapper) {
+    let page = frappe.ui.make_app_page({
+	parent: wrapper,
+	title: __('eShipz API Metrics'),
+	single_column: true
+    });
+
+    page.set_primary_action(__('Refresh'), () => render_metrics(page), 'refresh');
+    render_metrics(page);
+};
+
+function render_metrics(page) {
+    frappe.call({
+	method: 'eshipz.metrics.get_api_metrics',
+	callback: function(r) {
+	    let data = r.message || { endpoints: [], methods: [], throttle: [], accounts: [] };
+	    let esc = value => frappe.utils.escape_html(String(value));
+	    let ms = value => value === null ? '-' : (value === 'inf' ? '> 60000' : `≤ ${esc(value)}`);
+
+	    $(page.body).html(`
+		<h5>${__('eShipz Endpoints')}</h5>
+		<table class="table table-bordered">
+		    <thead class="grid-heading-row">
+			<tr>
+			    <th>${__('Endpoint')}</th><th>${__('Carrier')}</th><th>${__('Calls')}</th><th>${__('Error Rate')}</th>
+			    <th>${__('p50 (ms)')}</th><th>${__('p95 (ms)')}</th><th>${__('p99 (ms)')}</th>
+			</tr>
+		    </thead>
+		    <tbody>
+			${data.endpoints.map(row => `
+			    <tr class="${row.carrier === null ? 'bold' : ''}">
+				<td>${esc(row.endpoint)}</td>
+				<td>${row.carrier === null ? __('All') : (row.carrier ? esc(row.carrier) : __('Not Set'))}</td>
+				<td>${esc(row.calls)}</td>
+				<td>${(row.error_rate * 100).toFixed(1)}%</td>
+				<td>${ms(row.p50)}</td><td>${ms(row.p95)}</td><td>${ms(row.p99)}</td>
+			    </tr>
+			`).join('')}
+		    </tbody>
+		</table>
+		<h5>${__('Rate Limits')}</h5>
+		<table class="table table-bordered">
+		    <thead class="grid-heading-row">
+			<tr>
+			    <th>${__('Endpoint Family')}</th><th>${__('Requests per Second')}</th>
+			    <th>${__('Concurrency Limit')}</th><th>${__('In Flight')}</th>
+			</tr>
+		    </thead>
+		    <tbody>
+			${data.throttle.map(row => `
+			    <tr>
+				<td>${esc(row.family)}</td>
+				<td>${row.rate_limit ? esc(row.rate_limit) : __('Unlimited')}</td>
+				<td>${row.concurrency_limit === null ? __('Not Adaptive') : row.concurrency_limit.toFixed(1)}</td>
+				<td>${esc(row.in_flight)}</td>
+			    </tr>
+			`).join('')}
+		    </tbody>
+		</table>
+		<h5>${__('eShipz Accounts')}</h5>
+		<table class="table table-bordered">
+		    <thead class="grid-heading-row">
+			<tr>
+			    <th>${__('Account')}</th><th>${__('Max Concurrency')}</th><th>${__('In Flight')}</th>
+			</tr>
+		    </thead>
+		    <tbody>
+			${data.accounts.length ? data.accounts.map(row => `
+			    <tr>
+				<td>${esc(row.account)}</td>
+				<td>${row.max_concurrency === null ? __('Default') : esc(row.max_concurrency)}</td>
+				<td>${esc(row.in_flight)}</td>
+			    </tr>
+			`).join('') : `<tr><td colspan="3" class="text-muted">${__('Only the API Token of eShipz Settings is used')}</td></tr>`}
+		    </tbody>
+		</table>
+		<h5>${__('Whitelisted Methods')}</h5>
+		<table class="table table-bordered">
+		    <thead class="grid-heading-row">
+			<tr>
+			    <th>${__('Method')}</th><th>${__('Calls')}</th><th>${__('Avg Total (ms)')}</th>
+			    <th>${__('Avg eShipz HTTP (ms)')}</th><th>${__('Avg ERP (ms)')}</th>
+			</tr>
+		    </thead>
+		    <tbody>
+			${data.methods.map(row => `
+			    <tr>
+				<td>${esc(row.method)}</td><td>${esc(row.calls)}</td><td>${row.avg_total.toFixed(0)}</td>
+				<td>${row.avg_http.toFixed(0)}</td><td>${row.avg_erp.toFixed(0)}</td>
+			    </tr>
+			`).join('')}
+		    </tbody>
+		</table>
+	    `);
+	}
+    });
+}
@@ -35,6 +35,9 @@ app_license = "mit"
 doctype_js = {
     "Shipment" : "custom/shipment/shipment.js",
 }
+doctype_list_js = {
+    "Shipment" : "custom/shipment/shipment_list.js",
+}
 
 # Svg Icons
 # ------------------
@@ -72,6 +75,7 @@ doctype_js = {
 
 # before_install = "eshipz.install.before_install"
 # after_install = "eshipz.install.after_install"
+after_install = "eshipz.custom.shipment.summary.create_dashboard"
 
 # Uninstallation
 # ------------
@@ -133,6 +137,24 @@ doctype_js = {
 # 	}
 # }
 
+doc_events = {
+	"Address": {
+		"on_update": "eshipz.custom.shipment.master_data.clear_address_cache",
+		"on_trash": "eshipz.custom.shipment.master_data.clear_address_cache",
+	},
+	"Country": {
+		"on_update": "eshipz.custom.shipment.master_data.clear_country_cache",
+		"on_trash": "eshipz.custom.shipment.master_data.clear_country_cache",
+	},
+	"Shipment": {
+		"on_submit": [
+			"eshipz.custom.shipment.summary.on_submit",
+			"eshipz.custom.shipment.precompute.on_submit",
+		],
+		"before_cancel": "eshipz.custom.shipment.summary.before_cancel",
+	},
+}
+
 # Scheduled Tasks
 # ---------------
 
@@ -154,6 +176,24 @@ doctype_js = {
 # 	],
 # }
 
+scheduler_events = {
+	"all": [
+		"eshipz.metrics.flush_api_log",
+		"eshipz.custom.shipment.outbox.retry_booking_requests"
+	],
+	"cron": {
+		"*/10 * * * *": [
+			"eshipz.custom.shipment.tracking.refresh_open_shipments"
+		],
+	},
+	"daily_long": [
+		"eshipz.custom.shipment.summary.reconcile_recent"
+	],
+	"weekly_long": [
+		"eshipz.custom.shipment.summary.reconcile_all"
+	],
+}
+
 # Testing
 # -------
 
@@ -186,6 +226,8 @@ doctype_js = {
 # ----------------
 # before_request = ["eshipz.utils.before_request"]
 # after_request = ["eshipz.utils.after_request"]
+before_request = ["eshipz.metrics.start_request_timer"]
+after_request = ["eshipz.metrics.record_request_time"]
 
 # Job Events
 # ----------
@@ -229,4 +271,7 @@ doctype_js = {
 # default_log_clearing_doctypes = {
 # 	"Logging DocType Name": 30  # days to retain logs
 # }
+default_log_clearing_doctypes = {
+	"eShipz API Log": 7
+}
 
@@ -0,0 +1,234 @@
+# Copyright (c) 2024, Frutter Software Labs Private Limited and contributors
+# For license information, please see license.txt
+
+import json
+import random
+import time
+
+import frappe
+from frappe.utils import flt, now
+
+from eshipz import throttle
+
+# Upper bounds (ms) of the latency histogram buckets
+BUCKETS = (50, 100, 200, 300, 500, 750, 1000, 1500, 2000, 3000, 5000, 7500, 10000, 20000, 30000, 60000)
+
+ENDPOINTS_KEY = "eshipz_api_endpoints"
+LATENCY_KEY = "eshipz_api_latency:"
+STATUS_KEY = "eshipz_api_status:"
+METHOD_TIME_KEY = "eshipz_method_time:"
+METHODS_KEY = "eshipz_methods"
+LOG_QUEUE_KEY = "eshipz_api_log_queue"
+SAMPLE_RATE_KEY = "eshipz_api_log_sample_rate"
+
+LOG_QUEUE_SIZE = 10000
+LOG_FLUSH_SIZE = 1000
+MAX_BODY_LENGTH = 2000
+
+LOG_FIELDS = (
+    "name", "creation", "modified", "owner", "modified_by",
+    "endpoint", "carrier", "status_code", "duration", "attempts", "request", "response",
+)
+
+
+def record_call(endpoint, status_code, duration, slug=None, attempts=1, request=None, response=None):
+    """Aggregate one eShipz API call into the Redis counters and, if sampled,
+    queue it for the eShipz API Log.
+
+    Instrumentation is best effort and must never fail the call itself.
+    """
+    try:
+        _record_call(endpoint, status_code, duration, slug or "", attempts, request, response)
+    except Exception:
+        pass
+
+
+def _record_call(endpoint, status_code, duration, slug, attempts, request, response):
+    cache = frappe.cache()
+    bucket = next((str(bound) for bound in BUCKETS if duration <= bound), "inf")
+
+    pipe = cache.pipeline()
+    pipe.sadd(cache.make_key(ENDPOINTS_KEY), f"{endpoint}|{slug}")
+    for key in (endpoint, f"{endpoint}|{slug}"):
+        pipe.hincrby(cache.make_key(LATENCY_KEY + key), bucket, 1)
+        pipe.hincrby(cache.make_key(STATUS_KEY + key), str(status_code), 1)
+
+    # Errors are always logged, successful calls only when sampled
+    if status_code != 200 or random.random() * 100 < get_sample_rate():
+        entry = {
+            "endpoint": endpoint,
+            "carrier": slug,
+            "status_code": status_code,
+            "duration": duration,
+            "attempts": attempts,
+            "request": truncate(request),
+            "response": truncate(response),
+            "timestamp": now(),
+            "user": frappe.session.user if getattr(frappe.local, "session", None) else "Administrator",
+        }
+        log_queue_key = cache.make_key(LOG_QUEUE_KEY)
+        pipe.rpush(log_queue_key, json.dumps(entry, default=str))
+        pipe.ltrim(log_queue_key, -LOG_QUEUE_SIZE, -1)
+
+    pipe.execute()
+
+
+def truncate(body):
+    if body is None:
+        return None
+    if isinstance(body, bytes):
+        body = body.decode(errors="replace")
+    elif not isinstance(body, str):
+        body = json.dumps(body, default=str)
+    return body[:MAX_BODY_LENGTH]
+
+
+def get_sample_rate():
+    rate = frappe.cache().get_value(SAMPLE_RATE_KEY)
+    # Worker threads of the bulk jobs have no database connection; they use
+    # whatever the calling thread cached.
+    if rate is None and getattr(frappe.local, "db", None):
+        rate = flt(frappe.db.get_single_value("eShipz Settings", "api_log_sample_rate"))
+        frappe.cache().set_value(SAMPLE_RATE_KEY, rate)
+    return rate or 0
+
+
+def clear_sample_rate_cache():
+    frappe.cache().delete_value(SAMPLE_RATE_KEY)
+
+
+def start_request_timer():
+    if frappe.request and frappe.request.path.startswith("/api/method/eshipz."):
+        frappe.local.eshipz_timer = {"start": time.perf_counter(), "http": 0.0}
+
+
+def add_http_time(duration):
+    timer = getattr(frappe.local, "eshipz_timer", None)
+    if timer:
+        timer["http"] += duration
+
+
+def record_request_time():
+    timer = getattr(frappe.local, "eshipz_timer", None)
+    if not timer:
+        return
+    frappe.local.eshipz_timer = None
+
+    try:
+        method = frappe.request.path.rsplit("/", 1)[-1]
+        total = (time.perf_counter() - timer["start"]) * 1000
+        cache = frappe.cache()
+        pipe = cache.pipeline()
+        pipe.sadd(cache.make_key(METHODS_KEY), method)
+        key = cache.make_key(METHOD_TIME_KEY + method)
+        pipe.hincrby(key, "count", 1)
+        pipe.hincrbyfloat(key, "total", total)
+        pipe.hincrbyfloat(key, "http", timer["http"])
+        pipe.execute()
+    except Exception:
+        pass
+
+
+def flush_api_log():
+    """Move queued API log entries into eShipz API Log in bulk."""
+    cache = frappe.cache()
+    log_queue_key = cache.make_key(LOG_QUEUE_KEY)
+
+    while True:
+        pipe = cache.pipeline()
+        pipe.lrange(log_queue_key, 0, LOG_FLUSH_SIZE - 1)
+        pipe.ltrim(log_queue_key, LOG_FLUSH_SIZE, -1)
+        entries, _trimmed = pipe.execute()
+        if not entries:
+            break
+
+        rows = []
+        for entry in entries:
+            entry = json.loads(entry)
+            rows.append(
+                (
+                    frappe.generate_hash(length=10), entry["timestamp"], entry["timestamp"], entry["user"], entry["user"],
+                    entry["endpoint"], entry["carrier"], entry["status_code"], entry["duration"], entry["attempts"],
+                    entry["request"], entry["response"],
+                )
+            )
+        frappe.db.bulk_insert("eShipz API Log", LOG_FIELDS, rows)
+        frappe.db.commit()
+
+
+def percentile(histogram, fraction):
+    total = sum(histogram.values())
+    if not total:
+        return None
+
+    seen = 0
+    for bound in (*BUCKETS, "inf"):
+        seen += histogram.get(str(bound), 0)
+        if seen >= fraction * total:
+            return bound
+
+
+def read_hashes(cache, keys):
+    pipe = cache.pipeline()
+    for key in keys:
+        pipe.hgetall(cache.make_key(key))
+    return [{frappe.safe_decode(k): frappe.safe_decode(v) for k, v in values.items()} for values in pipe.execute()]
+
+
+@frappe.whitelist()
+def get_api_metrics():
+    frappe.only_for("System Manager")
+
+    cache = frappe.cache()
+    pipe = cache.pipeline()
+    pipe.smembers(cache.make_key(ENDPOINTS_KEY))
+    pipe.smembers(cache.make_key(METHODS_KEY))
+    endpoint_keys, method_names = pipe.execute()
+
+    # Every endpoint|carrier pair, preceded by the endpoint-wide totals
+    names = []
+    for key in sorted(frappe.safe_decode(key) for key in endpoint_keys):
+        endpoint = key.split("|", 1)[0]
+        if endpoint not in names:
+            names.append(endpoint)
+        names.append(key)
+
+    histograms = read_hashes(cache, [LATENCY_KEY + name for name in names])
+    statuses = read_hashes(cache, [STATUS_KEY + name for name in names])
+
+    endpoints = []
+    for name, histogram, status in zip(names, histograms, statuses):
+        histogram = {bucket: int(count) for bucket, count in histogram.items()}
+        status = {code: int(count) for code, count in status.items()}
+        calls = sum(status.values())
+        endpoint, _, carrier = name.partition("|")
+        endpoints.append(
+            {
+                "endpoint": endpoint,
+                "carrier": carrier if "|" in name else None,
+                "calls": calls,
+                "error_rate": (calls - status.get("200", 0)) / calls if calls else 0,
+                "statuses": status,
+                "p50": percentile(histogram, 0.5),
+                "p95": percentile(histogram, 0.95),
+                "p99": percentile(histogram, 0.99),
+            }
+        )
+
+    method_names = sorted(frappe.safe_decode(method) for method in method_names)
+    methods = []
+    for method, timing in zip(method_names, read_hashes(cache, [METHOD_TIME_KEY + m for m in method_names])):
+        calls = int(timing.get("count", 0))
+        total = flt(timing.get("total"))
+        http = flt(timing.get("http"))
+        methods.append(
+            {
+                "method": method,
+                "calls": calls,
+                "avg_total": total / calls if calls else 0,
+                "avg_http": http / calls if calls else 0,
+                "avg_erp": (total - http) / calls if calls else 0,
+            }
+        )
+
+    return {"endpoints": endpoints, "methods": methods, "throttle": throttle.get_state(), "accounts": throttle.get_account_state()}
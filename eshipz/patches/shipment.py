@@ -59,7 +59,104 @@ def execute():
                 label = "Last Update Received",
                 insert_after = "tracking_url",
             ),
-        ]
+            dict(
+                fieldname = "fsl_last_checkpoint_date",
+                fieldtype = "Datetime",
+                label = "Last Checkpoint Date",
+                insert_after = "fsl_last_update_received",
+                read_only = 1,
+            ),
+            dict(
+                fieldname = "fsl_next_tracking_update",
+                fieldtype = "Datetime",
+                label = "Next Tracking Update",
+                insert_after = "fsl_last_checkpoint_date",
+                read_only = 1,
+                search_index = 1,
+            ),
+            dict(
+                fieldname = "fsl_label",
+                fieldtype = "Attach",
+                label = "Label",
+                insert_after = "tracking_url",
+                read_only = 1,
+            ),
+            dict(
+                fieldname = "fsl_parcel_allocation",
+                fieldtype = "Code",
+                label = "Parcel Allocation",
+                options = "JSON",
+                insert_after = "shipment_parcel",
+                read_only = 1,
+                hidden = 1,
+                no_copy = 1,
+            ),
+            dict(
+                fieldname = "fsl_eshipz_account",
+                fieldtype = "Data",
+                label = "eShipz Account",
+                insert_after = "shipment_id",
+                read_only = 1,
+                no_copy = 1,
+            ),
+            dict(
+                fieldname = "fsl_rates",
+                fieldtype = "Code",
+                label = "Precomputed Rates",
+                options = "JSON",
+                insert_after = "fsl_parcel_allocation",
+                read_only = 1,
+                hidden = 1,
+                no_copy = 1,
+            ),
+            dict(
+                fieldname = "fsl_rates_key",
+                fieldtype = "Data",
+                label = "Precomputed Rates Key",
+                insert_after = "fsl_rates",
+                read_only = 1,
+                hidden = 1,
+                no_copy = 1,
+            ),
+            dict(
+                fieldname = "fsl_rates_fetched_at",
+                fieldtype = "Datetime",
+                label = "Rates Fetched At",
+                insert_after = "fsl_eshipz_account",
+                read_only = 1,
+                no_copy = 1,
+            ),
+            dict(
+                fieldname = "fsl_rates_valid_till",
+                fieldtype = "Datetime",
+                label = "Rates Valid Till",
+                insert_after = "fsl_rates_fetched_at",
+                read_only = 1,
+                hidden = 1,
+                no_copy = 1,
+            ),
+        ],
+        "Item": [
+            dict(
+                fieldname = "fsl_length",
+                fieldtype = "Float",
+                label = "eShipz Length (cm)",
+                description = "Per stock unit, used to pack parcels",
+                insert_after = "weight_uom",
+            ),
+            dict(
+                fieldname = "fsl_width",
+                fieldtype = "Float",
+                label = "eShipz Width (cm)",
+                insert_after = "fsl_length",
+            ),
+            dict(
+                fieldname = "fsl_height",
+                fieldtype = "Float",
+                label = "eShipz Height (cm)",
+                insert_after = "fsl_width",
+            ),
+        ],
     }
     create_custom_fields(custom_field)
     make_property_setter("Batch", "expiry_date", "reqd", 1, "Check")
\ No newline at end of file
@@ -0,0 +1,8 @@
+# Copyright (c) 2024, Frutter Software Labs Private Limited and contributors
+# For license information, please see license.txt
+
+import frappe
+
+def execute():
+    frappe.db.add_index("Shipment", ["awb_number"])
+    frappe.db.add_index("Shipment", ["shipment_id"])
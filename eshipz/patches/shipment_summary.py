@@ -0,0 +1,11 @@
+# Copyright (c) 2024, Frutter Software Labs Private Limited and contributors
+# For license information, please see license.txt
+
+import frappe
+
+from eshipz.custom.shipment import summary
+
+def execute():
+    frappe.db.add_index("Shipment", ["pickup_date"])
+    summary.reconcile_all()
+    summary.create_dashboard()
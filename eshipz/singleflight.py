@@ -0,0 +1,102 @@
+# Copyright (c) 2024, Frutter Software Labs Private Limited and contributors
+# For license information, please see license.txt
+
+"""Coalescing of identical in-flight calls across every worker of the site.
+
+The first caller for a key takes a Redis lock and makes the call (the
+leader); callers arriving while it runs wait for the leader's result instead
+of repeating the call. The result, or the error, is kept for a few seconds
+under the leader's flight id. If the leader dies, its lock expires and the
+next waiting caller leads a new flight.
+"""
+
+import json
+import time
+import uuid
+
+import frappe
+
+FLIGHT_KEY = "eshipz_flight:"
+RESULT_KEY = "eshipz_flight_result:"
+
+RESULT_TTL = 10
+POLL_INTERVAL = 0.1
+
+
+def run(key, fn, timeout):
+    """Return `fn()`, sharing one call among concurrent callers of `key`.
+
+    `timeout` (seconds) bounds both the leader's lock and the time a caller
+    waits for a result.
+    """
+    cache = frappe.cache()
+    lock_key = cache.make_key(FLIGHT_KEY + key)
+    flight_id = uuid.uuid4().hex
+    deadline = time.monotonic() + timeout
+
+    while time.monotonic() < deadline:
+        try:
+            leader = cache.set(lock_key, flight_id, nx=True, ex=timeout)
+        except Exception:
+            # Without Redis there is nobody to coalesce with
+            return fn()
+
+        if leader:
+            return lead(cache, lock_key, flight_id, fn)
+
+        result = wait(cache, lock_key, deadline)
+        if result is not None:
+            return unpack(result)
+
+    frappe.throw("Timed out waiting for an identical eShipz request to finish")
+
+
+def lead(cache, lock_key, flight_id, fn):
+    result_key = cache.make_key(RESULT_KEY + flight_id)
+    try:
+        value = fn()
+    except Exception as e:
+        publish(cache, lock_key, result_key, {"error": str(e), "exc": f"{type(e).__module__}.{type(e).__qualname__}"})
+        raise
+
+    publish(cache, lock_key, result_key, {"value": value})
+    return value
+
+
+def publish(cache, lock_key, result_key, result):
+    pipe = cache.pipeline()
+    pipe.set(result_key, json.dumps(result, default=str), ex=RESULT_TTL)
+    pipe.delete(lock_key)
+    pipe.execute()
+
+
+def wait(cache, lock_key, deadline):
+    """Poll the result of the flight holding `lock_key`. Returns None when
+    the flight ended without a result (its leader died) so the caller can
+    lead the next one."""
+    flight_id = cache.get(lock_key)
+    if not flight_id:
+        return None
+
+    result_key = cache.make_key(RESULT_KEY + frappe.safe_decode(flight_id))
+    while time.monotonic() < deadline:
+        # The lock is read first: the result is published in the same
+        # transaction that releases it.
+        running = cache.get(lock_key) == flight_id
+        result = cache.get(result_key)
+        if result is not None:
+            return json.loads(result)
+        if not running:
+            return None
+        time.sleep(POLL_INTERVAL)
+
+
+def unpack(result):
+    if "error" not in result:
+        return result["value"]
+
+    try:
+        exc = frappe.get_attr(result["exc"])
+    except Exception:
+        exc = frappe.ValidationError
+    frappe.throw(result["error"], exc=exc)
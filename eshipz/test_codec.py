@@ -0,0 +1,47 @@
+# Copyright (c) 2024, Frutter Software Labs Private Limited and Contributors
+# See license.txt
+
+import io
+
+from frappe.tests.utils import FrappeTestCase
+
+from eshipz import codec
+from eshipz.custom.shipment.models import Item, Money, Weight
+
+
+class TestCodec(FrappeTestCase):
+    def test_iter_array(self):
+        body = b'[{"order_id": "A", "labels": ["x", "y"]}, 2.5, "text", null, [1, [2]], {}]'
+
+        self.assertEqual(
+            list(codec.iter_array(io.BytesIO(body))),
+            [{"order_id": "A", "labels": ["x", "y"]}, 2.5, "text", None, [1, [2]], {}],
+        )
+        self.assertEqual(list(codec.iter_array(io.BytesIO(b"[]"))), [])
+
+    def test_iter_array_rejects_other_bodies(self):
+        for body in (b'{"data": []}', b'"text"', b"", b'[{"order_id": "A"}, '):
+            with self.subTest(body=body), self.assertRaises(ValueError):
+                list(codec.iter_array(io.BytesIO(body)))
+
+    def test_dumps_leaves_out_unset_optional_fields(self):
+        item = Item(
+            description="Widget",
+            origin_country="IN",
+            quantity=2,
+            price=Money(amount=100),
+            weight=Weight(value=1.5),
+            sku="W-1",
+        )
+
+        self.assertEqual(
+            codec.loads(codec.dumps(item)),
+            {
+                "description": "Widget",
+                "origin_country": "IN",
+                "quantity": 2,
+                "price": {"amount": 100, "currency": "INR"},
+                "weight": {"value": 1.5, "unit": "kg"},
+                "sku": "W-1",
+            },
+        )
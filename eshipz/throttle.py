@@ -0,0 +1,295 @@
+# Copyright (c) 2024, Frutter Software Labs Private Limited and contributors
+# For license information, please see license.txt
+
+"""Cluster-wide pacing of outbound eShipz calls.
+
+Every web and RQ worker of the bench draws from the same Redis state, per
+endpoint family (rates, booking, tracking, cancel):
+
+* a token bucket refilled at the family's rate limit (requests / second),
+  so bursts from several workers never add up past what eShipz accepts;
+* an AIMD concurrency limit on calls in flight: halved when eShipz answers
+  429 / 5xx or times out, grown by 1 / limit for every call answered within
+  the target latency. In-flight calls hold a lease that expires on its own,
+  so a killed worker cannot leak capacity.
+
+Calls through one of the eShipz accounts of the settings (`eshipz.accounts`)
+are paced per account, as every account has its own quota, and also hold a
+lease in the account's set of calls in flight, which is capped by the
+account's Max Requests in Flight and used to route to the least loaded one.
+
+All checks run in one Lua script, so a slot is granted atomically. When
+Redis is unreachable calls go through unpaced.
+"""
+
+import time
+import uuid
+
+import frappe
+from frappe.utils import cint, flt
+
+from eshipz import accounts
+
+FAMILIES = {
+    "/api/v2/services": "rates",
+    "/api/v1/create-shipments": "booking",
+    "/api/v1/create-shipments/rule-based": "booking",
+    "/api/v2/trackings": "tracking",
+    "/api/v1/cancel": "cancel",
+}
+
+BUCKET_KEY = "eshipz_throttle_bucket:"
+LEASES_KEY = "eshipz_throttle_leases:"
+LIMIT_KEY = "eshipz_throttle_limit:"
+BACKOFF_KEY = "eshipz_throttle_backoff:"
+ACCOUNT_LEASES_KEY = "eshipz_throttle_account_leases:"
+
+# A lease outlives the longest call (connect + read timeout)
+LEASE_TTL = 70 * 1000
+# Concurrency is halved at most once per window, not once per failed call
+# of the same burst
+DECREASE_WINDOW = 1000
+# Poll interval while every concurrency slot is taken
+SLOT_POLL = 50
+MAX_WAIT = 60
+
+DEFAULT_MAX_CONCURRENCY = 20
+DEFAULT_TARGET_LATENCY = 2000
+
+RESERVE_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = now_parts[1] * 1000 + math.floor(now_parts[2] / 1000)
+local rate = tonumber(ARGV[1])
+local adaptive = ARGV[3] == '1'
+-- -1: no account, 0: account without a budget
+local budget = tonumber(ARGV[7])
+
+if budget > 0 then
+    redis.call('ZREMRANGEBYSCORE', KEYS[4], '-inf', now)
+    if redis.call('ZCARD', KEYS[4]) >= budget then
+        return tonumber(ARGV[6])
+    end
+end
+
+if adaptive then
+    redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now)
+    local limit = tonumber(redis.call('GET', KEYS[3]) or ARGV[4])
+    if redis.call('ZCARD', KEYS[2]) >= math.max(1, math.floor(limit)) then
+        return tonumber(ARGV[6])
+    end
+end
+
+if rate > 0 then
+    local burst = math.max(1, rate)
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or burst
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(burst, tokens + (now - ts) * rate / 1000)
+
+    local wait = 0
+    if tokens < 1 then
+        wait = math.ceil((1 - tokens) * 1000 / rate)
+    else
+        tokens = tokens - 1
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+    redis.call('PEXPIRE', KEYS[1], math.ceil(burst * 1000 / rate) + 1000)
+    if wait > 0 then
+        return wait
+    end
+end
+
+if adaptive then
+    redis.call('ZADD', KEYS[2], now + tonumber(ARGV[5]), ARGV[2])
+    redis.call('PEXPIRE', KEYS[2], ARGV[5])
+end
+if budget >= 0 then
+    redis.call('ZADD', KEYS[4], now + tonumber(ARGV[5]), ARGV[2])
+    redis.call('PEXPIRE', KEYS[4], ARGV[5])
+end
+return 0
+"""
+
+RELEASE_SCRIPT = """
+redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('ZREM', KEYS[4], ARGV[1])
+local max = tonumber(ARGV[3])
+local limit = math.min(max, tonumber(redis.call('GET', KEYS[2]) or ARGV[3]))
+
+if ARGV[2] == 'throttled' then
+    if redis.call('SET', KEYS[3], 1, 'PX', ARGV[4], 'NX') then
+        limit = math.max(1, limit / 2)
+    end
+elseif ARGV[2] == 'healthy' then
+    limit = math.min(max, limit + 1 / limit)
+end
+
+redis.call('SET', KEYS[2], tostring(limit))
+return tostring(limit)
+"""
+
+_scripts = {}
+
+
+def get_family(path):
+    return FAMILIES.get(path, "other")
+
+
+def get_config(family, account=None):
+    settings = frappe.get_cached_doc("eShipz Settings")
+    account_settings = accounts.get_account(account) if account else None
+    return frappe._dict(
+        rate=flt(settings.get(f"rate_limit_{family}")),
+        adaptive=cint(settings.enable_adaptive_concurrency),
+        max_concurrency=cint(settings.max_concurrency) or DEFAULT_MAX_CONCURRENCY,
+        target_latency=cint(settings.target_latency) or DEFAULT_TARGET_LATENCY,
+        budget=account_settings["max_concurrency"] if account_settings else -1,
+    )
+
+
+def get_scope(family, account=None):
+    """Redis key suffix of the limits of `family` calls, per account."""
+    return f"{family}:{account}" if account else family
+
+
+def get_script(name, source):
+    if name not in _scripts:
+        _scripts[name] = frappe.cache().register_script(source)
+    return _scripts[name]
+
+
+def reserve(family, config, account=None):
+    """Take a token and a concurrency slot for one call to `family`.
+
+    Returns (lease, 0) when granted, or (None, ms to wait) when not.
+    """
+    lease = uuid.uuid4().hex
+    scope = get_scope(family, account)
+    cache = frappe.cache()
+    wait = get_script("reserve", RESERVE_SCRIPT)(
+        keys=[
+            cache.make_key(BUCKET_KEY + scope),
+            cache.make_key(LEASES_KEY + scope),
+            cache.make_key(LIMIT_KEY + scope),
+            cache.make_key(ACCOUNT_LEASES_KEY + (account or "")),
+        ],
+        args=[config.rate, lease, int(config.adaptive), config.max_concurrency, LEASE_TTL, SLOT_POLL, config.budget],
+        client=cache,
+    )
+    return (lease, 0) if not wait else (None, int(wait))
+
+
+def acquire(family, account=None):
+    """Block until a call to `family` may be sent through `account`;
+    returns its lease."""
+    config = get_config(family, account)
+    if not config.rate and not config.adaptive and config.budget < 0:
+        return None
+
+    deadline = time.monotonic() + MAX_WAIT
+    while True:
+        try:
+            lease, wait = reserve(family, config, account)
+        except Exception:
+            return None
+        if lease:
+            return lease
+        check_deadline(deadline, wait)
+        time.sleep(wait / 1000)
+
+
+def check_deadline(deadline, wait):
+    # client paces its calls through this module
+    from eshipz.client import eShipzRateLimitError
+
+    if time.monotonic() + wait / 1000 > deadline:
+        frappe.throw(
+            "Too many eShipz requests are queued, please try again shortly",
+            title="eShipz Rate Limit",
+            exc=eShipzRateLimitError,
+        )
+
+
+def release(family, lease, status_code, duration, account=None):
+    """Free the lease of a finished call and adapt the concurrency limit
+    to how eShipz answered (`status_code` 0 for timeouts)."""
+    if not lease:
+        return
+
+    config = get_config(family, account)
+    scope = get_scope(family, account)
+    if status_code == 429 or status_code == 0 or status_code >= 500:
+        outcome = "throttled"
+    elif duration * 1000 <= config.target_latency:
+        outcome = "healthy"
+    else:
+        outcome = "slow"
+
+    cache = frappe.cache()
+    try:
+        get_script("release", RELEASE_SCRIPT)(
+            keys=[
+                cache.make_key(LEASES_KEY + scope),
+                cache.make_key(LIMIT_KEY + scope),
+                cache.make_key(BACKOFF_KEY + scope),
+                cache.make_key(ACCOUNT_LEASES_KEY + (account or "")),
+            ],
+            args=[lease, outcome, config.max_concurrency, DECREASE_WINDOW],
+            client=cache,
+        )
+    except Exception:
+        pass
+
+
+def get_state():
+    """Current concurrency limit and calls in flight per endpoint family."""
+    cache = frappe.cache()
+    families = sorted(set(FAMILIES.values()))
+    now = time.time() * 1000
+
+    pipe = cache.pipeline()
+    for family in families:
+        pipe.get(cache.make_key(LIMIT_KEY + family))
+        pipe.zcount(cache.make_key(LEASES_KEY + family), now, "+inf")
+    values = pipe.execute()
+
+    state = []
+    for i, family in enumerate(families):
+        config = get_config(family)
+        limit, in_flight = values[2 * i], values[2 * i + 1]
+        state.append(
+            {
+                "family": family,
+                "rate_limit": config.rate,
+                "concurrency_limit": flt(limit) if limit else (config.max_concurrency if config.adaptive else None),
+                "in_flight": in_flight,
+            }
+        )
+    return state
+
+
+def get_account_load(account_names):
+    """Calls in flight through each of `account_names`."""
+    cache = frappe.cache()
+    now = time.time() * 1000
+    try:
+        pipe = cache.pipeline()
+        for account_name in account_names:
+            pipe.zcount(cache.make_key(ACCOUNT_LEASES_KEY + account_name), now, "+inf")
+        return dict(zip(account_names, pipe.execute()))
+    except Exception:
+        return {}
+
+
+def get_account_state():
+    """Calls in flight and budget per eShipz account."""
+    account_list = accounts.get_accounts()
+    load = get_account_load([account["account_name"] for account in account_list])
+    return [
+        {
+            "account": account["account_name"],
+            "max_concurrency": account["max_concurrency"] or None,
+            "in_flight": load.get(account["account_name"], 0),
+        }
+        for account in account_list
+    ]